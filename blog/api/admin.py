@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from .models import Profile, Post, UserPostRelation
+from .models import Profile, Post, UserPostRelation, FeedEntry, SeenSet
 
 admin.site.register(Profile)
 admin.site.register(Post)
 admin.site.register(UserPostRelation)
+admin.site.register(FeedEntry)
+admin.site.register(SeenSet)
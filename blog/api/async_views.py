@@ -0,0 +1,153 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.http import Http404
+from rest_framework.response import Response
+
+from .cache import aget_feed_page, aset_feed_page, feed_page_key
+from .fast_serializers import values_queryset
+from .models import Post
+from .paginators import KeysetPagination
+from .renderers import NDJSONRenderer
+from .streaming import AsyncStreamingHttpResponse
+from .views import ConditionalGetMixin, FeedView, UserListView, UserPostsListView
+
+
+class AsyncAPIViewMixin:
+    """
+        Serves DRF list view as native async view (ASYNC_VIEWS setting, on by default under ASGI).
+        Negotiation, authentication and permissions may touch the database, they take
+        one sync_to_async hop. ETag is checked before the queryset is built, page rows
+        are read with async ORM and the response is built the same way as by the sync view.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def get(self, request, *args, **kwargs):
+        etag = await self.aget_etag(request)
+        if etag is None:
+            return await self.alist(request, await self.aget_queryset())
+        # 304 is answered without building the queryset
+        not_modified = self.get_not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return self.set_etag(await self.alist(request, await self.aget_queryset()), etag)
+
+    async def aget_etag(self, request):
+        if isinstance(self, ConditionalGetMixin) and settings.CONDITIONAL_GET:
+            return await sync_to_async(self.get_etag)(request)
+        return None
+
+    async def aget_queryset(self):
+        return self.get_queryset()
+
+    async def apaginate_queryset(self, queryset):
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+
+    async def alist(self, request, queryset):
+        page = await self.apaginate_queryset(self.filter_queryset(queryset))
+        # serializer fields may follow relations
+        data = await sync_to_async(lambda: self.get_serializer(page, many=True).data)()
+        return self.get_paginated_response(data)
+
+
+class AsyncFastPostListMixin:
+    """
+        FastPostListMixin.list for async views
+    """
+
+    async def alist(self, request, queryset):
+        queryset = self.filter_queryset(queryset)
+        if not settings.FAST_POST_SERIALIZER:
+            page = await self.apaginate_queryset(queryset)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        serializer = self.get_fast_serializer()
+        page = await self.apaginate_queryset(values_queryset(queryset, serializer.lookups))
+        return self.get_paginated_response(serializer.serialize_many(page))
+
+
+class AsyncFeedView(AsyncFastPostListMixin, AsyncAPIViewMixin, FeedView):
+    __doc__ = FeedView.__doc__
+
+    async def aget_queryset(self):
+        # subscriptions lookup and seen state may be read from cache or database
+        return await sync_to_async(self.get_queryset)()
+
+    async def alist(self, request, queryset):
+        if not settings.FEED_CACHE_ENABLED:
+            return await super().alist(request, queryset)
+
+        key = await sync_to_async(feed_page_key)(request)
+        data = await aget_feed_page(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Feed-Cache'] = 'hit'
+            return response
+
+        response = await super().alist(request, queryset)
+        await aset_feed_page(key, response.data)
+        response['X-Feed-Cache'] = 'miss'
+        return response
+
+
+class AsyncUserListView(AsyncAPIViewMixin, UserListView):
+    __doc__ = UserListView.__doc__
+
+    async def alist(self, request, queryset):
+        page = await self.apaginate_queryset(self.filter_queryset(queryset))
+        preview = await sync_to_async(self.get_subscriptions_preview)(page)
+        return self.get_page_response(page, preview)
+
+
+class AsyncUserPostsListView(AsyncFastPostListMixin, AsyncAPIViewMixin, UserPostsListView):
+    __doc__ = UserPostsListView.__doc__
+
+    def get_queryset(self):
+        # filtered by username, the author lookup runs concurrently with the page query
+        return Post.objects.filter(owner__username=self.kwargs['username'])
+
+    async def alist(self, request, queryset):
+        author_exists = User.objects.filter(username=self.kwargs['username']).aexists()
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            if not await author_exists:
+                raise Http404
+            # rows are fetched chunk by chunk while the response is sent (api.streaming.ASGIHandler)
+            return AsyncStreamingHttpResponse(self.arender_rows(queryset), content_type=NDJSONRenderer.media_type)
+
+        exists, response = await asyncio.gather(author_exists, super().alist(request, queryset))
+        if not exists:
+            raise Http404
+        return response
+
+    async def arender_rows(self, queryset):
+        queryset = queryset.order_by(*KeysetPagination.ordering)
+        if settings.FAST_POST_SERIALIZER:
+            serializer = self.get_fast_serializer()
+            queryset = queryset.values(*serializer.lookups)
+        else:
+            serializer = self.get_serializer()
+        async for post in queryset.aiterator(chunk_size=settings.STREAM_CHUNK_SIZE):
+            yield NDJSONRenderer.render_row(serializer.to_representation(post))
@@ -0,0 +1,72 @@
+import gc
+import statistics
+import time
+import tracemalloc
+
+from django.db import reset_queries, transaction
+
+_suites = {}
+
+
+def register(name):
+    """
+        Registers benchmark suite: function taking Bench. Suites live in `benchmarks`
+        modules of installed apps and are run by `manage.py benchmark`.
+    """
+    def decorator(func):
+        _suites[name] = func
+        return func
+    return decorator
+
+
+def get_suites():
+    return dict(_suites)
+
+
+class Bench:
+    """
+        Measuring helpers passed to suites. Every suite runs in a transaction
+        which is rolled back, so synthetic data never stays in the database.
+    """
+
+    def __init__(self, stdout, repeat=20, size=1000):
+        self.stdout = stdout
+        self.repeat = repeat
+        self.size = size
+
+    def report(self, label, value):
+        self.stdout.write(f'  {label}: {value}')
+
+    def timeit(self, label, func, repeat=None):
+        """
+            Runs func `repeat` times, reports median and worst time in milliseconds
+        """
+        timings = []
+        for _ in range(repeat or self.repeat):
+            reset_queries()
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        self.report(label, f'median {statistics.median(timings):.3f} ms, max {max(timings):.3f} ms')
+        return statistics.median(timings)
+
+    def memory(self, label, func):
+        """
+            Reports peak python memory allocated while func runs
+        """
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.report(label, f'peak {peak / 1024:.1f} KiB')
+        return peak
+
+
+def run_suite(name, bench):
+    bench.stdout.write(f'{name}:')
+    with transaction.atomic():
+        _suites[name](bench)
+        transaction.set_rollback(True)
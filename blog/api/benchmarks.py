@@ -0,0 +1,201 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Value
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .benchmarking import register
+from .fast_serializers import ValuesSerializer
+from .feed import pull_feed_queryset
+from .models import Post, Profile, SeenSet, UserPostRelation
+from .renderers import FastJSONRenderer
+from .seen import CompactSeenStorage, get_seen_storage
+from .serializers import PostCreateSerializer, PostDetailSerializer, UserPostSerializer
+from .views import BulkSubscribeView, FeedView, SubscribeView, UserListView
+
+
+def create_author_with_posts(username, count):
+    author = User.objects.create(username=username)
+    Post.objects.bulk_create(
+        (Post(title=f'post {i}', body='benchmark', owner=author) for i in range(count)),
+        batch_size=1000,
+    )
+    return author
+
+
+@register('seen_storage')
+def seen_storage(bench):
+    """
+        Row per relation vs compact SeenSet: storage size, memory to load state,
+        feed page with seen filter and marking latency
+    """
+    author = create_author_with_posts('bench_author', bench.size)
+    post_ids = list(Post.objects.filter(owner=author).order_by('id').values_list('id', flat=True))
+    # reader went through 90% of the feed, skipping every 10th post
+    seen_ids = [post_id for index, post_id in enumerate(post_ids) if index % 10]
+
+    for storage_name in ('rows', 'compact'):
+        reader = User.objects.create(username=f'bench_reader_{storage_name}')
+        reader.profile.subscriptions.add(author)
+
+        with override_settings(SEEN_STORAGE=storage_name):
+            storage = get_seen_storage()
+            bench.stdout.write(f' {storage_name}:')
+            storage.write(reader.id, seen_ids, True)
+
+            if storage_name == 'rows':
+                bench.report('stored rows', UserPostRelation.objects.filter(user=reader).count())
+                bench.memory('load seen state', lambda: set(
+                    UserPostRelation.objects.filter(user=reader).values_list('post_id', flat=True)
+                ))
+            else:
+                seen_set = SeenSet.objects.get(user=reader)
+                bench.report('stored rows', 1)
+                bench.report('stored bytes', len(seen_set.authors) + len(seen_set.seen_ids) + len(seen_set.unseen_ids))
+                bench.memory('load seen state', lambda: CompactSeenStorage().load(reader.id))
+
+            bench.timeit('feed page, seen=false', lambda: list(
+                pull_feed_queryset(reader.id).filter(seen=False)[:10]
+            ))
+            bench.timeit('feed page, seen=true', lambda: list(
+                pull_feed_queryset(reader.id).filter(seen=True)[:10]
+            ))
+            bench.timeit('toggle one post', lambda: storage.toggle(reader.id, post_ids[-1]))
+
+
+# 'localhost' passes ALLOWED_HOSTS check in DEBUG mode
+request_factory = APIRequestFactory(SERVER_NAME='localhost')
+
+
+def render_view(view, request, **kwargs):
+    response = view(request, **kwargs)
+    response.render()
+    return response
+
+
+@register('user_list')
+def user_list(bench):
+    """
+        Profiles list page as users accumulate posts and follows:
+        query count, time and memory should stay flat
+    """
+    users = User.objects.bulk_create(User(username=f'bench_user_{i}') for i in range(100))
+    Profile.objects.bulk_create(Profile(user=user) for user in users)
+    profiles = list(Profile.objects.filter(user__in=users))
+    through = Profile.subscriptions.through
+
+    view = UserListView.as_view()
+    request = request_factory.get('/api/profiles_list/', {'ordering': '-posts_count'})
+
+    activity = 0
+    for target in (1, bench.size // 100 or 1, bench.size // 10 or 1):
+        posts, follows = [], []
+        for index, user in enumerate(users):
+            posts += [Post(title='post', body='benchmark', owner=user) for _ in range(target - activity)]
+            follows += [through(profile_id=profiles[index].id, user_id=users[(index + shift) % len(users)].id)
+                        for shift in range(activity + 1, min(target, len(users) - 1) + 1)]
+        Post.objects.bulk_create(posts, batch_size=1000)
+        through.objects.bulk_create(follows, batch_size=1000, ignore_conflicts=True)
+        activity = target
+
+        bench.stdout.write(f' {target} posts and up to {min(target, len(users) - 1)} follows per user:')
+        with CaptureQueriesContext(connection) as context:
+            render_view(view, request)
+        bench.report('queries', len(context.captured_queries))
+        bench.timeit('page', lambda: render_view(view, request))
+        bench.memory('page', lambda: render_view(view, request))
+
+
+@register('post_serializers')
+def post_serializers(bench):
+    """
+        Per-row cost of DRF ModelSerializer vs precompiled ValuesSerializer
+        for feed, user posts and create responses
+    """
+    author = create_author_with_posts('bench_author', bench.size)
+    context = {'request': request_factory.get('/api/feed/')}
+    posts = Post.objects.filter(owner=author).annotate(seen=Value(False)).order_by('-created', '-id')
+    cases = (
+        ('feed', PostDetailSerializer),
+        ('user posts', UserPostSerializer),
+        ('create', PostCreateSerializer),
+    )
+
+    for label, serializer_class in cases:
+        bench.stdout.write(f' {label} ({serializer_class.__name__}), {bench.size} rows:')
+        instances = list(posts.select_related('owner'))
+        drf = bench.timeit('drf serializer', lambda: serializer_class(instances, many=True, context=context).data)
+
+        serializer = ValuesSerializer(serializer_class, context=context)
+        rows = list(posts.values(*serializer.lookups))
+        fast = bench.timeit('values serializer', lambda: serializer.serialize_many(rows))
+
+        bench.report('per row', f'{drf * 1000 / bench.size:.2f} us -> {fast * 1000 / bench.size:.2f} us '
+                                f'({drf / fast:.1f}x)')
+
+
+@register('json_render')
+def json_render(bench):
+    """
+        stdlib JSONRenderer vs orjson FastJSONRenderer on real feed payloads:
+        one feed page and all posts of the feed at once
+    """
+    author = create_author_with_posts('bench_author', bench.size)
+    reader = User.objects.create(username='bench_reader')
+    reader.profile.subscriptions.add(author)
+
+    request = request_factory.get('/api/feed/')
+    force_authenticate(request, user=reader)
+    page = FeedView.as_view()(request).data
+
+    posts = PostDetailSerializer(
+        pull_feed_queryset(reader.id), many=True, context={'request': request_factory.get('/api/feed/')}
+    ).data
+    stdlib, fast = JSONRenderer(), FastJSONRenderer()
+    assert stdlib.render(page) == fast.render(page)
+
+    for label, data in (('feed page', page), (f'{len(posts)} feed posts', posts)):
+        bench.stdout.write(f' {label}:')
+        slow_time = bench.timeit('JSONRenderer', lambda: stdlib.render(data))
+        fast_time = bench.timeit('FastJSONRenderer', lambda: fast.render(data))
+        bench.report('speedup', f'{slow_time / fast_time:.1f}x')
+
+
+@register('bulk_subscribe')
+def bulk_subscribe(bench):
+    """
+        Following many authors: looping single subscribe endpoint vs one bulk request.
+        Every run starts from no subscriptions (one DELETE, same for both)
+    """
+    count = min(bench.size, 1000)
+    users = User.objects.bulk_create(User(username=f'bench_author_{i}') for i in range(count))
+    Profile.objects.bulk_create(Profile(user=user) for user in users)
+    usernames = [user.username for user in users]
+    reader = User.objects.create(username='bench_reader')
+    edges = Profile.subscriptions.through.objects.filter(profile__user=reader)
+
+    single_view, bulk_view = SubscribeView.as_view(), BulkSubscribeView.as_view()
+
+    def subscribe_one_by_one():
+        edges.delete()
+        for username in usernames:
+            request = request_factory.put(f'/api/{username}/subscribe/')
+            force_authenticate(request, user=reader)
+            single_view(request, username=username)
+
+    def subscribe_in_bulk():
+        edges.delete()
+        request = request_factory.post('/api/subscribe/', {'usernames': usernames}, format='json')
+        force_authenticate(request, user=reader)
+        with override_settings(SUBSCRIBE_BATCH_MAX_SIZE=count):
+            response = bulk_view(request)
+        assert len(response.data['added']) == count
+
+    bench.stdout.write(f' {count} authors:')
+    for label, func in (('single endpoint loop', subscribe_one_by_one), ('bulk endpoint', subscribe_in_bulk)):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        bench.report(f'{label} queries', len(context.captured_queries))
+        bench.timeit(label, func)
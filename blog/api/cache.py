@@ -0,0 +1,86 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import stats
+from .subscriptions import subscription_ids
+
+USER_VERSION_KEY = 'feed:v:user:{}'
+AUTHOR_VERSION_KEY = 'feed:v:author:{}'
+PAGE_KEY = 'feed:page:{}'
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        _init_version(key)
+
+
+def _init_version(key):
+    # Fresh counters start from current time, so a lost (evicted) counter
+    # never comes back with a value some old page was cached under
+    version = time.time_ns()
+    if not cache.add(key, version, timeout=None):
+        return cache.get(key, version)
+    return version
+
+
+def bump_user_version(user_id):
+    """
+        Invalidates all cached feed pages of the user (subscriptions or seen marks changed)
+    """
+    _bump(USER_VERSION_KEY.format(user_id))
+
+
+def bump_author_version(author_id):
+    """
+        Invalidates cached feed pages of all author's subscribers (author published a post)
+    """
+    _bump(AUTHOR_VERSION_KEY.format(author_id))
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = _init_version(key)
+    return [versions[key] for key in keys]
+
+
+def feed_page_key(request):
+    """
+        Cache key of a feed page: user, query string (page/cursor, seen filter)
+        and current versions of the user and every followed author
+    """
+    user_id = request.user.id
+    author_ids = sorted(subscription_ids(user_id))
+    keys = [USER_VERSION_KEY.format(user_id)] + [AUTHOR_VERSION_KEY.format(author_id) for author_id in author_ids]
+    versions = get_versions(keys)
+
+    parts = [request.build_absolute_uri(), str(user_id)]
+    parts += [f'{key}={version}' for key, version in zip(keys, versions)]
+    raw = '|'.join(parts)
+    return PAGE_KEY.format(hashlib.md5(raw.encode()).hexdigest())
+
+
+def get_feed_page(key):
+    data = cache.get(key)
+    stats.incr('feed_cache.hit' if data is not None else 'feed_cache.miss')
+    return data
+
+
+def set_feed_page(key, data):
+    cache.set(key, data, timeout=settings.FEED_CACHE_TIMEOUT)
+
+
+async def aget_feed_page(key):
+    data = await cache.aget(key)
+    await stats.aincr('feed_cache.hit' if data is not None else 'feed_cache.miss')
+    return data
+
+
+async def aset_feed_page(key, data):
+    await cache.aset(key, data, timeout=settings.FEED_CACHE_TIMEOUT)
@@ -0,0 +1,50 @@
+import hashlib
+
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import quote_etag
+
+from .cache import USER_VERSION_KEY, get_versions
+from .models import Post, Profile
+from .subscriptions import subscribed_authors
+
+
+def author_states(profiles):
+    """
+        (author id, posts count, newest post time) of every profile: one query,
+        newest post is a single probe of (owner, -created, -id) index per author.
+        Any published or deleted post changes the state of its author.
+    """
+    newest = Post.objects.filter(owner_id=OuterRef('user_id')).order_by('-created', '-id').values('created')[:1]
+    return list(profiles.annotate(newest=Subquery(newest)).order_by('user_id').values_list(
+        'user_id', 'posts_count', 'newest'
+    ))
+
+
+def make_etag(request, *parts):
+    """
+        Strong ETag over the response variant (URL with query and negotiated media type) and state parts
+    """
+    raw = '|'.join(map(str, [request.build_absolute_uri(), request.accepted_media_type, *parts]))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def feed_etag(request):
+    """
+        Feed validator: states of followed authors plus user's version
+        (bumped by subscriptions and seen marks, see api.cache)
+    """
+    user_id = request.user.id
+    authors = author_states(Profile.objects.filter(user_id__in=subscribed_authors(user_id)))
+    version, = get_versions([USER_VERSION_KEY.format(user_id)])
+    return make_etag(request, user_id, version, *authors)
+
+
+def user_posts_etag(request, username):
+    """
+        User posts validator: state of the author, None for unknown username (view answers 404)
+    """
+    authors = author_states(Profile.objects.filter(user__username=username))
+    if not authors:
+        return None
+    return make_etag(request, *authors)
+
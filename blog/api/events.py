@@ -0,0 +1,174 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+
+AUTHOR_CHANNEL = 'author:{}'
+# put in place of dropped backlog, client refetches the feed
+RESET = {'event': 'reset'}
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_event_hub():
+    """
+        Process wide hub of feed event streams
+    """
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            # first stream (event loop) and first publish (on_commit in a worker thread) may race,
+            # connections registered on a lost hub never get events
+            if _hub is None:
+                backend_class = import_string(settings.FEED_EVENTS_BACKEND)
+                _hub = EventHub(
+                    backend_class(),
+                    queue_size=settings.FEED_EVENTS_QUEUE_SIZE,
+                    max_connections=settings.FEED_EVENTS_MAX_CONNECTIONS,
+                )
+    return _hub
+
+
+class LocalEventBackend:
+    """
+        Delivers messages inside the publishing process only: tests and single process
+        ASGI deployments. Backend between processes (e.g. Redis pub/sub) implements the same
+        methods, `subscribe`/`unsubscribe` tell it which channels this process listens to.
+    """
+
+    def __init__(self):
+        self.deliver = None
+
+    def start(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, channel, message):
+        if self.deliver is not None:
+            self.deliver(channel, message)
+
+    def subscribe(self, channel):
+        pass
+
+    def unsubscribe(self, channel):
+        pass
+
+
+class Connection:
+    """
+        One event stream: bounded queue living in the event loop of the connection.
+        Publisher never waits for a slow client - when the queue is full its backlog is dropped
+        and replaced by RESET, the client reloads the feed and continues with new events.
+    """
+
+    def __init__(self, loop, queue_size):
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size)
+        self.author_ids = frozenset()
+
+    def put_threadsafe(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self.put, message)
+        except RuntimeError:
+            # event loop is closed, connection is gone
+            pass
+
+    def put(self, message):
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = RESET
+        self.queue.put_nowait(message)
+
+
+class EventHub:
+    """
+        In-process pub/sub keyed by author: publishers send post events to the author's channel,
+        the hub fans them out to queues of local connections following the author.
+    """
+
+    def __init__(self, backend, queue_size=100, max_connections=10000):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.max_connections = max_connections
+
+        self._lock = threading.Lock()
+        # author id -> connections following the author
+        self._followers = {}
+        self._connections = 0
+        backend.start(self.deliver)
+
+    def connect(self, author_ids):
+        """
+            New connection for the running event loop, None when the process is at max_connections
+        """
+        with self._lock:
+            if self._connections >= self.max_connections:
+                return None
+            self._connections += 1
+        connection = Connection(asyncio.get_running_loop(), self.queue_size)
+        self.update(connection, author_ids)
+        return connection
+
+    def update(self, connection, author_ids):
+        """
+            Changes authors the connection follows (subscriptions changed)
+        """
+        author_ids = frozenset(author_ids)
+        with self._lock:
+            for author_id in author_ids - connection.author_ids:
+                followers = self._followers.setdefault(author_id, set())
+                if not followers:
+                    self.backend.subscribe(AUTHOR_CHANNEL.format(author_id))
+                followers.add(connection)
+            for author_id in connection.author_ids - author_ids:
+                self._remove_follower(author_id, connection)
+            connection.author_ids = author_ids
+
+    def disconnect(self, connection):
+        with self._lock:
+            for author_id in connection.author_ids:
+                self._remove_follower(author_id, connection)
+            connection.author_ids = frozenset()
+            self._connections -= 1
+
+    def _remove_follower(self, author_id, connection):
+        followers = self._followers.get(author_id, set())
+        followers.discard(connection)
+        if not followers:
+            self._followers.pop(author_id, None)
+            self.backend.unsubscribe(AUTHOR_CHANNEL.format(author_id))
+
+    def publish(self, author_id, message):
+        self.backend.publish(AUTHOR_CHANNEL.format(author_id), message)
+
+    def deliver(self, channel, message):
+        """
+            Called by backend for every message on a subscribed channel, from any thread
+        """
+        author_id = int(channel.split(':', 1)[1])
+        with self._lock:
+            followers = list(self._followers.get(author_id, ()))
+        for connection in followers:
+            connection.put_threadsafe(message)
+
+    def __len__(self):
+        return self._connections
+
+
+def post_summary(post):
+    return {
+        'id': post.id,
+        'title': post.title,
+        'owner': post.owner.username,
+        'created': serializers.DateTimeField().to_representation(post.created),
+    }
+
+
+def publish_post(post):
+    """
+        Pushes summary of the new post to streams of the author's followers
+    """
+    get_event_hub().publish(post.owner_id, {'event': 'post', 'data': post_summary(post)})
@@ -0,0 +1,100 @@
+from rest_framework import serializers
+from rest_framework.fields import ISO_8601
+from rest_framework.settings import api_settings
+
+from .paginators import KeysetPagination
+
+
+class RowProxy:
+    """
+        Attribute access to `.values()` row for serializer methods (get_<field>(obj))
+    """
+    __slots__ = ('_row',)
+
+    def __init__(self, row):
+        self._row = row
+
+    def __getattr__(self, name):
+        try:
+            return self._row[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class ValuesSerializer:
+    """
+        Precompiled read-only serializer for `.values()` rows.
+        Declaration of the DRF serializer is read once: every field becomes
+        (output name, values() lookup, converter). Rows are turned into dicts
+        directly, skipping model instantiation and per-row field binding.
+        Output is the same as DRF serializer gives for model instances.
+    """
+
+    def __init__(self, serializer_class, context=None, **kwargs):
+        self.serializer = serializer_class(context=context or {}, **kwargs)
+        self.columns = [self.compile_field(name, field) for name, field in self.serializer.fields.items()]
+
+    @property
+    def lookups(self):
+        """
+            Arguments for queryset.values()
+        """
+        return [lookup for _, lookup, _ in self.columns if lookup is not None]
+
+    def compile_field(self, name, field):
+        if isinstance(field, serializers.SerializerMethodField):
+            method = getattr(self.serializer, field.method_name)
+            return name, None, lambda row: method(RowProxy(row))
+
+        lookup = field.source.replace('.', '__')
+        if isinstance(field, serializers.BooleanField):
+            return name, lookup, bool
+        if isinstance(field, serializers.IntegerField):
+            return name, lookup, int
+        if isinstance(field, serializers.DateTimeField):
+            return name, lookup, self.compile_datetime(field)
+        if isinstance(field, (serializers.CharField, serializers.ReadOnlyField, serializers.PrimaryKeyRelatedField)):
+            # PrimaryKeyRelatedField: values() already returns the primary key
+            return name, lookup, lambda value: value
+        return name, lookup, field.to_representation
+
+    @staticmethod
+    def compile_datetime(field):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+            return field.to_representation
+
+        def to_representation(value):
+            if isinstance(value, str) or value.tzinfo is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return to_representation
+
+    def to_representation(self, row):
+        ret = {}
+        for name, lookup, convert in self.columns:
+            if lookup is None:
+                ret[name] = convert(row)
+                continue
+            value = row[lookup]
+            ret[name] = None if value is None else convert(value)
+        return ret
+
+    def serialize_many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+def values_queryset(queryset, lookups):
+    """
+        queryset.values() with serializer lookups plus fields keyset pagination and
+        feed merging read from rows. Composite feeds (api.feed.MergedFeed) are converted part by part.
+    """
+    if hasattr(queryset, 'map'):
+        return queryset.map(lambda part: values_queryset(part, lookups))
+
+    ordering = [field.lstrip('-') for field in KeysetPagination.get_queryset_ordering(queryset)]
+    return queryset.values(*dict.fromkeys([*lookups, *ordering, 'created', 'id']))
@@ -0,0 +1,201 @@
+import asyncio
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import Post, Profile, FeedEntry
+from .paginators import KeysetPagination, fetch_async
+from .seen import seen_annotation
+from .subscriptions import subscribed_authors
+
+
+class MergedFeed:
+    """
+        Several post querysets, each ordered from newest to oldest, read as one feed.
+        Every part is fetched with its own limited query (and its own index),
+        then parts are k-way merged by (created, id).
+    """
+    ordered = True
+
+    @staticmethod
+    def merge_key(row):
+        get = KeysetPagination.get_row_value
+        return get(row, 'created'), get(row, 'id')
+
+    def __init__(self, parts):
+        self.parts = list(parts)
+
+    def map(self, func):
+        """
+            Applies queryset transformation (filters, annotations) to every part
+        """
+        return MergedFeed(func(part) for part in self.parts)
+
+    def merge(self, rows_lists, reverse=False):
+        return heapq.merge(*rows_lists, key=self.merge_key, reverse=not reverse)
+
+    def keyset_slice(self, position, reverse, limit):
+        rows_lists = [
+            KeysetPagination.slice_queryset(part, position, reverse, limit)
+            for part in self.parts
+        ]
+        return list(islice(self.merge(rows_lists, reverse), limit))
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.stop is None:
+            raise TypeError('MergedFeed supports only bounded slices')
+        rows_lists = [part[:item.stop] for part in self.parts]
+        return list(islice(self.merge(rows_lists), item.start, item.stop))
+
+    async def akeyset_slice(self, position, reverse, limit):
+        """
+            keyset_slice for async views, parts are queried concurrently
+        """
+        rows_lists = await asyncio.gather(*(
+            fetch_async(KeysetPagination.slice_queryset(part, position, reverse, limit))
+            for part in self.parts
+        ))
+        return list(islice(self.merge(rows_lists, reverse), limit))
+
+    async def aslice(self, start, stop):
+        rows_lists = await asyncio.gather(*(fetch_async(part[:stop]) for part in self.parts))
+        return list(islice(self.merge(rows_lists), start, stop))
+
+
+def annotate_seen(posts, user_id):
+    """
+        Adds `seen` flag of the given user to posts queryset
+    """
+    return posts.annotate(seen=seen_annotation(user_id))
+
+
+def pull_feed_queryset(user_id):
+    """
+        Feed computed at read time: posts of all authors user is subscribed on
+    """
+    posts = Post.objects.select_related('owner').filter(owner_id__in=subscribed_authors(user_id))
+    return annotate_seen(posts, user_id)
+
+
+def inbox_feed_queryset(user_id):
+    """
+        Feed read from precomputed inbox (fan-out-on-write mode).
+        Explicit ordering by inbox columns is picked up by keyset pagination,
+        so page is one range scan over (subscriber, created, post) index.
+    """
+    posts = Post.objects.select_related('owner'). \
+        filter(feed_entries__subscriber_id=user_id). \
+        annotate(feed_created=F('feed_entries__created'), feed_post=F('feed_entries__post_id')). \
+        order_by('-feed_created', '-feed_post')
+    return annotate_seen(posts, user_id)
+
+
+def celebrity_feed_queryset(user_id):
+    """
+        Posts of subscribed celebrity authors, they are never fanned out
+    """
+    posts = Post.objects.select_related('owner'). \
+        filter(owner_id__in=subscribed_authors(user_id), owner__profile__is_celebrity=True)
+    return annotate_seen(posts, user_id)
+
+
+def get_feed_queryset(user_id):
+    """
+        Pull mode: one queryset. Fan-out mode: hybrid feed - precomputed inbox
+        merged with posts of celebrity authors pulled at read time.
+    """
+    if settings.FEED_FANOUT_ON_WRITE:
+        return MergedFeed([inbox_feed_queryset(user_id), celebrity_feed_queryset(user_id)])
+    return pull_feed_queryset(user_id)
+
+
+def lock_author(user_id):
+    """
+        Whether the author is celebrity. Locks author's profile row till the end of transaction:
+        promote_celebrity waits for running fan-out and deletes its entries too,
+        fan-out started after promotion sees the flag
+    """
+    return bool(
+        Profile.objects.select_for_update().filter(user_id=user_id).
+        values_list('is_celebrity', flat=True).first()
+    )
+
+
+def _bulk_insert(entries):
+    FeedEntry.objects.bulk_create(entries, batch_size=settings.FEED_FANOUT_BATCH_SIZE, ignore_conflicts=True)
+
+
+def _push_to_subscribers(author_id, posts):
+    """
+        Inserts (post id, created) pairs into inboxes of all author's subscribers, batch by batch
+    """
+    subscriber_ids = Profile.objects.filter(subscriptions=author_id). \
+        values_list('user_id', flat=True). \
+        iterator(chunk_size=settings.FEED_FANOUT_BATCH_SIZE)
+
+    batch = []
+    for subscriber_id in subscriber_ids:
+        batch.extend(
+            FeedEntry(subscriber_id=subscriber_id, post_id=post_id, author_id=author_id, created=created)
+            for post_id, created in posts
+        )
+        if len(batch) >= settings.FEED_FANOUT_BATCH_SIZE:
+            _bulk_insert(batch)
+            batch = []
+    if batch:
+        _bulk_insert(batch)
+
+
+def fan_out_post(post):
+    """
+        Pushes new post into inboxes of all author's subscribers.
+        Celebrity posts stay in place and are pulled by readers.
+    """
+    with transaction.atomic():
+        if lock_author(post.owner_id):
+            return
+        _push_to_subscribers(post.owner_id, [(post.id, post.created)])
+
+
+def backfill_subscription(subscriber_id, author_id):
+    """
+        Copies recent posts of the author into subscriber's inbox after subscription
+    """
+    with transaction.atomic():
+        if lock_author(author_id):
+            return
+
+        recent_posts = Post.objects.filter(owner_id=author_id). \
+            values_list('id', 'created')[:settings.FEED_BACKFILL_SIZE]
+        _bulk_insert([
+            FeedEntry(subscriber_id=subscriber_id, post_id=post_id, author_id=author_id, created=created)
+            for post_id, created in recent_posts
+        ])
+
+
+def evict_subscription(subscriber_id, author_id):
+    """
+        Removes author's posts from subscriber's inbox after unsubscription
+    """
+    FeedEntry.objects.filter(subscriber_id=subscriber_id, author_id=author_id).delete()
+
+
+def promote_celebrity(author_id):
+    """
+        Author becomes celebrity: their posts are pulled now, drop them from inboxes
+    """
+    Profile.objects.filter(user_id=author_id).update(is_celebrity=True)
+    FeedEntry.objects.filter(author_id=author_id).delete()
+
+
+def demote_celebrity(author_id):
+    """
+        Author is ordinary again: push their recent posts into subscribers' inboxes
+    """
+    Profile.objects.filter(user_id=author_id).update(is_celebrity=False)
+    recent_posts = list(Post.objects.filter(owner_id=author_id).
+                        values_list('id', 'created')[:settings.FEED_BACKFILL_SIZE])
+    _push_to_subscribers(author_id, recent_posts)
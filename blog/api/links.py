@@ -0,0 +1,54 @@
+from urllib.parse import urlsplit, urlunsplit
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.reverse import reverse
+
+LINKS_QUERY_PARAM = 'links'
+ABSOLUTE, RELATIVE, NONE = 'absolute', 'relative', 'none'
+LINK_MODES = (ABSOLUTE, RELATIVE, NONE)
+
+
+def get_links_mode(request):
+    """
+        Hypermedia links mode requested by client: ?links=absolute|relative|none
+    """
+    mode = request.query_params.get(LINKS_QUERY_PARAM, ABSOLUTE) if request is not None else ABSOLUTE
+    if mode not in LINK_MODES:
+        raise ValidationError({LINKS_QUERY_PARAM: f"Select one of: {', '.join(LINK_MODES)}."})
+    return mode
+
+
+class LinkBuilder:
+    """
+        Builds links to a view with single pk argument.
+        URL pattern is resolved once with a sentinel pk and split into
+        prefix and suffix, every link after that is plain string concatenation.
+    """
+    SENTINEL = 9876543210123
+
+    def __init__(self, viewname, request=None, mode=ABSOLUTE):
+        self.viewname = viewname
+        self.request = request
+        self.mode = mode
+        self.template = None
+        if mode != NONE:
+            self.template = self.compile()
+
+    def resolve(self, pk):
+        url = reverse(self.viewname, args=[pk], request=self.request)
+        if self.mode == RELATIVE:
+            url = urlunsplit(('', '') + urlsplit(url)[2:])
+        return url
+
+    def compile(self):
+        parts = self.resolve(self.SENTINEL).split(str(self.SENTINEL))
+        # sentinel has to be found exactly once, otherwise resolve every link
+        return tuple(parts) if len(parts) == 2 else None
+
+    def build(self, pk):
+        if self.mode == NONE:
+            return None
+        if self.template is None:
+            return self.resolve(pk)
+        prefix, suffix = self.template
+        return f'{prefix}{pk}{suffix}'
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.feed import backfill_subscription
+from api.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Fills feed inboxes from existing subscriptions. Run before enabling FEED_FANOUT_ON_WRITE'
+
+    def handle(self, *args, **options):
+        subscriptions = Profile.subscriptions.through.objects. \
+            values_list('profile__user_id', 'user_id'). \
+            order_by('pk'). \
+            iterator()
+
+        total = 0
+        for subscriber_id, author_id in subscriptions:
+            backfill_subscription(subscriber_id, author_id)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {total} subscriptions'))
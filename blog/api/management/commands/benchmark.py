@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import autodiscover_modules
+
+from api.benchmarking import Bench, get_suites, run_suite
+
+
+class Command(BaseCommand):
+    help = 'Runs performance benchmark suites registered in `benchmarks` modules of installed apps. ' \
+           'Synthetic data is rolled back after every suite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help='Suites to run. Default: all')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per measurement')
+        parser.add_argument('--size', type=int, default=1000, help='Size of synthetic dataset')
+        parser.add_argument('--list', action='store_true', help='List available suites')
+
+    def handle(self, *args, suites=None, repeat=20, size=1000, list=False, **options):
+        autodiscover_modules('benchmarks')
+        available = get_suites()
+
+        if list:
+            for name in sorted(available):
+                self.stdout.write(name)
+            return
+
+        unknown = set(suites) - set(available)
+        if unknown:
+            raise CommandError(f'Unknown suites: {", ".join(sorted(unknown))}')
+
+        bench = Bench(self.stdout, repeat=repeat, size=size)
+        for name in suites or sorted(available):
+            run_suite(name, bench)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api import stats
+
+
+class Command(BaseCommand):
+    help = 'Prints shared cache counters (hits, misses, ...)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset counters after printing')
+
+    def handle(self, *args, reset=False, **options):
+        counters = stats.get_all()
+        for name, value in counters.items():
+            self.stdout.write(f'{name}: {value}')
+
+        hits, misses = counters['feed_cache.hit'], counters['feed_cache.miss']
+        if hits + misses:
+            self.stdout.write(f'feed_cache hit rate: {hits / (hits + misses):.2%}')
+
+        local_hits, shared_hits = counters['subscriptions.local_hit'], counters['subscriptions.shared_hit']
+        reads = local_hits + shared_hits + counters['subscriptions.miss']
+        if reads:
+            self.stdout.write(f'subscriptions local hit rate: {local_hits / reads:.2%}, '
+                              f'shared hit rate: {shared_hits / reads:.2%}')
+        if local_hits:
+            self.stdout.write(f'subscriptions stale reads: {counters["subscriptions.stale"]} '
+                              f'(of sampled local hits)')
+
+        if reset:
+            stats.reset()
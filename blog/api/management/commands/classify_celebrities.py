@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.feed import promote_celebrity, demote_celebrity
+from api.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Reclassifies authors as celebrities (pulled at read time) or ordinary (fanned out) ' \
+           'by their current subscribers count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, default=None,
+                            help='Subscribers count to become celebrity. Default: FEED_CELEBRITY_THRESHOLD')
+        parser.add_argument('--dry-run', action='store_true', help='Only report changes')
+
+    def handle(self, *args, threshold=None, dry_run=False, **options):
+        if threshold is None:
+            threshold = settings.FEED_CELEBRITY_THRESHOLD
+
+        # denormalized counter, indexed: no aggregation over all subscriptions
+        to_promote = Profile.objects.filter(is_celebrity=False, subscribers_count__gte=threshold)
+        to_demote = Profile.objects.filter(is_celebrity=True, subscribers_count__lt=threshold)
+        promote_ids = list(to_promote.values_list('user_id', flat=True))
+        demote_ids = list(to_demote.values_list('user_id', flat=True))
+
+        if not dry_run:
+            for author_id in promote_ids:
+                with transaction.atomic():
+                    promote_celebrity(author_id)
+            for author_id in demote_ids:
+                with transaction.atomic():
+                    demote_celebrity(author_id)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Promoted {len(promote_ids)}, demoted {len(demote_ids)} authors (threshold {threshold})'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import UserPostRelation
+from api.seen import CompactSeenStorage
+
+
+class Command(BaseCommand):
+    help = 'Converts UserPostRelation rows into compact per-user SeenSet rows. ' \
+           'Run before switching SEEN_STORAGE to "compact"'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Users per transaction')
+        parser.add_argument('--delete-rows', action='store_true',
+                            help='Delete converted UserPostRelation rows')
+
+    def handle(self, *args, batch_size=500, delete_rows=False, **options):
+        storage = CompactSeenStorage()
+        user_ids = list(UserPostRelation.objects.values_list('user_id', flat=True).distinct().order_by('user_id'))
+
+        converted = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            changes = {user_id: {} for user_id in batch}
+            relations = UserPostRelation.objects.filter(user_id__in=batch).values_list('user_id', 'post_id')
+            for user_id, post_id in relations.iterator():
+                changes[user_id][post_id] = True
+
+            with transaction.atomic():
+                storage.write_changes(changes)
+                if delete_rows:
+                    # rows of users spilled over SEEN_COMPACT_MAX_SEEN are their storage now
+                    UserPostRelation.objects.filter(user_id__in=batch). \
+                        exclude(user__seen_set__spilled=True).delete()
+            converted += len(batch)
+            self.stdout.write(f'Converted {converted}/{len(user_ids)} users')
+
+        self.stdout.write(self.style.SUCCESS(f'Converted {converted} users'))
@@ -0,0 +1,178 @@
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+
+from api.streaming import ASGIHandler
+from auth.serializers import MyTokenObtainPairSerializer
+
+# server configuration -> environment of the child process running it
+SERVERS = {
+    'wsgi': {'ASYNC_VIEWS': 'False'},
+    'asgi': {'ASYNC_VIEWS': 'False'},
+    'asgi-async': {'ASYNC_VIEWS': 'True'},
+}
+
+
+def split_requests(requests, concurrency):
+    return [requests // concurrency + (index < requests % concurrency) for index in range(concurrency)]
+
+
+def wsgi_environ(path, query, host, headers):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': host,
+        'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    environ.update({'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()})
+    return environ
+
+
+def asgi_scope(path, query, host, headers):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', host.encode())] + [(name.lower().encode(), value.encode())
+                                                 for name, value in headers.items()],
+        'client': ('127.0.0.1', 0), 'server': (host, 80),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Throughput of an endpoint at fixed concurrency: sync views under WSGI (thread per request), ' \
+           'sync views under ASGI and async views under ASGI. Applications are driven in process, ' \
+           'every configuration runs in its own process against the configured database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Path with query string, e.g. /api/feed/?pagination=cursor')
+        parser.add_argument('--user', help='Username to send JWT access token of')
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight')
+        parser.add_argument('--requests', type=int, default=1000, help='Measured requests per configuration')
+        parser.add_argument('--host', default='localhost', help='Host header, must be in ALLOWED_HOSTS')
+        parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+        parser.add_argument('--run', choices=list(SERVERS),
+                            help='Run one configuration in this process and print JSON results')
+
+    def handle(self, *args, url, user=None, concurrency=32, requests=1000, host='localhost', servers=None,
+               run=None, **options):
+        if run:
+            result = self.run_server(run, url, user, concurrency, requests, host)
+            self.stdout.write(json.dumps(result))
+            return
+
+        self.stdout.write(f'{url}: {requests} requests, concurrency {concurrency}')
+        for server in servers or list(SERVERS):
+            result = self.spawn(server, url, user, concurrency, requests, host)
+            self.stdout.write(
+                f"  {server}: {result['throughput']:.0f} req/s, latency p50 {result['p50']:.1f} ms, "
+                f"p99 {result['p99']:.1f} ms, statuses {result['statuses']}"
+            )
+
+    def spawn(self, server, url, user, concurrency, requests, host):
+        # sync only toolbar middleware would push every ASGI request to a thread
+        env = dict(os.environ, DEBUG_TOOLBAR='False', **SERVERS[server])
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'loadtest', url, '--run', server,
+                   '--concurrency', str(concurrency), '--requests', str(requests), '--host', host]
+        if user:
+            command += ['--user', user]
+        process = subprocess.run(command, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f'{server} run failed:\n{process.stderr}')
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    def run_server(self, server, url, user, concurrency, requests, host):
+        headers = {}
+        if user:
+            try:
+                token = MyTokenObtainPairSerializer.get_token(User.objects.get(username=user)).access_token
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user {user}')
+            headers['Authorization'] = f'Bearer {token}'
+        parts = urlsplit(url)
+        path, query = parts.path, parts.query
+
+        if server == 'wsgi':
+            runner = self.run_wsgi(get_wsgi_application(), path, query, host, headers)
+        else:
+            runner = self.run_asgi(ASGIHandler(), path, query, host, headers)
+        # warm up: connections, caches, lazily built state
+        runner(min(concurrency, requests), concurrency)
+        started = time.perf_counter()
+        results = runner(requests, concurrency)
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, _ in results)
+        statuses = {}
+        for _, status in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        return {
+            'throughput': len(results) / elapsed,
+            'p50': statistics.median(latencies) * 1000,
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            'statuses': statuses,
+        }
+
+    @staticmethod
+    def run_wsgi(application, path, query, host, headers):
+        def request():
+            statuses = []
+            started = time.perf_counter()
+            body = application(wsgi_environ(path, query, host, headers),
+                               lambda status, response_headers, exc_info=None: statuses.append(status))
+            try:
+                for _ in body:
+                    pass
+            finally:
+                body.close()
+            return time.perf_counter() - started, int(statuses[0].split()[0])
+
+        def worker(count):
+            return [request() for _ in range(count)]
+
+        def runner(requests, concurrency):
+            # thread per connection, like threaded WSGI server workers
+            with ThreadPoolExecutor(concurrency) as pool:
+                return [result for results in pool.map(worker, split_requests(requests, concurrency))
+                        for result in results]
+        return runner
+
+    @staticmethod
+    def run_asgi(application, path, query, host, headers):
+        scope = asgi_scope(path, query, host, headers)
+
+        async def request():
+            statuses = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            started = time.perf_counter()
+            await application(dict(scope), receive, send)
+            return time.perf_counter() - started, statuses[0]
+
+        async def worker(count):
+            return [await request() for _ in range(count)]
+
+        async def run(requests, concurrency):
+            results = await asyncio.gather(*(worker(count) for count in split_requests(requests, concurrency)))
+            return [result for worker_results in results for result in worker_results]
+
+        def runner(requests, concurrency):
+            return asyncio.run(run(requests, concurrency))
+        return runner
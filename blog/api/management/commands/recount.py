@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, F
+from django.db.models.functions import Coalesce
+
+from api.models import Post, Profile
+
+
+def count_subquery(queryset, field):
+    counts = queryset.values(field).annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = 'Repairs drift of denormalized Profile counters (posts, subscribers, subscriptions)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Profiles per batch')
+
+    def handle(self, *args, batch_size=1000, **options):
+        through = Profile.subscriptions.through
+        fields = ['posts_count', 'subscribers_count', 'subscriptions_count']
+
+        last_id = 0
+        checked = repaired = 0
+        while True:
+            batch = list(Profile.objects.filter(pk__gt=last_id).order_by('pk').
+                         values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1]
+
+            drifted = Profile.objects.filter(pk__in=batch).annotate(
+                actual_posts_count=count_subquery(
+                    Post.objects.filter(owner_id=OuterRef('user_id')), 'owner_id'),
+                actual_subscribers_count=count_subquery(
+                    through.objects.filter(user_id=OuterRef('user_id')), 'user_id'),
+                actual_subscriptions_count=count_subquery(
+                    through.objects.filter(profile_id=OuterRef('pk')), 'profile_id'),
+            ).filter(
+                ~Q(posts_count=F('actual_posts_count')) |
+                ~Q(subscribers_count=F('actual_subscribers_count')) |
+                ~Q(subscriptions_count=F('actual_subscriptions_count'))
+            )
+
+            with transaction.atomic():
+                profiles = list(drifted.select_for_update(of=('self',)))
+                for profile in profiles:
+                    for field in fields:
+                        setattr(profile, field, getattr(profile, f'actual_{field}'))
+                Profile.objects.bulk_update(profiles, fields)
+
+            checked += len(batch)
+            repaired += len(profiles)
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} profiles, repaired {repaired}'))
@@ -1,9 +1,90 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
 
+class ProfileManager(models.Manager):
+    def subscriptions_preview(self, profile_ids, limit):
+        """
+            First `limit` subscriptions usernames of every profile: {profile_id: [username, ...]}.
+            One query, ROW_NUMBER() keeps the result bounded however many users profile follows.
+        """
+        if not profile_ids:
+            return {}
+        qn = connection.ops.quote_name
+        through = qn(self.model.subscriptions.through._meta.db_table)
+        users = qn(User._meta.db_table)
+        placeholders = ', '.join(['%s'] * len(profile_ids))
+        sql = f"""
+            SELECT profile_id, username FROM (
+                SELECT s.profile_id AS profile_id, u.username AS username,
+                       ROW_NUMBER() OVER (PARTITION BY s.profile_id ORDER BY s.id) AS position
+                FROM {through} s JOIN {users} u ON u.id = s.user_id
+                WHERE s.profile_id IN ({placeholders})
+            ) ranked
+            WHERE position <= %s
+            ORDER BY profile_id, position
+        """
+        preview = {profile_id: [] for profile_id in profile_ids}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*profile_ids, limit])
+            for profile_id, username in cursor.fetchall():
+                preview[profile_id].append(username)
+        return preview
+
+    def create_users(self, users, batch_size=None):
+        """
+            Inserts new (unsaved) users together with their profiles in one transaction:
+            two bulk INSERTs per batch instead of INSERT + post_save per user.
+            post_save is not sent. Returns users with primary keys set.
+        """
+        with transaction.atomic():
+            users = User.objects.bulk_create(users, batch_size=batch_size)
+            self.bulk_create([self.model(user=user) for user in users], batch_size=batch_size)
+        return users
+
+    def follow(self, profile_id, author_id):
+        """
+            Adds subscription edge. Returns True if edge was created
+        """
+        return author_id in self.follow_many(profile_id, [author_id])
+
+    def follow_many(self, profile_id, author_ids):
+        """
+            Adds subscription edges with one INSERT .. ON CONFLICT DO NOTHING RETURNING,
+            so concurrent requests can't fail or duplicate them. Returns set of author ids
+            whose edges were really created.
+            Bypasses m2m_changed signal: caller updates counters.
+        """
+        if not author_ids:
+            return set()
+        qn = connection.ops.quote_name
+        through = self.model.subscriptions.through._meta
+        profile_column = qn(through.get_field('profile').column)
+        user_column = qn(through.get_field('user').column)
+        values = ', '.join(['(%s, %s)'] * len(author_ids))
+        sql = f"""
+            INSERT INTO {qn(through.db_table)} ({profile_column}, {user_column}) VALUES {values}
+            ON CONFLICT ({profile_column}, {user_column}) DO NOTHING
+            RETURNING {user_column}
+        """
+        params = [param for author_id in author_ids for param in (profile_id, author_id)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {author_id for author_id, in cursor.fetchall()}
+
+    def unfollow(self, profile_id, author_id):
+        """
+            Removes subscription edge with one DELETE. Returns True if edge existed.
+            Bypasses m2m_changed signal: caller updates counters.
+        """
+        deleted, _ = self.model.subscriptions.through.objects.filter(profile_id=profile_id, user_id=author_id).delete()
+        return deleted > 0
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     subscriptions = models.ManyToManyField(
@@ -12,16 +93,48 @@ class Profile(models.Model):
         symmetrical=False,
         blank=True,
     )
+    # authors with too many subscribers are not fanned out, their posts are pulled at read time
+    is_celebrity = models.BooleanField(default=False, db_index=True)
+    # denormalized counters, kept up to date by signals below (repair: `manage.py recount`)
+    posts_count = models.PositiveIntegerField(default=0, db_index=True)
+    subscribers_count = models.PositiveIntegerField(default=0, db_index=True)
+    subscriptions_count = models.PositiveIntegerField(default=0)
+
+    objects = ProfileManager()
 
     def __str__(self):
         return self.user.username
 
 
+def _shifted(field, delta):
+    # counters may drift (bulk operations skip signals), never push them below zero
+    return Greatest(F(field) + delta, 0)
+
+
+def change_posts_count(user_id, delta):
+    Profile.objects.filter(user_id=user_id).update(posts_count=_shifted('posts_count', delta))
+
+
+def change_subscription_counts(subscriber_id, author_ids, delta):
+    """
+        Subscriber (user id) subscribed on (delta=1) or unsubscribed from (delta=-1) authors
+    """
+    if not author_ids:
+        return
+    Profile.objects.filter(user_id=subscriber_id). \
+        update(subscriptions_count=_shifted('subscriptions_count', delta * len(author_ids)))
+    Profile.objects.filter(user_id__in=author_ids). \
+        update(subscribers_count=_shifted('subscribers_count', delta))
+
+
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance, )
-    instance.profile.save()
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    """
+        Profile for users created one by one outside registration (createsuperuser, admin, tests).
+        Later user saves (last_login, password change) don't touch the profile.
+    """
+    if created and not raw:
+        Profile.objects.create(user=instance)
 
 
 class Post(models.Model):
@@ -32,6 +145,9 @@ class Post(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['owner', '-created', '-id'], name='post_owner_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -41,3 +157,104 @@ class UserPostRelation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='post_relation')
     post = models.ForeignKey('Post', on_delete=models.CASCADE, related_name='user_relation')
     seen = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='unique_user_post_relation'),
+        ]
+
+
+class FeedEntry(models.Model):
+    """
+        Precomputed feed inbox row (fan-out-on-write mode).
+        `created` duplicates post creation time, so feed is read by one range scan
+        over (subscriber, created) index without sorting joined posts.
+    """
+    subscriber = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    post = models.ForeignKey('Post', on_delete=models.CASCADE, related_name='feed_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['subscriber', 'post'], name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['subscriber', '-created', '-post'], name='feed_entry_inbox_idx'),
+            models.Index(fields=['subscriber', 'author'], name='feed_entry_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subscriber_id} <- {self.post_id}'
+
+
+class SeenSet(models.Model):
+    """
+        Compact seen state of the user (SEEN_STORAGE = 'compact'), one row instead of
+        a row per seen post. Post of an author listed in `authors` with id <= `watermark`
+        is seen unless listed in `unseen_ids`, any other post is seen only if listed in `seen_ids`
+        (or has UserPostRelation row once `spilled`).
+        Id lists are sorted int64 arrays packed into bytes, see api.seen.CompactSeenStorage.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='seen_set')
+    watermark = models.BigIntegerField(default=0)
+    authors = models.BinaryField(default=b'')
+    seen_ids = models.BinaryField(default=b'')
+    unseen_ids = models.BinaryField(default=b'')
+    # size of `seen_ids` when compaction was skipped last time, 0 after successful one
+    skipped_at = models.PositiveIntegerField(default=0)
+    spilled = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'{self.user_id} <= {self.watermark}'
+
+
+@receiver(post_save, sender=Post)
+def increment_posts_count(sender, instance, created, **kwargs):
+    if created:
+        change_posts_count(instance.owner_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def decrement_posts_count(sender, instance, **kwargs):
+    change_posts_count(instance.owner_id, -1)
+
+
+@receiver(m2m_changed, sender=Profile.subscriptions.through)
+def update_subscription_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+        Keeps subscription counters in sync with Profile.subscriptions.
+        On add pk_set holds only really added ids, on remove it holds requested ids,
+        so they are narrowed to existing edges in pre_remove.
+    """
+    through = Profile.subscriptions.through
+    if reverse:
+        # user.subscribers.add(profile, ...): instance is the author, pk_set - subscriber profiles
+        edges = through.objects.filter(user_id=instance.pk)
+        if pk_set is not None:
+            edges = edges.filter(profile_id__in=pk_set)
+    else:
+        edges = through.objects.filter(profile_id=instance.pk)
+        if pk_set is not None:
+            edges = edges.filter(user_id__in=pk_set)
+
+    if action in ('pre_remove', 'pre_clear'):
+        instance._removed_subscription_edges = list(edges.values_list('profile__user_id', 'user_id'))
+        return
+    if action == 'post_add':
+        if reverse:
+            pairs = list(edges.values_list('profile__user_id', 'user_id'))
+        else:
+            pairs = [(instance.user_id, author_id) for author_id in pk_set]
+        delta = 1
+    elif action in ('post_remove', 'post_clear'):
+        pairs = instance.__dict__.pop('_removed_subscription_edges', [])
+        delta = -1
+    else:
+        return
+
+    by_subscriber = {}
+    for subscriber_id, author_id in pairs:
+        by_subscriber.setdefault(subscriber_id, []).append(author_id)
+    for subscriber_id, author_ids in by_subscriber.items():
+        change_subscription_counts(subscriber_id, author_ids, delta)
@@ -2,9 +2,20 @@ import sys
 from collections import OrderedDict
 from functools import cached_property
 
-from django.core.paginator import Paginator
-from rest_framework.pagination import PageNumberPagination
+from django.core import signing
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+async def fetch_async(queryset):
+    """
+        Выполняет queryset через async ORM, не блокируя event loop
+    """
+    return [row async for row in queryset.aiterator()]
 
 
 class CustomPaginatorClass(Paginator):
@@ -24,6 +35,34 @@ class CustomPageNumberPagination(PageNumberPagination):
     django_paginator_class = CustomPaginatorClass
     page_size = 10
 
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+            paginate_queryset для async views: строки страницы читаются через async ORM
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+
+        bottom = (number - 1) * page_size
+        if hasattr(queryset, 'aslice'):
+            rows = await queryset.aslice(bottom, bottom + page_size)
+        else:
+            rows = await fetch_async(queryset[bottom:bottom + page_size])
+        self.page = Page(rows, number, paginator)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
+
     def get_paginated_response(self, data):
         """
             Переопределяем, так как в count у нас теперь неправильное количество
@@ -36,3 +75,233 @@ class CustomPageNumberPagination(PageNumberPagination):
             ('previous', self.get_previous_link()),
             ('results', data)
         ]))
+
+
+class KeysetPagination(BasePagination):
+    """
+        Keyset (cursor) пагинация по (created, id). Вместо OFFSET страница выбирается
+        условием "строки после последней увиденной позиции", поэтому стоимость страницы
+        не зависит от ее глубины, а новые посты не сдвигают уже выданные страницы.
+        Курсор подписан, клиент не может подделать позицию.
+        Если queryset явно упорядочен (order_by), используется его порядок.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    page_size = 10
+    ordering = ('-created', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+    signing_salt = 'api.paginators.KeysetPagination'
+
+    @classmethod
+    def is_requested(cls, request):
+        """
+            Клиент выбирает keyset режим явно (?pagination=cursor) или передавая курсор
+        """
+        params = request.query_params
+        return cls.cursor_query_param in params or params.get(cls.mode_query_param) == 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        position = self.start(queryset, request)
+        rows = list(self.fetch(queryset, position, self.reverse, self.page_size + 1))
+        return self.set_page(rows, position)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        position = self.start(queryset, request)
+        rows = await self.afetch(queryset, position, self.reverse, self.page_size + 1)
+        return self.set_page(rows, position)
+
+    def start(self, queryset, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_queryset_ordering(queryset)
+        position, self.reverse = self.decode_cursor(request)
+        return position
+
+    def set_page(self, rows, position):
+        """
+            rows - до page_size + 1 строк после позиции, лишняя строка говорит о следующей странице
+        """
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = rows
+        return rows
+
+    def fetch(self, queryset, position, reverse, limit):
+        if hasattr(queryset, 'keyset_slice'):
+            # составной источник (api.feed.MergedFeed) сам выбирает и сливает свои части
+            return queryset.keyset_slice(position, reverse, limit)
+        return self.slice_queryset(queryset, position, reverse, limit)
+
+    async def afetch(self, queryset, position, reverse, limit):
+        if hasattr(queryset, 'akeyset_slice'):
+            return await queryset.akeyset_slice(position, reverse, limit)
+        return await fetch_async(self.slice_queryset(queryset, position, reverse, limit))
+
+    @classmethod
+    def slice_queryset(cls, queryset, position, reverse, limit):
+        """
+            Одна выборка limit строк после позиции в порядке queryset (или обратном)
+        """
+        ordering = cls.get_queryset_ordering(queryset)
+        if reverse:
+            ordering = cls.reverse_ordering(ordering)
+        if position is not None:
+            queryset = queryset.filter(cls.get_position_filter(position, ordering))
+        return queryset.order_by(*ordering)[:limit]
+
+    @classmethod
+    def get_queryset_ordering(cls, queryset):
+        query = getattr(queryset, 'query', None)
+        if query is not None and query.order_by:
+            return tuple(query.order_by)
+        return cls.ordering
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+    @staticmethod
+    def get_position_filter(position, ordering):
+        """
+            (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y) -- для произвольного числа полей
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            condition |= equal & Q(**{name + lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+    @staticmethod
+    def get_row_value(row, name):
+        # строки могут быть моделями или словарями из .values()
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    def get_position(self, row):
+        values = []
+        for field in self.ordering:
+            value = self.get_row_value(row, field.lstrip('-'))
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return values
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = signing.loads(encoded, salt=self.signing_salt)
+            position, reverse, ordering = cursor['p'], bool(cursor['r']), cursor['o']
+        except (signing.BadSignature, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        # позиция имеет смысл только для порядка, в котором она выдана (?ordering мог поменяться)
+        if ordering != list(self.ordering) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        encoded = signing.dumps({'p': position, 'r': int(reverse), 'o': list(self.ordering)},
+                                salt=self.signing_salt, compress=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque pagination cursor from next/previous links',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Set to "cursor" to switch to keyset pagination',
+                'schema': {'type': 'string', 'enum': ['page', 'cursor']},
+            },
+        ]
+
+
+class UserKeysetPagination(KeysetPagination):
+    """
+        Keyset пагинация списка пользователей. Порядок задается OrderingFilter,
+        id в конце делает его однозначным.
+    """
+    ordering = ('id',)
+
+    @classmethod
+    def get_queryset_ordering(cls, queryset):
+        ordering = super().get_queryset_ordering(queryset)
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering += ('-id' if ordering[-1].startswith('-') else 'id',)
+        return ordering
+
+
+class SwitchablePagination(BasePagination):
+    """
+        Пагинатор с двумя режимами: по умолчанию старый постраничный (?page=N),
+        keyset режим включается через ?pagination=cursor. Нужен, чтобы клиенты
+        могли переходить на курсоры постепенно.
+    """
+    page_number_class = CustomPageNumberPagination
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.delegate = self.get_delegate(request)
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.delegate = self.get_delegate(request)
+        return await self.delegate.apaginate_queryset(queryset, request, view)
+
+    def get_delegate(self, request):
+        if self.keyset_class.is_requested(request):
+            return self.keyset_class()
+        return self.page_number_class()
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.keyset_class().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        return (self.page_number_class().get_schema_operation_parameters(view) +
+                self.keyset_class().get_schema_operation_parameters(view))
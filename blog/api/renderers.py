@@ -0,0 +1,70 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# DRF's encoder fallback for types orjson doesn't know (lazy strings, Decimal, ...).
+# Datetimes go through it too, so output is identical to stdlib rendering
+_encoder = encoders.JSONEncoder()
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+
+def dumps(data):
+    """
+        Compact UTF-8 JSON bytes, same as DRF JSONRenderer gives with default settings.
+        Uses orjson when installed, stdlib json otherwise
+    """
+    if orjson is not None:
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # out of range integers and other values only stdlib can encode
+            pass
+        else:
+            # same as JSONRenderer: U+2028/U+2029 are valid JSON but not valid javascript
+            return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    ret = json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+        JSONRenderer on orjson. Indented output (browsable API, `indent` media type param)
+        and non default JSON settings are left to the stdlib renderer
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) or not self.is_default_style():
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+    def is_default_style(self):
+        return self.ensure_ascii is False and self.compact and self.strict
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+        Newline delimited JSON: one object per line.
+        Views stream rows themselves (see UserPostsListView), renderer handles
+        ordinary responses such as errors.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return b''.join(self.render_row(row) for row in rows)
+
+    @staticmethod
+    def render_row(row):
+        return dumps(row) + b'\n'
@@ -0,0 +1,325 @@
+import threading
+from array import array
+from bisect import bisect_left
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Case, Count, Exists, OuterRef, Q, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Post, SeenSet, UserPostRelation
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_seen_buffer():
+    """
+        Process wide write-behind buffer (SEEN_WRITE_BEHIND mode)
+    """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            # concurrent first requests must share one buffer, marks put into a lost one are never written
+            if _buffer is None:
+                buffer_class = import_string(settings.SEEN_BUFFER_CLASS)
+                _buffer = buffer_class(
+                    writer=lambda changes: get_seen_storage().write_changes(changes),
+                    max_size=settings.SEEN_FLUSH_SIZE,
+                    flush_interval=settings.SEEN_FLUSH_INTERVAL,
+                    start_worker=settings.SEEN_FLUSH_WORKER,
+                )
+    return _buffer
+
+
+class RowSeenStorage:
+    """
+        Default storage: one UserPostRelation row per seen post
+    """
+
+    def write(self, user_id, post_ids, seen):
+        """
+            Sets seen state of many posts at once: one insert (conflicts with existing
+            rows are ignored thanks to unique (user, post) constraint) or one delete
+        """
+        if not post_ids:
+            return
+        if seen:
+            UserPostRelation.objects.bulk_create(
+                [UserPostRelation(user_id=user_id, post_id=post_id, seen=True) for post_id in post_ids],
+                ignore_conflicts=True,
+            )
+        else:
+            UserPostRelation.objects.filter(user_id=user_id, post_id__in=post_ids).delete()
+
+    def write_changes(self, changes):
+        """
+            Writes coalesced marks of many users: {user_id: {post_id: seen}}.
+            One insert for all seen marks and one delete for all unseen ones.
+            Marks of posts deleted before the flush are dropped: ignore_conflicts skips
+            unique conflicts only, a foreign key violation would fail the whole batch on every retry.
+        """
+        seen_post_ids = {post_id for states in changes.values() for post_id, seen in states.items() if seen}
+        if seen_post_ids:
+            seen_post_ids = set(Post.objects.filter(id__in=seen_post_ids).values_list('id', flat=True))
+
+        relations = []
+        unseen_conditions = []
+        for user_id, states in changes.items():
+            relations += [UserPostRelation(user_id=user_id, post_id=post_id, seen=True)
+                          for post_id, seen in states.items() if seen and post_id in seen_post_ids]
+            unseen_ids = [post_id for post_id, seen in states.items() if not seen]
+            if unseen_ids:
+                unseen_conditions.append(Q(user_id=user_id, post_id__in=unseen_ids))
+
+        if relations:
+            UserPostRelation.objects.bulk_create(relations, batch_size=settings.SEEN_FLUSH_SIZE, ignore_conflicts=True)
+        if unseen_conditions:
+            UserPostRelation.objects.filter(reduce(or_, unseen_conditions)).delete()
+
+    def is_seen(self, user_id, post_id):
+        return UserPostRelation.objects.filter(user_id=user_id, post_id=post_id).exists()
+
+    def toggle(self, user_id, post_id):
+        deleted, _ = UserPostRelation.objects.filter(user_id=user_id, post_id=post_id).delete()
+        if deleted:
+            return False
+        self.write(user_id, [post_id], True)
+        return True
+
+    def annotation(self, user_id):
+        """
+            Correlated EXISTS over unique (user, post) index: one index probe per post,
+            no matter how many other users have seen it
+        """
+        return Exists(UserPostRelation.objects.filter(user_id=user_id, post_id=OuterRef('pk')))
+
+
+class CompactSeenStorage:
+    """
+        One SeenSet row per user: id watermark, authors it covers and sorted arrays of exceptions.
+        Post ids grow monotonically with creation time, so the watermark works as
+        "everything the covered authors published before this point is seen".
+        When `seen_ids` exceeds SEEN_COMPACT_THRESHOLD the watermark moves up to the newest
+        seen post. Not seen posts of covered authors below it become `unseen_ids`; an author
+        joins the covered ones only when that takes fewer ids than listing its seen posts.
+        Posts of other authors (e.g. followed after compaction) stay explicit in `seen_ids`.
+        Compaction which would grow `unseen_ids` over SEEN_COMPACT_MAX_UNSEEN or wouldn't make
+        the state smaller is skipped, both lists are inlined into the feed query. Next attempt waits
+        for SEEN_COMPACT_RETRY more seen ids; once `seen_ids` grows over SEEN_COMPACT_MAX_SEEN
+        explicit marks of the user move to UserPostRelation rows (`spilled`) and stay there.
+        Ids come from a sequence on insert, not on commit: a post of covered author inserted
+        before compaction but committed after the watermark passed its id is reported as seen.
+        Post creation commits right after the insert, so the window is one request.
+    """
+
+    @staticmethod
+    def unpack(value):
+        ids = array('q')
+        ids.frombytes(bytes(value))
+        return ids
+
+    @staticmethod
+    def pack(ids):
+        return array('q', sorted(ids)).tobytes()
+
+    def load(self, user_id):
+        """
+            (watermark, covered author ids, seen ids, unseen ids, spilled) of the user
+        """
+        row = SeenSet.objects.filter(user_id=user_id).values_list(
+            'watermark', 'authors', 'seen_ids', 'unseen_ids', 'spilled'
+        ).first()
+        if row is None:
+            return 0, array('q'), array('q'), array('q'), False
+        watermark, authors, seen_ids, unseen_ids, spilled = row
+        return watermark, self.unpack(authors), self.unpack(seen_ids), self.unpack(unseen_ids), spilled
+
+    @staticmethod
+    def _contains(ids, post_id):
+        index = bisect_left(ids, post_id)
+        return index < len(ids) and ids[index] == post_id
+
+    def contains(self, state, post_id, owner_id):
+        """
+            Seen flag from loaded state, None when it is kept in rows (spilled)
+        """
+        watermark, authors, seen_ids, unseen_ids, spilled = state
+        if post_id <= watermark and self._contains(authors, owner_id):
+            return not self._contains(unseen_ids, post_id)
+        if spilled:
+            return None
+        return self._contains(seen_ids, post_id)
+
+    @staticmethod
+    def get_owners(post_ids):
+        return dict(Post.objects.filter(id__in=post_ids).values_list('id', 'owner_id'))
+
+    def write(self, user_id, post_ids, seen):
+        if post_ids:
+            self.write_changes({user_id: {post_id: seen for post_id in post_ids}})
+
+    def write_changes(self, changes):
+        owners = self.get_owners({post_id for states in changes.values() for post_id in states})
+        for user_id, states in changes.items():
+            with transaction.atomic():
+                seen_set, _ = SeenSet.objects.select_for_update().get_or_create(user_id=user_id)
+                authors = set(self.unpack(seen_set.authors))
+                seen_ids = set(self.unpack(seen_set.seen_ids))
+                unseen_ids = set(self.unpack(seen_set.unseen_ids))
+                spilled = {}
+                for post_id, seen in states.items():
+                    if post_id <= seen_set.watermark and owners.get(post_id) in authors:
+                        (unseen_ids.discard if seen else unseen_ids.add)(post_id)
+                    elif seen_set.spilled:
+                        spilled[post_id] = seen
+                    else:
+                        (seen_ids.add if seen else seen_ids.discard)(post_id)
+
+                # skipped compaction is retried only after SEEN_COMPACT_RETRY more ids
+                limit = seen_set.skipped_at + settings.SEEN_COMPACT_RETRY if seen_set.skipped_at \
+                    else settings.SEEN_COMPACT_THRESHOLD
+                if len(seen_ids) > limit:
+                    compacted = self.compact(seen_set.watermark, authors, seen_ids, unseen_ids)
+                    if compacted is None:
+                        seen_set.skipped_at = len(seen_ids)
+                    else:
+                        seen_set.watermark, authors, seen_ids, unseen_ids = compacted
+                        seen_set.skipped_at = 0
+                if len(seen_ids) > settings.SEEN_COMPACT_MAX_SEEN:
+                    # compaction doesn't keep up: explicit marks go to rows, the list stops growing
+                    seen_set.spilled = True
+                    spilled.update((post_id, True) for post_id in seen_ids)
+                    seen_ids = set()
+
+                seen_set.authors = self.pack(authors)
+                seen_set.seen_ids = self.pack(seen_ids)
+                seen_set.unseen_ids = self.pack(unseen_ids)
+                seen_set.save()
+                if spilled:
+                    RowSeenStorage().write_changes({user_id: spilled})
+
+    def compact(self, watermark, authors, seen_ids, unseen_ids):
+        """
+            New (watermark, authors, seen ids, unseen ids), None if compaction is not worth it
+        """
+        # seen ids of not covered authors may lie below the watermark
+        new_watermark = max(watermark, max(seen_ids))
+        owners = self.get_owners(seen_ids)
+        seen_by_author = {}
+        for post_id in seen_ids:
+            seen_by_author.setdefault(owners.get(post_id), set()).add(post_id)
+
+        # covered authors: their posts between the watermarks
+        new_unseen_ids = set(unseen_ids)
+        if authors:
+            new_unseen_ids |= set(
+                Post.objects.filter(owner_id__in=authors, id__gt=watermark, id__lte=new_watermark).
+                values_list('id', flat=True)
+            ) - seen_ids
+
+        # other authors of seen posts join when their not seen posts are fewer than seen ones
+        candidates = [author_id for author_id in seen_by_author if author_id is not None and author_id not in authors]
+        totals = dict(
+            Post.objects.filter(owner_id__in=candidates, id__lte=new_watermark).
+            values_list('owner_id').annotate(total=Count('id')).order_by()
+        )
+        joined = {author_id for author_id in candidates
+                  if totals.get(author_id, 0) - len(seen_by_author[author_id]) < len(seen_by_author[author_id])}
+        if joined:
+            new_unseen_ids |= set(
+                Post.objects.filter(owner_id__in=joined, id__lte=new_watermark).values_list('id', flat=True)
+            ) - seen_ids
+
+        new_authors = authors | joined
+        new_seen_ids = {post_id for post_id in seen_ids if owners.get(post_id) not in new_authors}
+        if len(new_unseen_ids) > settings.SEEN_COMPACT_MAX_UNSEEN or \
+                len(new_seen_ids) + len(new_unseen_ids) >= len(seen_ids) + len(unseen_ids):
+            # user skips most of the feed, watermark wouldn't make state smaller
+            return None
+        return new_watermark, new_authors, new_seen_ids, new_unseen_ids
+
+    def is_seen(self, user_id, post_id):
+        state = self.load(user_id)
+        owner_id = self.get_owners([post_id]).get(post_id) if post_id <= state[0] else None
+        seen = self.contains(state, post_id, owner_id)
+        if seen is None:
+            return RowSeenStorage().is_seen(user_id, post_id)
+        return seen
+
+    def toggle(self, user_id, post_id):
+        seen = not self.is_seen(user_id, post_id)
+        self.write(user_id, [post_id], seen)
+        return seen
+
+    def annotation(self, user_id):
+        """
+            Plain CASE over literal ids, state of the user is loaded by one primary key lookup.
+            Spilled explicit marks are checked by the row storage EXISTS
+        """
+        watermark, authors, seen_ids, unseen_ids, spilled = self.load(user_id)
+        return Case(
+            When(pk__in=list(unseen_ids), then=Value(False)),
+            When(pk__in=list(seen_ids), then=Value(True)),
+            When(pk__lte=watermark, owner_id__in=list(authors), then=Value(True)),
+            default=RowSeenStorage().annotation(user_id) if spilled else Value(False),
+            output_field=BooleanField(),
+        )
+
+
+SEEN_STORAGES = {
+    'rows': RowSeenStorage,
+    'compact': CompactSeenStorage,
+}
+
+
+def get_seen_storage():
+    return SEEN_STORAGES[settings.SEEN_STORAGE]()
+
+
+def set_seen(user_id, post_ids, seen):
+    if settings.SEEN_WRITE_BEHIND:
+        get_seen_buffer().put(user_id, post_ids, seen)
+    else:
+        get_seen_storage().write(user_id, post_ids, seen)
+
+
+def is_seen(user_id, post_id):
+    if settings.SEEN_WRITE_BEHIND:
+        state = get_seen_buffer().get(user_id, post_id)
+        if state is not None:
+            return state
+    return get_seen_storage().is_seen(user_id, post_id)
+
+
+def toggle_seen(user_id, post_id):
+    """
+        Unmarks post if it was seen, otherwise marks it. Returns new state
+    """
+    if settings.SEEN_WRITE_BEHIND:
+        seen = not is_seen(user_id, post_id)
+        set_seen(user_id, [post_id], seen)
+        return seen
+    return get_seen_storage().toggle(user_id, post_id)
+
+
+def seen_annotation(user_id):
+    """
+        Expression for `seen` flag of the given user. In write-behind mode
+        not flushed marks of the user override stored state.
+    """
+    stored = get_seen_storage().annotation(user_id)
+    if not settings.SEEN_WRITE_BEHIND:
+        return stored
+
+    seen_ids, unseen_ids = get_seen_buffer().pending_for(user_id)
+    if not seen_ids and not unseen_ids:
+        return stored
+    return Case(
+        When(pk__in=list(seen_ids), then=Value(True)),
+        When(pk__in=list(unseen_ids), then=Value(False)),
+        default=stored,
+        output_field=BooleanField(),
+    )
@@ -0,0 +1,118 @@
+import atexit
+import logging
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class SeenWriteBuffer:
+    """
+        In-process write-behind buffer for seen marks.
+        Marks are coalesced per (user, post) - only the last state survives - and
+        written by `writer` in bulk when buffer grows to `max_size` or every
+        `flush_interval` seconds. Not flushed marks are visible to readers of
+        this process through `pending_for`.
+        Any object with the same interface can replace it (SEEN_BUFFER_CLASS setting).
+    """
+
+    def __init__(self, writer, max_size=1000, flush_interval=1.0, start_worker=True):
+        self.writer = writer
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.start_worker = start_worker
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        # user_id -> {post_id: seen}
+        self._pending = {}
+        # changes taken by running flush, still visible to readers until written
+        self._flushing = {}
+        self._size = 0
+
+    def put(self, user_id, post_ids, seen):
+        with self._lock:
+            user_pending = self._pending.setdefault(user_id, {})
+            for post_id in post_ids:
+                if post_id not in user_pending:
+                    self._size += 1
+                user_pending[post_id] = seen
+            full = self._size >= self.max_size
+
+        if self.start_worker:
+            self._ensure_worker()
+            if full:
+                self._wakeup.set()
+        elif full:
+            self.flush()
+
+    def get(self, user_id, post_id):
+        """
+            Not yet written state of the post or None
+        """
+        with self._lock:
+            for changes in (self._pending, self._flushing):
+                state = changes.get(user_id, {}).get(post_id)
+                if state is not None:
+                    return state
+        return None
+
+    def pending_for(self, user_id):
+        """
+            Not yet written marks of the user: (seen post ids, unseen post ids)
+        """
+        with self._lock:
+            states = dict(self._flushing.get(user_id, {}))
+            states.update(self._pending.get(user_id, {}))
+        seen_ids = {post_id for post_id, seen in states.items() if seen}
+        return seen_ids, set(states) - seen_ids
+
+    def __len__(self):
+        return self._size
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                self._flushing, self._pending = self._pending, {}
+                self._size = 0
+            try:
+                self.writer(self._flushing)
+            except Exception:
+                # put changes back unless they were overwritten meanwhile, next flush retries
+                logger.exception('Seen marks flush failed')
+                with self._lock:
+                    for user_id, changes in self._flushing.items():
+                        user_pending = self._pending.setdefault(user_id, {})
+                        for post_id, seen in changes.items():
+                            if post_id not in user_pending:
+                                user_pending[post_id] = seen
+                                self._size += 1
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='seen-write-buffer', daemon=True)
+                self._worker.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass
+            finally:
+                close_old_connections()
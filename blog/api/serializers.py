@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from rest_framework.reverse import reverse
 
+from .links import NONE, LinkBuilder
 from .models import Post, Profile
 
 
@@ -17,15 +18,18 @@ class PostCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ('created',)
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfilePreviewSerializer(serializers.ModelSerializer):
     """
-        User profile serializer. Returns only users list of subscriptions
+        Short user profile: first subscriptions (context['subscriptions_preview']) and their total count
     """
-    subscriptions = serializers.StringRelatedField(many=True, read_only=True)
+    subscriptions = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
-        fields = ['subscriptions']
+        fields = ['subscriptions', 'subscriptions_count']
+
+    def get_subscriptions(self, obj) -> list:
+        return self.context['subscriptions_preview'].get(obj.id, [])
 
 
 class UserListSerializer(serializers.ModelSerializer):
@@ -33,7 +37,7 @@ class UserListSerializer(serializers.ModelSerializer):
         User list serializer
     """
     posts_count = serializers.IntegerField()
-    profile = ProfileSerializer()
+    profile = ProfilePreviewSerializer()
 
     class Meta:
         model = User
@@ -61,6 +65,10 @@ class PostDetailSerializer(serializers.ModelSerializer):
             for field_name in existing - allowed:
                 self.fields.pop(field_name)
 
+        links = self.context.get('mark_seen_links')
+        if links is not None and links.mode == NONE:
+            self.fields.pop('mark_seen_link', None)
+
     class Meta:
         model = Post
         fields = ['id', 'title', 'body', 'created', 'owner', 'seen', 'mark_seen_link']
@@ -68,22 +76,51 @@ class PostDetailSerializer(serializers.ModelSerializer):
 
     def get_mark_seen_link(self, obj) -> str:
         """
-            returns link to endpoint that marks post as seen
+            returns link to endpoint that marks post as seen.
+            URL pattern is resolved once per serialization (context['mark_seen_links'])
         :param obj:
         :return:
         """
-        result = '{}'.format(
-            reverse('mark_seen', args=[obj.id], request=self.context['request']))
-        return result
+        links = self.context.get('mark_seen_links')
+        if links is None:
+            links = self.context['mark_seen_links'] = LinkBuilder('mark_seen', request=self.context['request'])
+        return links.build(obj.id)
 
 
-class UserPostsSerializer(serializers.ModelSerializer):
+class UserPostSerializer(PostDetailSerializer):
     """
-        User post serializer. Returns user's detailed post data
+        User's post serializer. Detailed post data without viewer specific seen flag
     """
-    post_fields = ('id', 'title', 'body', 'created', 'owner', 'mark_seen_link')
-    posts = PostDetailSerializer(many=True, fields=post_fields)
+    seen = None
 
-    class Meta:
-        model = User
-        fields = ['username', 'posts']
+    class Meta(PostDetailSerializer.Meta):
+        fields = ['id', 'title', 'body', 'created', 'owner', 'mark_seen_link']
+
+
+class BulkSubscribeSerializer(serializers.Serializer):
+    """
+        Bulk subscribe request serializer. List of usernames
+    """
+    usernames = serializers.ListField(child=serializers.CharField(max_length=150), allow_empty=False)
+
+    def validate_usernames(self, value):
+        if len(value) > settings.SUBSCRIBE_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than {settings.SUBSCRIBE_BATCH_MAX_SIZE} elements."
+            )
+        return value
+
+
+class PostSeenBatchSerializer(serializers.Serializer):
+    """
+        Batch mark as seen request serializer. List of post ids and target state
+    """
+    posts = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    seen = serializers.BooleanField()
+
+    def validate_posts(self, value):
+        if len(value) > settings.SEEN_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than {settings.SEEN_BATCH_MAX_SIZE} elements."
+            )
+        return value
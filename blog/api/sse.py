@@ -0,0 +1,255 @@
+import asyncio
+import functools
+from collections import deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signals
+from rest_framework.exceptions import AuthenticationFailed
+
+from auth.authentication import TokenUserAuthentication
+
+from .events import get_event_hub, post_summary
+from .models import Post
+from .renderers import dumps
+from .subscriptions import subscription_ids
+
+
+class EventsRouter:
+    """
+        ASGI entry point: FEED_EVENTS_PATH goes to the event stream app, everything else to Django
+    """
+
+    def __init__(self, application, events_application):
+        self.application = application
+        self.events_application = events_application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == settings.FEED_EVENTS_PATH:
+            return await self.events_application(scope, receive, send)
+        return await self.application(scope, receive, send)
+
+
+def format_event(message, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f"event: {message['event']}")
+    lines.append('data: ' + dumps(message.get('data', {})).decode())
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def authenticate(raw_token):
+    """
+        TokenUser of JWT access token: signature, expiration, revocation and active flag are checked
+    """
+    authenticator = TokenUserAuthentication()
+    return authenticator.get_user(authenticator.get_validated_token(raw_token))
+
+
+def replay_posts(author_ids, last_event_id, limit):
+    """
+        Posts published after Last-Event-ID by followed authors, None when there are too many of them
+    """
+    posts = list(
+        Post.objects.select_related('owner').only('id', 'title', 'created', 'owner__username').
+        filter(owner_id__in=author_ids, id__gt=last_event_id).order_by('id')[:limit + 1]
+    )
+    if len(posts) > limit:
+        return None
+    return [{'event': 'post', 'data': post_summary(post)} for post in posts]
+
+
+def database_call(func):
+    """
+        sync_to_async framed by request signals: the stream never finishes a Django request,
+        so every database hop releases connections (CONN_MAX_AGE) the same way a request does
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        signals.request_started.send(sender=FeedEventsApp)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            signals.request_finished.send(sender=FeedEventsApp)
+    return sync_to_async(wrapper)
+
+
+@database_call
+def open_stream(raw_token):
+    """
+        (user id, followed author ids) of the token owner
+    """
+    user = authenticate(raw_token)
+    return user.id, subscription_ids(user.id)
+
+
+@database_call
+def load_replay(author_ids, last_event_id):
+    return replay_posts(author_ids, last_event_id, settings.FEED_EVENTS_REPLAY_LIMIT)
+
+
+@database_call
+def refresh_stream(raw_token, user_id):
+    """
+        Followed author ids, AuthenticationFailed once the token has expired or was revoked
+    """
+    authenticate(raw_token)
+    return subscription_ids(user_id)
+
+
+class SentIds:
+    """
+        Ids of the last `size` sent posts. Posts are published on commit, so ids may come out of order
+        and a high-water mark would drop some of them; the set only drops posts sent twice
+        (published between connection registration and replay query)
+    """
+
+    def __init__(self, size):
+        self._order = deque()
+        self._ids = set()
+        self.size = size
+
+    def add(self, post_id):
+        if len(self._order) >= self.size:
+            self._ids.discard(self._order.popleft())
+        self._order.append(post_id)
+        self._ids.add(post_id)
+
+    def __contains__(self, post_id):
+        return post_id in self._ids
+
+
+class FeedEventsApp:
+    """
+        Server-sent events stream of posts published by followed authors, replaces feed polling.
+        Authentication: `Authorization: Bearer <access token>` or ?token= (EventSource can't set headers).
+        Every post comes as `event: post` with the post id as event id. After reconnect
+        (Last-Event-ID header or ?last_event_id=) missed posts are replayed first.
+        `event: reset` means events were dropped (too many missed posts, or the client
+        reads slower than posts arrive), client should reload /api/feed/.
+        Comment lines are sent every FEED_EVENTS_HEARTBEAT seconds, subscriptions are re-read and
+        the token is checked again then: the stream is closed once the token expires or is revoked.
+        Works only under ASGI, the stream lives in the event loop.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] != 'GET':
+            return await self.respond(send, 405, {'detail': f"Method \"{scope['method']}\" not allowed."})
+
+        headers = {name.decode('latin1').lower(): value.decode('latin1') for name, value in scope['headers']}
+        query = parse_qs(scope['query_string'].decode('latin1'))
+        raw_token = self.get_raw_token(headers, query)
+        if raw_token is None:
+            return await self.respond(send, 401, {'detail': 'Authentication credentials were not provided.'})
+        try:
+            last_event_id = self.get_last_event_id(headers, query)
+        except ValueError:
+            return await self.respond(send, 400, {'detail': 'Invalid Last-Event-ID.'})
+
+        try:
+            user_id, author_ids = await open_stream(raw_token)
+        except AuthenticationFailed as exc:
+            # same body as DRF gives for the exception
+            data = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+            return await self.respond(send, 401, data)
+
+        hub = get_event_hub()
+        connection = hub.connect(author_ids)
+        if connection is None:
+            return await self.respond(send, 503, {'detail': 'Too many event streams, poll the feed instead.'})
+        try:
+            await self.stream(receive, send, hub, connection, raw_token, user_id, last_event_id)
+        finally:
+            hub.disconnect(connection)
+
+    @staticmethod
+    def get_raw_token(headers, query):
+        header = headers.get('authorization', '').split()
+        if len(header) == 2 and header[0].lower() == 'bearer':
+            return header[1]
+        tokens = query.get('token')
+        return tokens[0] if tokens else None
+
+    @staticmethod
+    def get_last_event_id(headers, query):
+        value = headers.get('last-event-id') or query.get('last_event_id', [None])[0]
+        return int(value) if value else None
+
+    async def stream(self, receive, send, hub, connection, raw_token, user_id, last_event_id):
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # proxies (nginx) must not buffer the stream
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+
+        sent_ids = SentIds(settings.FEED_EVENTS_QUEUE_SIZE + settings.FEED_EVENTS_REPLAY_LIMIT)
+        if last_event_id is not None:
+            # connection is registered before the replay query: posts published meanwhile
+            # come from both, nothing falls in between
+            replay = await load_replay(connection.author_ids, last_event_id)
+            if replay is None:
+                await self.send_event(send, {'event': 'reset'})
+            else:
+                for message in replay:
+                    sent_ids.add(message['data']['id'])
+                    await self.send_event(send, message, message['data']['id'])
+
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            while True:
+                getter = asyncio.ensure_future(connection.queue.get())
+                done, _ = await asyncio.wait(
+                    {getter, disconnected}, timeout=settings.FEED_EVENTS_HEARTBEAT,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if getter not in done:
+                    getter.cancel()
+                if disconnected in done:
+                    return
+                if getter in done:
+                    message = getter.result()
+                    event_id = message['data']['id'] if message['event'] == 'post' else None
+                    if event_id is not None:
+                        if event_id in sent_ids:
+                            continue
+                        sent_ids.add(event_id)
+                    await self.send_event(send, message, event_id)
+                    continue
+
+                try:
+                    author_ids = await refresh_stream(raw_token, user_id)
+                except AuthenticationFailed:
+                    # EventSource reconnects, gets 401 and stops
+                    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                    return
+                hub.update(connection, author_ids)
+                await send({'type': 'http.response.body', 'body': b': heartbeat\n\n', 'more_body': True})
+        finally:
+            disconnected.cancel()
+
+    @staticmethod
+    async def send_event(send, message, event_id=None):
+        await send({'type': 'http.response.body', 'body': format_event(message, event_id), 'more_body': True})
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    @staticmethod
+    async def respond(send, status, data):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': dumps(data)})
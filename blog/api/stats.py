@@ -0,0 +1,83 @@
+import threading
+
+from django.core.cache import cache
+
+# All known counters, printed by `manage.py cache_stats`
+COUNTERS = (
+    'feed_cache.hit',
+    'feed_cache.miss',
+    'subscriptions.local_hit',
+    'subscriptions.shared_hit',
+    'subscriptions.miss',
+    'subscriptions.stale',
+    'token_denylist.bloom_hit',
+    'token_denylist.false_positive',
+)
+
+KEY_PREFIX = 'stats:'
+# buffered increments are sent to shared cache after this many of them
+BUFFER_SIZE = 100
+
+_buffer = {}
+_buffer_size = 0
+_buffer_lock = threading.Lock()
+
+
+def incr(name, delta=1):
+    """
+        Increments shared counter. Counters live in the default cache,
+        so they are aggregated over all worker processes.
+    """
+    key = KEY_PREFIX + name
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+async def aincr(name, delta=1):
+    """
+        incr() for async views, through async cache API
+    """
+    key = KEY_PREFIX + name
+    try:
+        await cache.aincr(key, delta)
+    except ValueError:
+        if not await cache.aadd(key, delta, timeout=None):
+            await cache.aincr(key, delta)
+
+
+def incr_buffered(name):
+    """
+        Increment for hot paths (e.g. process-local cache hits) that shouldn't pay
+        a shared cache round trip each time. Collected in process, sent in bulk.
+    """
+    global _buffer_size
+    with _buffer_lock:
+        _buffer[name] = _buffer.get(name, 0) + 1
+        _buffer_size += 1
+        if _buffer_size < BUFFER_SIZE:
+            return
+    flush()
+
+
+def flush():
+    global _buffer, _buffer_size
+    with _buffer_lock:
+        pending, _buffer, _buffer_size = _buffer, {}, 0
+    for name, delta in pending.items():
+        incr(name, delta)
+
+
+def get_all():
+    flush()
+    values = cache.get_many([KEY_PREFIX + name for name in COUNTERS])
+    return {name: values.get(KEY_PREFIX + name, 0) for name in COUNTERS}
+
+
+def reset():
+    global _buffer, _buffer_size
+    with _buffer_lock:
+        _buffer, _buffer_size = {}, 0
+    cache.delete_many([KEY_PREFIX + name for name in COUNTERS])
@@ -0,0 +1,78 @@
+import django
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.handlers.asgi import ASGIHandler as DjangoASGIHandler
+from django.http import StreamingHttpResponse
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    """
+        Streaming response over an async iterator. Django 4.1 streams only sync iterators,
+        and under ASGI iterates them on the event loop where database access is not allowed.
+        ASGIHandler below sends it chunk by chunk as rows are fetched; WSGI and the test
+        client iterate it synchronously and get the content collected at once.
+    """
+
+    @property
+    def streaming_content(self):
+        if not self.is_async:
+            return map(self.make_bytes, self._iterator)
+
+        async def collect():
+            return [part async for part in self._iterator]
+        return map(self.make_bytes, async_to_sync(collect)())
+
+    @streaming_content.setter
+    def streaming_content(self, value):
+        self._set_streaming_content(value)
+
+    def _set_streaming_content(self, value):
+        # the test client wraps streaming_content into a sync generator
+        try:
+            self._iterator = value.__aiter__()
+            self.is_async = True
+        except AttributeError:
+            self._iterator = iter(value)
+            self.is_async = False
+
+    async def __aiter__(self):
+        if not self.is_async:
+            for part in self._iterator:
+                yield self.make_bytes(part)
+            return
+        async for part in self._iterator:
+            yield self.make_bytes(part)
+
+
+class ASGIHandler(DjangoASGIHandler):
+    """
+        Django ASGI handler which streams AsyncStreamingHttpResponse from the event loop
+    """
+
+    async def send_response(self, response, send):
+        if not getattr(response, 'is_async', False):
+            return await super().send_response(response, send)
+
+        headers = [
+            (header.encode('ascii') if isinstance(header, str) else header,
+             value.encode('latin1') if isinstance(value, str) else value)
+            for header, value in response.items()
+        ]
+        headers += [(b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+                    for cookie in response.cookies.values()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        try:
+            async for part in response:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            # request_finished: database connections of the request are released
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """
+        django.core.asgi.get_asgi_application with the handler above
+    """
+    django.setup(set_prefix=False)
+    return ASGIHandler()
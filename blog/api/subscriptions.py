@@ -0,0 +1,90 @@
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import stats
+from .local_cache import TTLCache
+from .models import Profile
+
+SUBSCRIPTIONS_KEY = 'subs:{}'
+
+_local_cache = None
+
+
+def get_local_cache():
+    """
+        Process wide LRU in front of the shared cache
+    """
+    global _local_cache
+    if _local_cache is None:
+        _local_cache = TTLCache(settings.SUBSCRIPTIONS_LOCAL_CACHE_SIZE, settings.SUBSCRIPTIONS_LOCAL_CACHE_TTL)
+    return _local_cache
+
+
+def load_subscription_ids(user_id):
+    return frozenset(
+        Profile.subscriptions.through.objects.filter(profile__user_id=user_id).values_list('user_id', flat=True)
+    )
+
+
+def store_subscription_ids(user_id, ids):
+    cache.set(SUBSCRIPTIONS_KEY.format(user_id), ids, timeout=settings.SUBSCRIPTIONS_CACHE_TIMEOUT)
+    get_local_cache().set(user_id, ids)
+
+
+def get_subscription_ids(user_id):
+    """
+        Ids of authors the user is subscribed on: process-local LRU, then shared cache, then database.
+        Local copy may lag behind changes made by other processes for SUBSCRIPTIONS_LOCAL_CACHE_TTL,
+        a sample of local hits is compared with the shared copy to count such stale reads.
+    """
+    local_cache = get_local_cache()
+    ids = local_cache.get(user_id)
+    if ids is not None:
+        stats.incr_buffered('subscriptions.local_hit')
+        if random.random() < settings.SUBSCRIPTIONS_STALE_CHECK_RATE:
+            shared_ids = cache.get(SUBSCRIPTIONS_KEY.format(user_id))
+            if shared_ids is not None and shared_ids != ids:
+                stats.incr('subscriptions.stale')
+                local_cache.set(user_id, shared_ids)
+                ids = shared_ids
+        return ids
+
+    ids = cache.get(SUBSCRIPTIONS_KEY.format(user_id))
+    if ids is not None:
+        stats.incr_buffered('subscriptions.shared_hit')
+        local_cache.set(user_id, ids)
+        return ids
+
+    stats.incr_buffered('subscriptions.miss')
+    ids = load_subscription_ids(user_id)
+    store_subscription_ids(user_id, ids)
+    return ids
+
+
+def invalidate_subscription_ids(user_id):
+    """
+        Drops cached set after subscribe/unsubscribe, next read loads it from database.
+        Writing a freshly loaded set instead would race: a request which loaded before
+        a concurrent toggle committed could overwrite its result with the older set.
+    """
+    if settings.SUBSCRIPTIONS_CACHE_ENABLED:
+        cache.delete(SUBSCRIPTIONS_KEY.format(user_id))
+        get_local_cache().delete(user_id)
+
+
+def subscription_ids(user_id):
+    if settings.SUBSCRIPTIONS_CACHE_ENABLED:
+        return get_subscription_ids(user_id)
+    return load_subscription_ids(user_id)
+
+
+def subscribed_authors(user_id):
+    """
+        Right side for `author__in` lookups: cached ids as a literal list
+        (SUBSCRIPTIONS_CACHE_ENABLED setting) or subquery over subscriptions table
+    """
+    if settings.SUBSCRIPTIONS_CACHE_ENABLED:
+        return sorted(get_subscription_ids(user_id))
+    return Profile.subscriptions.through.objects.filter(profile__user_id=user_id).values('user_id')
@@ -0,0 +1,9 @@
+from django.urls import include, path
+
+from api.urls import get_urlpatterns
+
+urlpatterns = [
+    path('auth/', include('auth.urls')),
+    path('api/', include(get_urlpatterns(async_views=True))),
+    path('__debug__/', include('debug_toolbar.urls')),
+]
@@ -1,11 +1,26 @@
+import json
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
 from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APIRequestFactory
 from rest_framework.test import APITestCase
 
-from api.serializers import UserListSerializer, UserPostsSerializer
+from api import seen, stats, subscriptions
+from api.models import Post, Profile, FeedEntry, SeenSet, UserPostRelation
+from api.paginators import KeysetPagination
+from api.seen import CompactSeenStorage
+from api.serializers import UserPostSerializer
 
 
 class PostCreateApiTestCase(APITestCase):
@@ -77,29 +92,118 @@ class UserListApiTestCase(APITestCase):
         self.queryset = User.objects.annotate(posts_count=(Count('posts')))
         self.url = reverse('profiles_list')
 
+    def expected_data(self, qs):
+        return [
+            {
+                'username': user.username,
+                'posts_count': user.posts_count,
+                'profile': {'subscriptions': [], 'subscriptions_count': 0},
+            }
+            for user in qs
+        ]
+
     def test_user_list_ok(self):
         response = self.client.get(self.url)
         self.assertEqual(status.HTTP_200_OK, response.status_code)
 
         qs = self.queryset.order_by('id')
-        serializer_data = UserListSerializer(qs, many=True).data
-        self.assertEqual(response.data, serializer_data)
+        self.assertEqual(response.data['results'], self.expected_data(qs))
 
     def test_user_list_ordered_post_count_ok(self):
         response = self.client.get(self.url, data={'ordering': '-posts_count'})
         self.assertEqual(status.HTTP_200_OK, response.status_code)
 
         qs = self.queryset.order_by('-posts_count')
-        serializer_data = UserListSerializer(qs, many=True).data
-        self.assertEqual(response.data, serializer_data)
+        self.assertEqual(response.data['results'], self.expected_data(qs))
 
     def test_user_list_wrong_ordering_params_ok(self):
         response = self.client.get(self.url, data={'orderin': 'wrong_param'})
         self.assertEqual(status.HTTP_200_OK, response.status_code)
 
         qs = self.queryset.order_by('id')
-        serializer_data = UserListSerializer(qs, many=True).data
-        self.assertEqual(response.data, serializer_data)
+        self.assertEqual(response.data['results'], self.expected_data(qs))
+
+    def test_user_list_pagination_and_subscriptions_preview(self):
+        follower = User.objects.get(username='test_user0')
+        followed = User.objects.bulk_create(User(username=f'followed_{i:02}') for i in range(12))
+        Profile.objects.bulk_create(Profile(user=user) for user in followed)
+        follower.profile.subscriptions.add(*followed)
+
+        response = self.client.get(self.url, data={'ordering': 'username'})
+        self.assertEqual(len(response.data['results']), 10)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(response.data['next'])
+        usernames = [user['username'] for user in response.data['results']]
+        self.assertEqual(usernames, ['followed_10', 'followed_11', 'test_user0', 'test_user1', 'test_user2'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(
+            response.data['results'][2]['profile'],
+            {'subscriptions': [f'followed_{i:02}' for i in range(5)], 'subscriptions_count': 12}
+        )
+
+    def test_user_list_cursor_of_other_ordering(self):
+        users = User.objects.bulk_create(User(username=f'user{i:02}') for i in range(12))
+        Profile.objects.bulk_create(Profile(user=user) for user in users)
+        response = self.client.get(self.url, data={'ordering': 'username'})
+        cursor = parse_qs(urlsplit(response.data['next']).query)['cursor'][0]
+
+        response = self.client.get(self.url, data={'ordering': '-posts_count', 'cursor': cursor})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+
+class ProfileCountersTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.author = User.objects.create_user(username='author', password='123qwer123!')
+        self.reader = User.objects.create_user(username='reader', password='123qwer123!')
+
+    def assertCounters(self, user, posts_count, subscribers_count, subscriptions_count):
+        profile = Profile.objects.get(user=user)
+        self.assertEqual(
+            (profile.posts_count, profile.subscribers_count, profile.subscriptions_count),
+            (posts_count, subscribers_count, subscriptions_count)
+        )
+
+    def test_counters_follow_posts_and_subscriptions(self):
+        self.client.force_authenticate(user=self.author)
+        for _ in range(2):
+            self.client.post(reverse('post_create'), {"title": "string", "body": "string"})
+        self.assertCounters(self.author, 2, 0, 0)
+
+        Post.objects.filter(owner=self.author).first().delete()
+        self.assertCounters(self.author, 1, 0, 0)
+
+        self.client.force_authenticate(user=self.reader)
+        url = reverse('subscribe_on_user', args=['author'])
+        self.client.post(url)
+        self.assertCounters(self.author, 1, 1, 0)
+        self.assertCounters(self.reader, 0, 0, 1)
+
+        # removing not existing edge doesn't break counters
+        self.reader.profile.subscriptions.remove(self.reader)
+        self.client.post(url)
+        self.assertCounters(self.author, 1, 0, 0)
+        self.assertCounters(self.reader, 0, 0, 0)
+
+        self.author.subscribers.add(self.reader.profile)
+        self.assertCounters(self.author, 1, 1, 0)
+        self.assertCounters(self.reader, 0, 0, 1)
+        self.reader.profile.subscriptions.clear()
+        self.assertCounters(self.author, 1, 0, 0)
+        self.assertCounters(self.reader, 0, 0, 0)
+
+    def test_recount_repairs_drift(self):
+        Post.objects.bulk_create(Post(title='string', body='string', owner=self.author) for _ in range(3))
+        self.reader.profile.subscriptions.add(self.author)
+        Profile.objects.filter(user=self.reader).update(subscriptions_count=10)
+        self.assertCounters(self.author, 0, 1, 0)
+
+        out = StringIO()
+        call_command('recount', batch_size=1, stdout=out)
+
+        self.assertIn('repaired 2', out.getvalue())
+        self.assertCounters(self.author, 3, 1, 0)
+        self.assertCounters(self.reader, 0, 0, 1)
 
 
 class UserPostsListApiTestCase(APITestCase):
@@ -128,13 +232,61 @@ class UserPostsListApiTestCase(APITestCase):
         response = self.client.get(url)
 
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        user = {
-            'username': self.username,
-            'posts': self.user.posts.all().order_by('-created')
-        }
+        posts = self.user.posts.all().order_by('-created')
+
+        serializer_data = UserPostSerializer(posts, many=True, context={'request': factory.get(url)}).data
+        self.assertEqual(response.data['results'], serializer_data)
+
+    def test_user_posts_ndjson_stream(self):
+        url = reverse('users_posts', args=[self.username])
+        factory = APIRequestFactory()
+
+        response = self.client.get(url, data={'format': 'ndjson'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
 
-        serializer_data = UserPostsSerializer(user, context={'request': factory.get(url)}).data
-        self.assertEqual(response.data, serializer_data)
+        response = self.client.get(url, HTTP_ACCEPT='application/x-ndjson')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        posts = self.user.posts.all().order_by('-created', '-id')
+        serializer_data = UserPostSerializer(posts, many=True, context={'request': factory.get(url)}).data
+        self.assertEqual(rows, json.loads(json.dumps(serializer_data)))
+
+        url = reverse('users_posts', args=['not_existing_username'])
+        response = self.client.get(url, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_user_posts_cursor_pagination_ok(self):
+        url = reverse('users_posts', args=[self.username])
+
+        response = self.client.get(url, data={'pagination': 'cursor'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNone(response.data['previous'])
+
+        expected_ids = list(self.user.posts.order_by('-created', '-id').values_list('id', flat=True))
+        self.assertEqual([post['id'] for post in response.data['results']], expected_ids)
+
+    @override_settings(CONDITIONAL_GET=True)
+    def test_user_posts_conditional_get(self):
+        url = reverse('users_posts', args=[self.username])
+
+        response = self.client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(url, HTTP_ACCEPT='application/x-ndjson', HTTP_IF_NONE_MATCH=etag)
+        self.assertTrue(response.streaming)
+
+        self.client.post(reverse('post_create'), {"title": "new", "body": "new"})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['title'], 'new')
 
     def test_not_existing_user(self):
         url = reverse('users_posts', args=['not_existing_username'])
@@ -202,20 +354,110 @@ class SubscribeApiTestCase(APITestCase):
 
         self.assertEqual(status.HTTP_200_OK, response.status_code)
         expected_data_subscribed = {
-            'profile': {
-                'subscriptions': [self.subscribe_to_username]
-            }
+            'username': self.subscribe_to_username,
+            'subscribed': True,
+            'subscriptions_count': 1,
+            'subscribers_count': 1,
         }
         self.assertEqual(response.data, expected_data_subscribed)
+        self.assertEqual(list(user.profile.subscriptions.values_list('username', flat=True)),
+                         [self.subscribe_to_username])
 
         response = self.client.post(url)
         self.assertEqual(status.HTTP_200_OK, response.status_code)
         expected_data_unsubscribed = {
-            'profile': {
-                'subscriptions': []
-            }
+            'username': self.subscribe_to_username,
+            'subscribed': False,
+            'subscriptions_count': 0,
+            'subscribers_count': 0,
         }
         self.assertEqual(response.data, expected_data_unsubscribed)
+        self.assertFalse(user.profile.subscriptions.exists())
+
+    def test_follow_and_unfollow_are_idempotent(self):
+        User.objects.create_user(username='test_user2', password='123qwer123!')
+        user = User.objects.get(username='test_user2')
+        self.client.force_authenticate(user=user)
+        url = reverse('subscribe_on_user', args=[self.subscribe_to_username])
+
+        for _ in range(2):
+            response = self.client.put(url)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertTrue(response.data['subscribed'])
+            self.assertEqual(response.data['subscribers_count'], 1)
+        counters = dict(Profile.objects.values_list('user__username', 'subscriptions_count'))
+        self.assertEqual(counters, {'test_user': 0, 'test_user2': 1})
+        self.assertEqual(Profile.objects.get(user__username='test_user').subscribers_count, 1)
+
+        for _ in range(2):
+            response = self.client.delete(url)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertFalse(response.data['subscribed'])
+            self.assertEqual(response.data['subscriptions_count'], 0)
+        self.assertFalse(user.profile.subscriptions.exists())
+        self.assertEqual(Profile.objects.get(user=user).subscriptions_count, 0)
+
+    def test_subscribe_query_count(self):
+        User.objects.create_user(username='test_user2', password='123qwer123!')
+        user = User.objects.get(username='test_user2')
+        self.client.force_authenticate(user=user)
+        url = reverse('subscribe_on_user', args=[self.subscribe_to_username])
+
+        # profiles, insert, two counter updates (savepoint queries aside)
+        with CaptureQueriesContext(connection) as context:
+            self.client.put(url)
+        statements = [query['sql'] for query in context.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 4)
+
+
+class BulkSubscribeApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        for username in ('reader', 'author1', 'author2', 'author3'):
+            User.objects.create_user(username=username, password='123qwer123!')
+        self.user = User.objects.get(username='reader')
+        self.url = reverse('subscribe_bulk')
+
+    def test_not_authenticated_bulk_subscribe(self):
+        response = self.client.post(self.url, {'usernames': ['author1']}, format='json')
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+    def test_bulk_subscribe_ok(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.put(reverse('subscribe_on_user', args=['author1']))
+
+        usernames = ['author2', 'author1', 'unknown', 'author3', 'author2']
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, {'usernames': usernames}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(response.data, {
+            'added': ['author2', 'author3'],
+            'already_subscribed': ['author1'],
+            'unknown': ['unknown'],
+        })
+        # profile, users, insert, two counter updates
+        statements = [query['sql'] for query in context.captured_queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 5)
+
+        self.assertEqual(
+            sorted(self.user.profile.subscriptions.values_list('username', flat=True)),
+            ['author1', 'author2', 'author3'],
+        )
+        counters = dict(Profile.objects.values_list('user__username', 'subscribers_count'))
+        self.assertEqual(counters, {'reader': 0, 'author1': 1, 'author2': 1, 'author3': 1})
+        self.assertEqual(Profile.objects.get(user=self.user).subscriptions_count, 3)
+
+        response = self.client.post(self.url, {'usernames': ['author3']}, format='json')
+        self.assertEqual(response.data['already_subscribed'], ['author3'])
+        self.assertEqual(Profile.objects.get(user=self.user).subscriptions_count, 3)
+
+    @override_settings(SUBSCRIBE_BATCH_MAX_SIZE=2)
+    def test_bulk_subscribe_validation(self):
+        self.client.force_authenticate(user=self.user)
+
+        for usernames in ([], ['author1', 'author2', 'author3'], ['author1', 'reader']):
+            response = self.client.post(self.url, {'usernames': usernames}, format='json')
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertFalse(self.user.profile.subscriptions.exists())
 
 
 class MarkAsSeenApiTestCase(APITestCase):
@@ -273,6 +515,59 @@ class MarkAsSeenApiTestCase(APITestCase):
         self.assertEqual(expected_data_unmarked, response.data)
 
 
+class BatchMarkAsSeenApiTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(username='test_user', password='123qwer123!')
+        self.posts = Post.objects.bulk_create(
+            Post(title=f'post {i}', body='hi', owner=self.user) for i in range(3)
+        )
+        self.url = reverse('mark_seen_batch')
+
+    def test_not_authenticated_batch_mark(self):
+        response = self.client.post(self.url, {'posts': [self.posts[0].id], 'seen': True}, format='json')
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+    def test_batch_mark_as_seen_ok(self):
+        self.client.force_authenticate(user=self.user)
+        post_ids = [self.posts[0].id, self.posts[1].id, 0, self.posts[0].id]
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, {'posts': post_ids, 'seen': True}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(len(context.captured_queries), 2)
+
+        expected_data = {'results': [
+            {'post': self.posts[0].id, 'seen': True},
+            {'post': self.posts[1].id, 'seen': True},
+            {'post': 0, 'error': 'Post does not exist'},
+        ]}
+        self.assertEqual(expected_data, response.data)
+
+        # marking again is idempotent
+        self.client.post(self.url, {'posts': post_ids, 'seen': True}, format='json')
+        self.assertEqual(UserPostRelation.objects.filter(user=self.user).count(), 2)
+
+        response = self.client.post(self.url, {'posts': [self.posts[0].id], 'seen': False}, format='json')
+        self.assertEqual({'results': [{'post': self.posts[0].id, 'seen': False}]}, response.data)
+        self.assertEqual(
+            list(UserPostRelation.objects.filter(user=self.user).values_list('post_id', flat=True)),
+            [self.posts[1].id]
+        )
+
+    def test_batch_mark_validation(self):
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(self.url, {'posts': [], 'seen': True}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+        response = self.client.post(self.url, {'posts': [self.posts[0].id]}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+        with self.settings(SEEN_BATCH_MAX_SIZE=2):
+            response = self.client.post(self.url, {'posts': [1, 2, 3], 'seen': True}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
 class FeedApiTestCase(APITestCase):
     def setUp(self) -> None:
         self.users_creds = [
@@ -365,3 +660,509 @@ class FeedApiTestCase(APITestCase):
         response = self.client.get(feed_url, data={'seen': True})
 
         self.assertEqual(len(response.data['results']), 1)
+
+    def test_feed_cursor_pagination(self):
+        self.client.force_authenticate(user=self.user)
+
+        for creds in self.users_creds:
+            url = reverse('subscribe_on_user', args=[creds['username']])
+            self.client.post(url)
+
+        feed_url = reverse('feed')
+
+        response = self.client.get(feed_url, data={'pagination': 'cursor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNone(response.data['previous'])
+        first_page_ids = [post['id'] for post in response.data['results']]
+
+        # new post must not shift already issued pages
+        self.client.force_authenticate(user=User.objects.get(username='test_user1'))
+        self.client.post(reverse('post_create'), {"title": "new", "body": "new"})
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+        second_page_ids = [post['id'] for post in response.data['results']]
+
+        expected_ids = list(Post.objects.exclude(title='new').order_by('-created', '-id').values_list('id', flat=True))
+        self.assertEqual(first_page_ids + second_page_ids, expected_ids)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([post['id'] for post in response.data['results']], first_page_ids)
+
+    def test_feed_links_modes(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        feed_url = reverse('feed')
+
+        response = self.client.get(feed_url)
+        post = response.data['results'][0]
+        self.assertEqual(post['mark_seen_link'], 'http://testserver' + reverse('mark_seen', args=[post['id']]))
+
+        response = self.client.get(feed_url, data={'links': 'relative'})
+        for post in response.data['results']:
+            self.assertEqual(post['mark_seen_link'], reverse('mark_seen', args=[post['id']]))
+
+        response = self.client.get(feed_url, data={'links': 'none'})
+        self.assertEqual(len(response.data['results']), 4)
+        for post in response.data['results']:
+            self.assertNotIn('mark_seen_link', post)
+
+        response = self.client.get(feed_url, data={'links': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(CONDITIONAL_GET=True)
+    def test_feed_conditional_get(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        feed_url = reverse('feed')
+
+        response = self.client.get(feed_url)
+        etag = response['ETag']
+        response = self.client.get(feed_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        # other page is other variant
+        response = self.client.get(feed_url, data={'seen': False}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        post_id = Post.objects.filter(owner__username='test_user1').values_list('id', flat=True).first()
+        self.client.post(reverse('mark_seen', args=[post_id]))
+        response = self.client.get(feed_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        Post.objects.filter(id=post_id).delete()
+        response = self.client.get(feed_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_feed_invalid_cursor(self):
+        self.client.force_authenticate(user=self.user)
+        feed_url = reverse('feed')
+
+        response = self.client.get(feed_url, data={'cursor': 'forged'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_feed_cursor_of_other_ordering(self):
+        self.client.force_authenticate(user=self.user)
+        cursor = signing.dumps({'p': ['string', 1], 'r': 0, 'o': ['title', 'id']},
+                               salt=KeysetPagination.signing_salt, compress=True)
+
+        response = self.client.get(reverse('feed'), data={'cursor': cursor})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(FEED_FANOUT_ON_WRITE=True)
+class FanOutFeedApiTestCase(FeedApiTestCase):
+    """
+        Same feed scenarios, but feed is read from precomputed inbox
+    """
+
+    def test_fan_out_on_post_create(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        self.assertEqual(FeedEntry.objects.filter(subscriber=self.user).count(), 4)
+
+        author = User.objects.get(username='test_user1')
+        self.client.force_authenticate(user=author)
+        response = self.client.post(reverse('post_create'), {"title": "fresh", "body": "fresh"})
+        self.assertTrue(FeedEntry.objects.filter(subscriber=self.user, post_id=response.data['id']).exists())
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(response.data['results'][0]['title'], 'fresh')
+
+    def test_evict_on_unsubscribe(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('subscribe_on_user', args=['test_user1'])
+        self.client.post(url)
+        self.client.post(url)
+
+        self.assertFalse(FeedEntry.objects.filter(subscriber=self.user).exists())
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(response.data['results'], [])
+
+    def test_hybrid_feed_with_celebrity(self):
+        self.client.force_authenticate(user=self.user)
+        for creds in self.users_creds:
+            self.client.post(reverse('subscribe_on_user', args=[creds['username']]))
+
+        # test_user2 gets one more subscriber and crosses the threshold
+        self.client.force_authenticate(user=User.objects.get(username='test_user3'))
+        self.client.post(reverse('subscribe_on_user', args=['test_user2']))
+        call_command('classify_celebrities', threshold=2, stdout=StringIO())
+
+        celebrity = User.objects.get(username='test_user2')
+        self.assertTrue(celebrity.profile.is_celebrity)
+        self.assertFalse(FeedEntry.objects.filter(author=celebrity).exists())
+
+        self.client.force_authenticate(user=celebrity)
+        self.client.post(reverse('post_create'), {"title": "celebrity", "body": "hi"})
+        self.assertFalse(FeedEntry.objects.filter(author=celebrity).exists())
+
+        self.client.force_authenticate(user=self.user)
+        feed_url = reverse('feed')
+        response = self.client.get(feed_url, data={'pagination': 'cursor'})
+        ids = [post['id'] for post in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids += [post['id'] for post in response.data['results']]
+        self.assertIsNone(response.data['next'])
+
+        expected_ids = list(Post.objects.exclude(owner=self.user).order_by('-created', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected_ids)
+
+        response = self.client.get(feed_url, data={'page': 2})
+        self.assertEqual([post['id'] for post in response.data['results']], expected_ids[10:])
+
+        call_command('classify_celebrities', threshold=100, stdout=StringIO())
+        self.assertEqual(FeedEntry.objects.filter(author=celebrity, subscriber=self.user).count(), 5)
+
+    def test_celebrities_classified_by_subscribers_counter(self):
+        author = User.objects.get(username='test_user1')
+        Profile.objects.filter(user=author).update(subscribers_count=2)
+        call_command('classify_celebrities', threshold=2, stdout=StringIO())
+        self.assertTrue(Profile.objects.get(user=author).is_celebrity)
+
+        # fan-out reads the flag under the profile lock and leaves the post alone
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        self.client.force_authenticate(user=author)
+        self.client.post(reverse('post_create'), {"title": "celebrity", "body": "hi"})
+        self.assertFalse(FeedEntry.objects.filter(author=author).exists())
+
+
+@override_settings(FEED_CACHE_ENABLED=True)
+class CachedFeedApiTestCase(FeedApiTestCase):
+    """
+        Same feed scenarios, but pages are served from the feed cache
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        super().setUp()
+
+    def test_feed_cache_hit_and_invalidation(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        feed_url = reverse('feed')
+
+        response = self.client.get(feed_url)
+        self.assertEqual(response['X-Feed-Cache'], 'miss')
+        response = self.client.get(feed_url)
+        self.assertEqual(response['X-Feed-Cache'], 'hit')
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertEqual(stats.get_all()['feed_cache.hit'], 1)
+
+        # not followed author doesn't invalidate the page
+        self.client.force_authenticate(user=User.objects.get(username='test_user2'))
+        self.client.post(reverse('post_create'), {"title": "other", "body": "other"})
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(feed_url)
+        self.assertEqual(response['X-Feed-Cache'], 'hit')
+
+        self.client.force_authenticate(user=User.objects.get(username='test_user1'))
+        self.client.post(reverse('post_create'), {"title": "fresh", "body": "fresh"})
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(feed_url)
+        self.assertEqual(response['X-Feed-Cache'], 'miss')
+        self.assertEqual(response.data['results'][0]['title'], 'fresh')
+
+
+@override_settings(SUBSCRIPTIONS_CACHE_ENABLED=True, SUBSCRIPTIONS_STALE_CHECK_RATE=0)
+class SubscriptionsCacheFeedApiTestCase(FeedApiTestCase):
+    """
+        Same feed scenarios, but subscriptions are read from cached id sets
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        stats.reset()
+        subscriptions._local_cache = None
+        super().setUp()
+
+    def test_subscriptions_are_cached_and_refreshed(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        feed_url = reverse('feed')
+
+        response = self.client.get(feed_url)
+        self.assertEqual(len(response.data['results']), 4)
+        counters = stats.get_all()
+        # invalidated by subscribing, loaded from database once
+        self.assertEqual(counters['subscriptions.miss'], 1)
+        self.client.get(feed_url)
+        counters = stats.get_all()
+        self.assertEqual(counters['subscriptions.miss'], 1)
+        self.assertGreater(counters['subscriptions.local_hit'], 0)
+
+        # other process refreshed shared copy
+        subscriptions.get_local_cache().clear()
+        response = self.client.get(feed_url)
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertGreater(stats.get_all()['subscriptions.shared_hit'], 0)
+
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        response = self.client.get(feed_url)
+        self.assertEqual(response.data['results'], [])
+
+    def test_interleaved_toggles_leave_no_stale_set(self):
+        author = User.objects.get(username='test_user1')
+        self.assertEqual(subscriptions.get_subscription_ids(self.user.id), frozenset())
+        load = subscriptions.load_subscription_ids
+        unfollowed = []
+
+        def unfollow():
+            unfollowed.append(True)
+            self.user.profile.subscriptions.remove(author)
+            subscriptions.invalidate_subscription_ids(self.user.id)
+
+        def load_then_unfollow(user_id):
+            # request B commits between the load and the cache write of request A
+            ids = load(user_id)
+            if not unfollowed:
+                unfollow()
+            return ids
+
+        # double click: request A follows, request B unfollows
+        self.user.profile.subscriptions.add(author)
+        with mock.patch.object(subscriptions, 'load_subscription_ids', load_then_unfollow):
+            subscriptions.invalidate_subscription_ids(self.user.id)
+        if not unfollowed:
+            unfollow()
+
+        self.assertEqual(subscriptions.get_subscription_ids(self.user.id), frozenset())
+        subscriptions.get_local_cache().clear()
+        self.assertEqual(subscriptions.get_subscription_ids(self.user.id), frozenset())
+
+    @override_settings(SUBSCRIPTIONS_STALE_CHECK_RATE=1)
+    def test_stale_local_copy_is_counted_and_replaced(self):
+        author = User.objects.get(username='test_user1')
+        self.assertEqual(subscriptions.get_subscription_ids(self.user.id), frozenset())
+        self.assertEqual(stats.get_all()['subscriptions.miss'], 1)
+
+        # subscription made by other process: shared copy is fresh, local one is stale
+        self.user.profile.subscriptions.add(author)
+        cache.set(subscriptions.SUBSCRIPTIONS_KEY.format(self.user.id), frozenset([author.id]))
+
+        self.assertEqual(subscriptions.get_subscription_ids(self.user.id), frozenset([author.id]))
+        self.assertEqual(stats.get_all()['subscriptions.stale'], 1)
+        self.assertEqual(subscriptions.get_subscription_ids(self.user.id), frozenset([author.id]))
+        self.assertEqual(stats.get_all()['subscriptions.stale'], 1)
+
+
+class FeedQueryCostTestCase(APITestCase):
+    """
+        Feed cost must not depend on how many other users have seen the posts
+    """
+
+    def setUp(self) -> None:
+        self.author = User.objects.create_user(username='author', password='123qwer123!')
+        self.reader = User.objects.create_user(username='reader', password='123qwer123!')
+        self.reader.profile.subscriptions.add(self.author)
+        self.posts = Post.objects.bulk_create(
+            Post(title=f'post {i}', body='hi', owner=self.author) for i in range(5)
+        )
+        UserPostRelation.objects.create(user=self.reader, post=self.posts[0], seen=True)
+        self.client.force_authenticate(user=self.reader)
+
+    def get_feed(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('feed'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results'], context.captured_queries
+
+    def test_feed_cost_independent_of_other_readers(self):
+        results_before, queries_before = self.get_feed()
+
+        others = User.objects.bulk_create(User(username=f'other_{i}') for i in range(50))
+        UserPostRelation.objects.bulk_create(
+            UserPostRelation(user=other, post=post, seen=True) for other in others for post in self.posts
+        )
+
+        results_after, queries_after = self.get_feed()
+        self.assertEqual(results_before, results_after)
+        self.assertEqual(len(results_after), len(self.posts))
+        self.assertEqual(len(queries_before), len(queries_after))
+        self.assertEqual([post['seen'] for post in results_after].count(True), 1)
+
+        feed_sql = next(query['sql'] for query in queries_after if 'api_userpostrelation' in query['sql'])
+        self.assertIn('EXISTS', feed_sql)
+        self.assertNotIn('JOIN "api_userpostrelation"', feed_sql)
+
+    def test_duplicate_relation_rejected(self):
+        with self.assertRaises(IntegrityError):
+            UserPostRelation.objects.create(user=self.reader, post=self.posts[0], seen=True)
+
+
+@override_settings(SEEN_WRITE_BEHIND=True, SEEN_FLUSH_WORKER=False, SEEN_FLUSH_SIZE=1000)
+class WriteBehindFeedApiTestCase(FeedApiTestCase):
+    """
+        Same feed scenarios, but seen marks go through write-behind buffer
+    """
+
+    def setUp(self) -> None:
+        seen._buffer = None
+        super().setUp()
+
+    def tearDown(self) -> None:
+        seen._buffer = None
+
+    def test_seen_marks_are_written_in_bulk(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        post_ids = list(Post.objects.filter(owner__username='test_user1').values_list('id', flat=True))
+
+        self.client.post(reverse('mark_seen', args=[post_ids[0]]))
+        self.client.post(reverse('mark_seen_batch'), {'posts': post_ids[1:], 'seen': True}, format='json')
+        response = self.client.post(reverse('mark_seen', args=[post_ids[0]]))
+        self.assertFalse(response.data['seen'])
+        self.assertFalse(UserPostRelation.objects.filter(user=self.user).exists())
+
+        response = self.client.get(reverse('feed'), data={'seen': True})
+        self.assertEqual(len(response.data['results']), 3)
+
+        with CaptureQueriesContext(connection) as context:
+            seen.get_seen_buffer().flush()
+        # existing posts lookup, one insert for seen marks, one delete for unseen ones
+        self.assertEqual(len(context.captured_queries), 3)
+        self.assertEqual(
+            set(UserPostRelation.objects.filter(user=self.user).values_list('post_id', flat=True)),
+            set(post_ids[1:])
+        )
+        response = self.client.get(reverse('feed'), data={'seen': True})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_marks_of_deleted_posts_are_dropped(self):
+        post_ids = list(Post.objects.filter(owner__username='test_user1').values_list('id', flat=True))
+        other = User.objects.get(username='test_user2')
+        seen.set_seen(self.user.id, [post_ids[0]], True)
+        seen.set_seen(other.id, [post_ids[1]], True)
+        Post.objects.filter(id=post_ids[0]).delete()
+
+        seen.get_seen_buffer().flush()
+
+        self.assertEqual(len(seen.get_seen_buffer()), 0)
+        self.assertEqual(
+            list(UserPostRelation.objects.values_list('user_id', 'post_id')),
+            [(other.id, post_ids[1])]
+        )
+
+
+@override_settings(SEEN_STORAGE='compact', SEEN_COMPACT_THRESHOLD=2)
+class CompactSeenFeedApiTestCase(FeedApiTestCase):
+    """
+        Same feed scenarios, but seen marks are stored in compact per-user SeenSet
+    """
+
+    def test_seen_state_is_compacted(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        post_ids = sorted(Post.objects.filter(owner__username='test_user1').values_list('id', flat=True))
+
+        # seen: 1st, 3rd, 4th - third mark exceeds threshold and moves watermark up
+        self.client.post(reverse('mark_seen_batch'), {'posts': [post_ids[0], post_ids[2]], 'seen': True}, format='json')
+        self.client.post(reverse('mark_seen', args=[post_ids[3]]))
+
+        seen_set = SeenSet.objects.get(user=self.user)
+        self.assertEqual(seen_set.watermark, post_ids[3])
+        self.assertEqual(list(CompactSeenStorage.unpack(seen_set.unseen_ids)), [post_ids[1]])
+        self.assertFalse(UserPostRelation.objects.exists())
+
+        response = self.client.get(reverse('feed'), data={'seen': False})
+        self.assertEqual([post['id'] for post in response.data['results']], [post_ids[1]])
+
+        response = self.client.post(reverse('mark_seen', args=[post_ids[2]]))
+        self.assertFalse(response.data['seen'])
+        response = self.client.get(reverse('feed'), data={'seen': True})
+        self.assertEqual(sorted(post['id'] for post in response.data['results']), [post_ids[0], post_ids[3]])
+
+    def test_authors_followed_after_compaction(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user2']))
+        post_ids = sorted(Post.objects.filter(owner__username='test_user2').values_list('id', flat=True))
+        self.client.post(reverse('mark_seen_batch'), {'posts': post_ids, 'seen': True}, format='json')
+        watermark = SeenSet.objects.get(user=self.user).watermark
+        self.assertEqual(watermark, post_ids[-1])
+
+        # older posts of newly followed author are not covered by the watermark
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        old_ids = sorted(Post.objects.filter(owner__username='test_user1').values_list('id', flat=True))
+        self.assertLess(old_ids[-1], watermark)
+        response = self.client.get(reverse('feed'), data={'seen': False})
+        self.assertEqual(sorted(post['id'] for post in response.data['results']), old_ids)
+
+        response = self.client.post(reverse('mark_seen', args=[old_ids[0]]))
+        self.assertTrue(response.data['seen'])
+        response = self.client.get(reverse('feed'), data={'seen': False})
+        self.assertEqual(sorted(post['id'] for post in response.data['results']), old_ids[1:])
+
+    @override_settings(SEEN_COMPACT_MAX_UNSEEN=0)
+    def test_compaction_skipped_over_unseen_limit(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        post_ids = sorted(Post.objects.filter(owner__username='test_user1').values_list('id', flat=True))
+        self.client.post(reverse('mark_seen_batch'), {'posts': [post_ids[0], *post_ids[2:]], 'seen': True},
+                         format='json')
+
+        seen_set = SeenSet.objects.get(user=self.user)
+        self.assertEqual(seen_set.watermark, 0)
+        self.assertEqual(seen_set.unseen_ids, b'')
+        self.assertEqual(seen_set.skipped_at, 3)
+        response = self.client.get(reverse('feed'), data={'seen': False})
+        self.assertEqual([post['id'] for post in response.data['results']], [post_ids[1]])
+
+    @override_settings(SEEN_COMPACT_RETRY=3, SEEN_COMPACT_MAX_SEEN=6)
+    def test_skipped_compactions_back_off_and_spill(self):
+        author = User.objects.get(username='test_user1')
+        Post.objects.bulk_create(Post(owner=author, title=f'post {i}', body='body') for i in range(26))
+        post_ids = sorted(Post.objects.filter(owner=author).values_list('id', flat=True))
+        # every third post: author never gets covered, every compaction is skipped
+        marked = post_ids[::3]
+        storage = CompactSeenStorage()
+
+        queries = []
+        for post_id in marked:
+            with CaptureQueriesContext(connection) as context:
+                storage.write(self.user.id, [post_id], True)
+            queries.append(len(context.captured_queries))
+
+        # compaction tried at 3rd mark, retried at 7th, where the list spills to rows
+        plain = queries[1]
+        self.assertGreater(queries[2], plain)
+        self.assertEqual(queries[3:6], [plain] * 3)
+        spilled = queries[7]
+        self.assertEqual(queries[7:], [spilled] * len(queries[7:]))
+
+        seen_set = SeenSet.objects.get(user=self.user)
+        self.assertTrue(seen_set.spilled)
+        self.assertEqual(seen_set.seen_ids, b'')
+        self.assertEqual(
+            set(UserPostRelation.objects.filter(user=self.user).values_list('post_id', flat=True)), set(marked)
+        )
+        self.assertTrue(storage.is_seen(self.user.id, marked[0]))
+        self.assertFalse(storage.is_seen(self.user.id, post_ids[1]))
+
+        self.assertFalse(storage.toggle(self.user.id, marked[0]))
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('subscribe_on_user', args=['test_user1']))
+        response = self.client.get(reverse('feed'), data={'seen': True, 'page_size': 100})
+        self.assertEqual(sorted(post['id'] for post in response.data['results']), marked[1:])
+
+    def test_convert_seen_relations(self):
+        post_ids = list(Post.objects.filter(owner__username='test_user1').values_list('id', flat=True))
+        UserPostRelation.objects.bulk_create(
+            UserPostRelation(user=self.user, post_id=post_id, seen=True) for post_id in post_ids[:2]
+        )
+
+        call_command('convert_seen_relations', '--delete-rows', stdout=StringIO())
+
+        self.assertFalse(UserPostRelation.objects.exists())
+        storage = CompactSeenStorage()
+        self.assertTrue(storage.is_seen(self.user.id, post_ids[0]))
+        self.assertTrue(storage.is_seen(self.user.id, post_ids[1]))
+        self.assertFalse(storage.is_seen(self.user.id, post_ids[2]))
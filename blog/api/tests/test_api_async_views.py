@@ -0,0 +1,158 @@
+import asyncio
+import json
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core import signals
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+
+from api.async_views import AsyncFeedView, AsyncUserListView, AsyncUserPostsListView
+from api.models import Post
+from api.streaming import AsyncStreamingHttpResponse, ASGIHandler
+from api.tests import test_api_api as sync_tests
+from api.views import FeedView
+from auth.serializers import MyTokenObtainPairSerializer
+
+ASYNC_URLCONF = 'api.tests.async_urls'
+
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+class AsyncUserListApiTestCase(sync_tests.UserListApiTestCase):
+    """
+        User list scenarios served by the async view
+    """
+
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+class AsyncUserPostsListApiTestCase(sync_tests.UserPostsListApiTestCase):
+    """
+        User posts scenarios served by the async view
+    """
+
+    @override_settings(STREAM_CHUNK_SIZE=1)
+    def test_ndjson_rows_fetched_while_streaming(self):
+        request = APIRequestFactory().get(reverse('users_posts', args=[self.username]),
+                                          HTTP_ACCEPT='application/x-ndjson')
+
+        async def read(response):
+            return [part async for part in response]
+
+        response = async_to_sync(AsyncUserPostsListView.as_view())(request, username=self.username)
+        # the view ran only the author check, the rows query is read chunk by chunk while streaming
+        with CaptureQueriesContext(connection) as context:
+            parts = async_to_sync(read)(response)
+        queries = len(context.captured_queries)
+
+        self.assertIsInstance(response, AsyncStreamingHttpResponse)
+        self.assertEqual(len(parts), self.user.posts.count())
+        self.assertEqual(1, queries)
+        expected = self.client.get(reverse('users_posts', args=[self.username]), HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(b''.join(parts), b''.join(expected.streaming_content))
+
+    def test_asgi_handler_sends_chunks(self):
+        # response.close() sends request_finished, it must not close the test transaction
+        signals.request_finished.disconnect(close_old_connections)
+        self.addCleanup(signals.request_finished.connect, close_old_connections)
+
+        async def rows():
+            for index in range(3):
+                yield f'{index}\n'
+
+        async def scenario():
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+            response = AsyncStreamingHttpResponse(rows(), content_type='application/x-ndjson')
+            await ASGIHandler().send_response(response, send)
+            return messages
+
+        messages = async_to_sync(scenario)()
+        self.assertEqual(200, messages[0]['status'])
+        self.assertIn((b'Content-Type', b'application/x-ndjson'), messages[0]['headers'])
+        self.assertEqual([b'0\n', b'1\n', b'2\n', b''], [message.get('body', b'') for message in messages[1:]])
+        self.assertFalse(messages[-1].get('more_body', False))
+
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF)
+class AsyncFeedApiTestCase(sync_tests.FeedApiTestCase):
+    """
+        Feed scenarios served by the async view
+    """
+
+    @override_settings(CONDITIONAL_GET=True)
+    def test_same_pages_as_sync_view(self):
+        self.client.force_authenticate(user=self.user)
+        for username in ('test_user1', 'test_user2'):
+            self.client.post(reverse('subscribe_on_user', args=[username]))
+        self.client.post(reverse('mark_seen', args=[Post.objects.first().id]))
+
+        factory = APIRequestFactory()
+        for params in ({}, {'page': 2}, {'seen': 'false'}, {'pagination': 'cursor'}, {'links': 'none'}):
+            responses = []
+            for view in (FeedView.as_view(), async_to_sync(AsyncFeedView.as_view())):
+                request = factory.get(reverse('feed'), data=params)
+                force_authenticate(request, user=self.user)
+                responses.append(view(request))
+            sync_response, async_response = responses
+            self.assertEqual(sync_response.status_code, async_response.status_code)
+            self.assertEqual(sync_response.data, async_response.data)
+            self.assertEqual(sync_response['ETag'], async_response['ETag'])
+
+    @override_settings(CONDITIONAL_GET=True)
+    def test_not_modified_without_queryset(self):
+        self.client.force_authenticate(user=self.user)
+        etag = self.client.get(reverse('feed'))['ETag']
+
+        with mock.patch.object(AsyncFeedView, 'aget_queryset') as aget_queryset:
+            response = self.client.get(reverse('feed'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        aget_queryset.assert_not_called()
+
+    def test_token_authentication(self):
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer forged')
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF, FEED_FANOUT_ON_WRITE=True)
+class AsyncFanOutFeedApiTestCase(sync_tests.FanOutFeedApiTestCase):
+    """
+        Hybrid feed (inbox and celebrity parts are read concurrently) served by the async view
+    """
+
+
+@override_settings(ROOT_URLCONF=ASYNC_URLCONF, FEED_CACHE_ENABLED=True)
+class AsyncCachedFeedApiTestCase(sync_tests.CachedFeedApiTestCase):
+    """
+        Cached feed served by the async view, through async cache API
+    """
+
+
+class AsyncViewsTestCase(APITestCase):
+    def test_views_are_coroutines(self):
+        for view_class in (AsyncFeedView, AsyncUserListView, AsyncUserPostsListView):
+            self.assertTrue(asyncio.iscoroutinefunction(view_class.as_view()))
+
+
+class LoadTestCommandTestCase(APITestCase):
+    def test_run_in_process(self):
+        for server in ('wsgi', 'asgi'):
+            out = StringIO()
+            call_command('loadtest', '/api/profiles_list/?ordering=username', run=server, requests=4,
+                         concurrency=2, host='testserver', stdout=out)
+            result = json.loads(out.getvalue())
+            self.assertEqual(result['statuses'], {'200': 4})
+            self.assertGreater(result['throughput'], 0)
@@ -0,0 +1,332 @@
+import asyncio
+import json
+import threading
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import User
+from django.core import signals
+from django.db import close_old_connections
+from django.test import SimpleTestCase, override_settings
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import events
+from api.events import RESET, EventHub, LocalEventBackend
+from api.models import Post
+from api.sse import EventsRouter, FeedEventsApp
+from api.views import PostCreateView, SubscribeView
+from auth import authentication, denylist
+from auth.serializers import MyTokenObtainPairSerializer
+
+EVENTS_PATH = '/api/feed/events/'
+
+
+def http_scope(path=EVENTS_PATH, method='GET', query='', headers=()):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver')] + [(name.encode(), value.encode()) for name, value in headers],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+
+
+def parse_events(body):
+    """
+        [(event id, event name, data)] of SSE body, comments are skipped
+    """
+    parsed = []
+    for block in body.decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            parsed.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return parsed
+
+
+class RecordingBackend(LocalEventBackend):
+    def __init__(self):
+        super().__init__()
+        self.channels = set()
+
+    def subscribe(self, channel):
+        self.channels.add(channel)
+
+    def unsubscribe(self, channel):
+        self.channels.discard(channel)
+
+
+class SlowEventHub(EventHub):
+    def __init__(self, *args, **kwargs):
+        # widens the window between the None check and assignment
+        time.sleep(0.05)
+        super().__init__(*args, **kwargs)
+
+
+class EventHubTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.backend = RecordingBackend()
+        self.hub = EventHub(self.backend, queue_size=3, max_connections=2)
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_one_hub_per_process(self):
+        events._hub = None
+        self.addCleanup(setattr, events, '_hub', None)
+        hubs = []
+        with mock.patch.object(events, 'EventHub', SlowEventHub):
+            threads = [threading.Thread(target=lambda: hubs.append(events.get_event_hub())) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(4, len(hubs))
+        self.assertEqual(1, len({id(hub) for hub in hubs}))
+
+    def test_fan_out_to_followers(self):
+        async def scenario():
+            first = self.hub.connect([1, 2])
+            second = self.hub.connect([2])
+            self.hub.publish(1, {'event': 'post', 'data': {'id': 10}})
+            self.hub.publish(2, {'event': 'post', 'data': {'id': 11}})
+            self.hub.publish(3, {'event': 'post', 'data': {'id': 12}})
+            # delivery goes through call_soon_threadsafe
+            await asyncio.sleep(0)
+            return [[connection.queue.get_nowait()['data']['id'] for _ in range(connection.queue.qsize())]
+                    for connection in (first, second)]
+
+        self.assertEqual([[10, 11], [11]], self.run_async(scenario()))
+        self.assertEqual({'author:1', 'author:2'}, self.backend.channels)
+
+    def test_overflow_replaced_by_reset(self):
+        async def scenario():
+            connection = self.hub.connect([1])
+            for post_id in range(5):
+                self.hub.publish(1, {'event': 'post', 'data': {'id': post_id}})
+            await asyncio.sleep(0)
+            return [connection.queue.get_nowait() for _ in range(connection.queue.qsize())]
+
+        # publisher never blocks: backlog is dropped, client is told to reload and gets newer events
+        self.assertEqual([RESET, {'event': 'post', 'data': {'id': 4}}], self.run_async(scenario()))
+
+    def test_max_connections(self):
+        async def scenario():
+            connections = [self.hub.connect([1]) for _ in range(3)]
+            self.assertIsNone(connections[2])
+            self.hub.disconnect(connections[0])
+            self.assertIsNotNone(self.hub.connect([1]))
+
+        self.run_async(scenario())
+        self.assertEqual(2, len(self.hub))
+
+    def test_update_and_disconnect_unsubscribe(self):
+        async def scenario():
+            connection = self.hub.connect([1, 2])
+            self.hub.update(connection, [2, 3])
+            self.assertEqual({'author:2', 'author:3'}, self.backend.channels)
+            self.hub.disconnect(connection)
+
+        self.run_async(scenario())
+        self.assertEqual(set(), self.backend.channels)
+        self.assertEqual(0, len(self.hub))
+
+
+@override_settings(FEED_EVENTS_PATH=EVENTS_PATH, FEED_EVENTS_HEARTBEAT=30.0, FEED_EVENTS_REPLAY_LIMIT=2,
+                   TOKEN_DENYLIST_REFRESH_WORKER=False)
+class FeedEventsTestCase(APITestCase):
+    """
+        Stream runs under async_to_sync, so its database hops land in the test thread and transaction
+    """
+
+    def setUp(self) -> None:
+        events._hub = None
+        denylist._denylist = None
+        authentication._active_cache = None
+        # as the test client does around requests: closing connections would end the test transaction.
+        # The client reconnects the handlers afterwards, so views are called through the request factory
+        signals.request_started.disconnect(close_old_connections)
+        signals.request_finished.disconnect(close_old_connections)
+        self.factory = APIRequestFactory()
+        self.author = User.objects.create_user(username='author', password='password')
+        self.other = User.objects.create_user(username='other', password='password')
+        self.user = User.objects.create_user(username='reader', password='password')
+        self.subscribe('author')
+        self.token = str(MyTokenObtainPairSerializer.get_token(self.user).access_token)
+
+    def tearDown(self) -> None:
+        events._hub = None
+        denylist._denylist = None
+        signals.request_started.connect(close_old_connections)
+        signals.request_finished.connect(close_old_connections)
+
+    def subscribe(self, username):
+        request = self.factory.put(reverse('subscribe_on_user', args=[username]))
+        force_authenticate(request, user=self.user)
+        SubscribeView.as_view()(request, username=username)
+
+    def publish(self, owner, title):
+        request = self.factory.post(reverse('post_create'), {'title': title, 'body': 'body'})
+        force_authenticate(request, user=owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = PostCreateView.as_view()(request)
+        return response.data['id']
+
+    def open(self, query='', headers=()):
+        return ApplicationCommunicator(FeedEventsApp(), http_scope(query=query, headers=headers))
+
+    def test_requires_token(self):
+        async def scenario():
+            communicator = self.open()
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            await communicator.receive_output(5)
+            return start['status']
+
+        self.assertEqual(401, async_to_sync(scenario)())
+
+        async def forged():
+            communicator = self.open(headers=[('authorization', 'Bearer forged')])
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            return (await communicator.receive_output(5))['status']
+
+        self.assertEqual(401, async_to_sync(forged)())
+
+    def test_new_posts_of_followed_authors_are_pushed(self):
+        async def scenario():
+            communicator = self.open(headers=[('authorization', f'Bearer {self.token}')])
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            start = await communicator.receive_output(5)
+            self.assertEqual(200, start['status'])
+            self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+
+            await sync_to_async(self.publish)(self.other, 'not followed')
+            post_id = await sync_to_async(self.publish)(self.author, 'followed')
+            body = (await communicator.receive_output(5))['body']
+
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(5)
+            return post_id, body
+
+        post_id, body = async_to_sync(scenario)()
+        self.assertEqual(
+            [(str(post_id), 'post', {'id': post_id, 'title': 'followed', 'owner': 'author',
+                                      'created': Post.objects.get(id=post_id).created.isoformat()
+                                      .replace('+00:00', 'Z')})],
+            parse_events(body)
+        )
+        self.assertEqual(0, len(events.get_event_hub()))
+
+    def test_replay_after_reconnect(self):
+        first = self.publish(self.author, 'first')
+        second = self.publish(self.author, 'second')
+        self.publish(self.other, 'not followed')
+
+        async def scenario(last_event_id):
+            communicator = self.open(query=f'token={self.token}', headers=[('last-event-id', str(last_event_id))])
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            await communicator.receive_output(5)
+            received = []
+            while not communicator.output_queue.empty() or not received:
+                received.append((await communicator.receive_output(5))['body'])
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(5)
+            return parse_events(b''.join(received))
+
+        self.assertEqual([(str(second), 'post')], [event[:2] for event in async_to_sync(scenario)(first)])
+        # too many missed posts (more than FEED_EVENTS_REPLAY_LIMIT): client reloads the feed
+        self.publish(self.author, 'third')
+        self.assertEqual([(None, 'reset', {})], async_to_sync(scenario)(first - 1))
+
+    @override_settings(FEED_EVENTS_HEARTBEAT=0.05)
+    def test_heartbeat_refreshes_subscriptions(self):
+        async def scenario():
+            communicator = self.open(headers=[('authorization', f'Bearer {self.token}')])
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            await communicator.receive_output(5)
+            await sync_to_async(self.subscribe)('other')
+
+            # heartbeat goes out after subscriptions were re-read
+            heartbeat = (await communicator.receive_output(5))['body']
+            post_id = await sync_to_async(self.publish)(self.other, 'now followed')
+            body = b''
+            while b'event: post' not in body:
+                body += (await communicator.receive_output(5))['body']
+
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(5)
+            return heartbeat, post_id, body
+
+        heartbeat, post_id, body = async_to_sync(scenario)()
+        self.assertTrue(heartbeat.startswith(b':'))
+        self.assertEqual([str(post_id)], [event[0] for event in parse_events(body)])
+
+    def test_events_deduplicated_not_dropped_out_of_order(self):
+        first = self.publish(self.author, 'first')
+        second = self.publish(self.author, 'second')
+
+        async def scenario():
+            communicator = self.open(headers=[('authorization', f'Bearer {self.token}'),
+                                              ('last-event-id', str(first))])
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            await communicator.receive_output(5)
+            replayed = (await communicator.receive_output(5))['body']
+
+            hub = events.get_event_hub()
+            # replayed post published again (it was committed while replay ran), then commits out of id order
+            for post_id in (second, second + 10, second + 5):
+                hub.publish(self.author.id, {'event': 'post', 'data': {'id': post_id}})
+            live = b''
+            while live.count(b'event: post') < 2:
+                live += (await communicator.receive_output(5))['body']
+
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(5)
+            return parse_events(replayed), parse_events(live)
+
+        replayed, live = async_to_sync(scenario)()
+        self.assertEqual([str(second)], [event[0] for event in replayed])
+        self.assertEqual([str(second + 10), str(second + 5)], [event[0] for event in live])
+
+    @override_settings(FEED_EVENTS_HEARTBEAT=0.05)
+    def test_stream_closed_when_token_revoked(self):
+        async def scenario():
+            communicator = self.open(headers=[('authorization', f'Bearer {self.token}')])
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            await communicator.receive_output(5)
+            heartbeat = await communicator.receive_output(5)
+            await sync_to_async(denylist.revoke_tokens)([AccessToken(self.token)])
+
+            message = heartbeat
+            while message.get('more_body'):
+                message = await communicator.receive_output(5)
+            await communicator.wait(5)
+            return message
+
+        self.assertEqual({'type': 'http.response.body', 'body': b'', 'more_body': False}, async_to_sync(scenario)())
+        self.assertEqual(0, len(events.get_event_hub()))
+
+    @override_settings(FEED_EVENTS_MAX_CONNECTIONS=0)
+    def test_connection_limit(self):
+        async def scenario():
+            communicator = self.open(headers=[('authorization', f'Bearer {self.token}')])
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            return (await communicator.receive_output(5))['status']
+
+        self.assertEqual(503, async_to_sync(scenario)())
+
+    def test_router(self):
+        async def django_application(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def scenario(method, path):
+            router = EventsRouter(django_application, FeedEventsApp())
+            communicator = ApplicationCommunicator(router, http_scope(path=path, method=method))
+            await communicator.send_input({'type': 'http.request', 'body': b''})
+            return (await communicator.receive_output(5))['status']
+
+        self.assertEqual(204, async_to_sync(scenario)('GET', '/api/feed/'))
+        self.assertEqual(405, async_to_sync(scenario)('POST', EVENTS_PATH))
@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.db.models import Value
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from api.fast_serializers import ValuesSerializer
+from api.models import Post
+from api.serializers import PostCreateSerializer, PostDetailSerializer, UserPostSerializer
+
+
+class ValuesSerializerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='test_user')
+        Post.objects.bulk_create(Post(title=f'post № {i}', body='hi', owner=self.user) for i in range(3))
+        self.context = {'request': APIRequestFactory().get('/api/feed/')}
+        self.posts = Post.objects.annotate(seen=Value(True)).order_by('id')
+
+    def assertSameOutput(self, serializer_class):
+        expected = serializer_class(self.posts, many=True, context=self.context).data
+
+        serializer = ValuesSerializer(serializer_class, context=self.context)
+        actual = serializer.serialize_many(self.posts.values(*serializer.lookups))
+
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_post_detail_output_is_identical(self):
+        self.assertSameOutput(PostDetailSerializer)
+
+    def test_user_post_output_is_identical(self):
+        self.assertSameOutput(UserPostSerializer)
+
+    def test_post_create_output_is_identical(self):
+        self.assertSameOutput(PostCreateSerializer)
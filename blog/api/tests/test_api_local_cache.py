@@ -0,0 +1,29 @@
+from django.test import SimpleTestCase
+
+from api.local_cache import TTLCache
+
+
+class TTLCacheTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.now = 0
+        self.cache = TTLCache(maxsize=2, ttl=10, timer=lambda: self.now)
+
+    def test_entries_expire(self):
+        self.cache.set('a', 1)
+        self.now = 9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('c'), 3)
+
+        self.cache.delete('a')
+        self.assertEqual(self.cache.get('a', 'missing'), 'missing')
@@ -0,0 +1,60 @@
+import datetime
+from collections import OrderedDict
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api import renderers
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+
+
+class FastJSONRendererTestCase(SimpleTestCase):
+    data = OrderedDict([
+        ('next', 'http://testserver/api/feed/?page=2'),
+        ('previous', None),
+        ('results', [{
+            'id': 1,
+            'title': 'post № 1  ',
+            'created': datetime.datetime(2022, 12, 1, 10, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'local': timezone.make_aware(datetime.datetime(2022, 12, 1, 10, 30)),
+            'day': datetime.date(2022, 12, 1),
+            'rating': Decimal('4.50'),
+            'message': gettext_lazy('Not found.'),
+            'seen': False,
+        }]),
+    ])
+
+    def test_same_output_as_json_renderer(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_stdlib_fallback(self):
+        big = {'id': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(big), JSONRenderer().render(big))
+
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_indent_is_left_to_json_renderer(self):
+        media_type = 'application/json; indent=4'
+        self.assertEqual(
+            FastJSONRenderer().render(self.data, media_type),
+            JSONRenderer().render(self.data, media_type),
+        )
+
+
+class FastJSONParserTestCase(SimpleTestCase):
+    def test_same_result_as_json_parser(self):
+        body = '{"posts": [1, 2, 3], "seen": true, "title": "пост"}'.encode()
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+
+    def test_invalid_json(self):
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"posts": [1, 2'))
@@ -0,0 +1,42 @@
+from django.test import SimpleTestCase
+
+from api.seen_buffer import SeenWriteBuffer
+
+
+class SeenWriteBufferTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.written = []
+        self.buffer = SeenWriteBuffer(writer=self.written.append, max_size=3, start_worker=False)
+
+    def test_marks_are_coalesced(self):
+        self.buffer.put(1, [10, 11], True)
+        self.buffer.put(1, [10], False)
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(self.buffer.get(1, 10), False)
+        self.assertEqual(self.buffer.pending_for(1), ({11}, {10}))
+        self.assertIsNone(self.buffer.get(2, 10))
+
+        self.buffer.flush()
+        self.assertEqual(self.written, [{1: {10: False, 11: True}}])
+        self.assertEqual(len(self.buffer), 0)
+        self.assertIsNone(self.buffer.get(1, 10))
+
+    def test_flush_on_size_threshold(self):
+        self.buffer.put(1, [10, 11], True)
+        self.assertEqual(self.written, [])
+        self.buffer.put(2, [10], True)
+        self.assertEqual(self.written, [{1: {10: True, 11: True}, 2: {10: True}}])
+
+    def test_failed_flush_keeps_marks(self):
+        def failing_writer(changes):
+            raise RuntimeError('db is down')
+
+        self.buffer.writer = failing_writer
+        self.buffer.put(1, [10], True)
+        with self.assertRaises(RuntimeError), self.assertLogs('api.seen_buffer', level='ERROR'):
+            self.buffer.flush()
+        self.assertEqual(self.buffer.get(1, 10), True)
+
+        self.buffer.writer = self.written.append
+        self.buffer.flush()
+        self.assertEqual(self.written, [{1: {10: True}}])
@@ -1,15 +1,33 @@
+from django.conf import settings
 from django.urls import path
 
+from .async_views import AsyncFeedView, AsyncUserListView, AsyncUserPostsListView
 from .views import (
     PostCreateView, UserListView, UserPostsListView,
-    SubscribeView, FeedView, PostMarkAsSeenView
+    SubscribeView, BulkSubscribeView, FeedView,
+    PostMarkAsSeenView, PostBatchMarkAsSeenView
 )
 
-urlpatterns = [
-    path('post_create/', PostCreateView.as_view(), name='post_create'),
-    path('profiles_list/', UserListView.as_view(), name='profiles_list'),
-    path('<str:username>/posts/', UserPostsListView.as_view(), name='users_posts'),
-    path('<str:username>/subscribe/', SubscribeView.as_view(), name='subscribe_on_user'),
-    path('post/<int:post_id>/seen/', PostMarkAsSeenView.as_view(),  name='mark_seen'),
-    path('feed/', FeedView.as_view(), name='feed')
-]
+
+def get_urlpatterns(async_views=False):
+    """
+        async_views: feed, user list and user posts are served by api.async_views
+    """
+    if async_views:
+        feed_view, user_list_view, user_posts_view = AsyncFeedView, AsyncUserListView, AsyncUserPostsListView
+    else:
+        feed_view, user_list_view, user_posts_view = FeedView, UserListView, UserPostsListView
+
+    return [
+        path('post_create/', PostCreateView.as_view(), name='post_create'),
+        path('profiles_list/', user_list_view.as_view(), name='profiles_list'),
+        path('<str:username>/posts/', user_posts_view.as_view(), name='users_posts'),
+        path('<str:username>/subscribe/', SubscribeView.as_view(), name='subscribe_on_user'),
+        path('subscribe/', BulkSubscribeView.as_view(), name='subscribe_bulk'),
+        path('post/<int:post_id>/seen/', PostMarkAsSeenView.as_view(),  name='mark_seen'),
+        path('post/seen/', PostBatchMarkAsSeenView.as_view(), name='mark_seen_batch'),
+        path('feed/', feed_view.as_view(), name='feed')
+    ]
+
+
+urlpatterns = get_urlpatterns(settings.ASYNC_VIEWS)
@@ -1,26 +1,41 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Count, Case, When
-from django.http import Http404
+from django.db import transaction
+from django.db.models import F, Q
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter
-from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView
+from rest_framework.generics import CreateAPIView, ListAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from auth.authentication import DenylistJWTAuthentication, TokenUserAuthentication
+
+from .cache import feed_page_key, get_feed_page, set_feed_page, bump_author_version, bump_user_version
+from .conditional import feed_etag, user_posts_etag
+from .events import publish_post
+from .fast_serializers import ValuesSerializer, values_queryset
+from .feed import MergedFeed, get_feed_queryset, fan_out_post, backfill_subscription, evict_subscription
 from .filters import PostSeenFilter
-from .models import Post, Profile, UserPostRelation
-from .paginators import CustomPageNumberPagination
+from .links import LinkBuilder, get_links_mode
+from .models import Post, Profile, change_subscription_counts
+from .paginators import KeysetPagination, SwitchablePagination, UserKeysetPagination
+from .renderers import NDJSONRenderer
+from .seen import set_seen, toggle_seen
 from .serializers import (
+    BulkSubscribeSerializer,
     PostCreateSerializer,
-    ProfileSerializer,
     UserListSerializer,
-    UserPostsSerializer,
-    PostDetailSerializer
+    UserPostSerializer,
+    PostDetailSerializer,
+    PostSeenBatchSerializer
 )
+from .subscriptions import invalidate_subscription_ids
 
 
 class BaseJWTAuthenticationView(APIView):
@@ -28,7 +43,91 @@ class BaseJWTAuthenticationView(APIView):
         Inheritance view for authentication require endpoints
     """
     permission_classes = [IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [DenylistJWTAuthentication]
+
+
+class TokenUserAuthenticationView(BaseJWTAuthenticationView):
+    """
+        Inheritance view for hot endpoints which need only id and username
+        of the current user: no User query per request
+    """
+    authentication_classes = [TokenUserAuthentication]
+
+
+class ConditionalGetMixin:
+    """
+        Conditional GET (CONDITIONAL_GET setting): validator from `get_etag` is computed after
+        authentication but before the queryset runs. Matching If-None-Match gets
+        304 Not Modified without querying posts and serializing them.
+    """
+
+    def get_etag(self, request):
+        """
+            Validator of the requested list, None answers without conditional handling
+        """
+        return None
+
+    def get(self, request, *args, **kwargs):
+        if not settings.CONDITIONAL_GET:
+            return super().get(request, *args, **kwargs)
+
+        etag = self.get_etag(request)
+        not_modified = self.get_not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return self.set_etag(super().get(request, *args, **kwargs), etag)
+
+    @staticmethod
+    def get_not_modified(request, etag):
+        """
+            304 (or 412) response when the client's copy matches `etag`, otherwise None
+        """
+        if etag is None:
+            return None
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None and not_modified.status_code == 304:
+            not_modified['ETag'] = etag
+        return not_modified
+
+    @staticmethod
+    def set_etag(response, etag):
+        if etag is not None and response.status_code == 200:
+            response['ETag'] = etag
+            # clients have to revalidate every time
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+class PostLinksMixin:
+    """
+        Resolves mark_seen URL pattern once per request for every post of the response.
+        ?links=relative gives links without scheme and host, ?links=none omits them.
+    """
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['mark_seen_links'] = LinkBuilder('mark_seen', request=self.request,
+                                                 mode=get_links_mode(self.request))
+        return context
+
+
+class FastPostListMixin:
+    """
+        Serializes post pages with precompiled ValuesSerializer straight from
+        queryset.values() rows (FAST_POST_SERIALIZER setting). Output is the same.
+    """
+
+    def get_fast_serializer(self):
+        return ValuesSerializer(self.get_serializer_class(), context=self.get_serializer_context())
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_POST_SERIALIZER:
+            return super().list(request, *args, **kwargs)
+
+        serializer = self.get_fast_serializer()
+        queryset = values_queryset(self.filter_queryset(self.get_queryset()), serializer.lookups)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(serializer.serialize_many(page))
 
 
 class PostCreateView(CreateAPIView, BaseJWTAuthenticationView):
@@ -39,68 +138,208 @@ class PostCreateView(CreateAPIView, BaseJWTAuthenticationView):
     serializer_class = PostCreateSerializer
 
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
+        post = serializer.save(owner=self.request.user)
+        if settings.FEED_FANOUT_ON_WRITE:
+            fan_out_post(post)
+        bump_author_version(post.owner_id)
+        # open event streams of followers get the post once it is visible to their replay query
+        transaction.on_commit(lambda: publish_post(post))
 
 
 class UserListView(ListAPIView):
     """
         User list endpoint. Allows to order by username and posts_count. \n
+        Keyset pagination - 10 users per page, follow next/previous links. \n
+        Profile contains first subscriptions and total subscriptions count. \n
         Examples: \n
             both filters:  http://127.0.0.1:8000/api/profiles_list/?ordering=-posts_count,-username
             one ascending:  http://127.0.0.1:8000/api/profiles_list/?ordering=posts_count
             without: http://127.0.0.1:8000/api/profiles_list/
     """
     queryset = User.objects.select_related('profile') \
-        .prefetch_related('posts') \
-        .annotate(posts_count=Count('posts')) \
-        .prefetch_related('profile__subscriptions')
+        .only('id', 'username', 'profile__id', 'profile__user_id', 'profile__subscriptions_count') \
+        .annotate(posts_count=F('profile__posts_count'))
 
     filter_backends = [OrderingFilter]
     serializer_class = UserListSerializer
+    pagination_class = UserKeysetPagination
     ordering_fields = ['username', 'posts_count']
+    subscriptions_preview_size = 5
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        return self.get_page_response(page, self.get_subscriptions_preview(page))
 
+    def get_subscriptions_preview(self, page):
+        return Profile.objects.subscriptions_preview(
+            [user.profile.id for user in page], self.subscriptions_preview_size
+        )
 
-class UserPostsListView(RetrieveAPIView):
+    def get_page_response(self, page, preview):
+        context = dict(self.get_serializer_context(), subscriptions_preview=preview)
+        serializer = self.get_serializer_class()(page, many=True, context=context)
+        return self.get_paginated_response(serializer.data)
+
+
+class UserPostsListView(ConditionalGetMixin, PostLinksMixin, FastPostListMixin, ListAPIView):
     """
         List of user's detailed posts. Ordered by post creation time.
-        Starting with the newest ones
+        Starting with the newest ones. \n
+        Keyset pagination - 10 posts per page, follow next/previous links. \n
+        With format=ndjson (or Accept: application/x-ndjson) all posts are streamed
+        one JSON object per line, memory stays bounded for prolific authors. \n
+        Usage examples: \n
+            first page:    http://127.0.0.1:8000/api/admin/posts/
+            stream all posts: http://127.0.0.1:8000/api/admin/posts/?format=ndjson
+            relative links: http://127.0.0.1:8000/api/admin/posts/?links=relative
+            without links: http://127.0.0.1:8000/api/admin/posts/?links=none
+        Responses carry ETag, repeated request with If-None-Match gets 304 when nothing changed. \n
     """
-    serializer_class = UserPostsSerializer
-    lookup_field = 'username'
+    serializer_class = UserPostSerializer
+    pagination_class = KeysetPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+
+    def get_etag(self, request):
+        return user_posts_etag(request, self.kwargs['username'])
 
     def get_queryset(self):
-        return User.objects.filter(username=self.kwargs['username']).prefetch_related('posts')
+        user = get_object_or_404(User.objects.only('id'), username=self.kwargs['username'])
+        return Post.objects.filter(owner_id=user.id)
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != NDJSONRenderer.format:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.get_queryset().order_by(*KeysetPagination.ordering)
+        if settings.FAST_POST_SERIALIZER:
+            serializer = self.get_fast_serializer()
+            queryset = queryset.values(*serializer.lookups)
+        else:
+            serializer = self.get_serializer()
+
+        def stream():
+            for post in queryset.iterator(chunk_size=settings.STREAM_CHUNK_SIZE):
+                yield NDJSONRenderer.render_row(serializer.to_representation(post))
+
+        return StreamingHttpResponse(stream(), content_type=NDJSONRenderer.media_type)
 
 
 class SubscribeView(BaseJWTAuthenticationView):
     """
         Subscribe/unsubscribe endpoint. Require authentication.
         Request param is username you want to subscribe on.
-        Subscribes you if u were not before, otherwise unsubscribes you.
+        POST subscribes you if u were not before, otherwise unsubscribes you.
+        PUT subscribes, DELETE unsubscribes, both are idempotent.
+        Returns new state and subscription counters. \n
         Example: \n
             http://127.0.0.1:8000/api/admin/subscribe/
 
     """
 
     def post(self, request, username=None):
-        current_profile = Profile.objects.get(user=request.user)
+        return self.change_subscription(request, username, subscribe=None)
+
+    def put(self, request, username=None):
+        return self.change_subscription(request, username, subscribe=True)
+
+    def delete(self, request, username=None):
+        return self.change_subscription(request, username, subscribe=False)
 
+    def change_subscription(self, request, username, subscribe):
+        """
+            subscribe=None toggles. Edge is inserted (on conflict - nothing) or deleted
+            in one statement, concurrent requests never fail or count twice.
+        """
         if request.user.username == username:
             raise ValidationError({"message": f"You can't subcsribe at yourself"})
 
-        subcribe_to = get_object_or_404(User, username=username)
-        if current_profile.subscriptions.filter(id=subcribe_to.id).exists():
-            current_profile.subscriptions.remove(subcribe_to)
-        else:
-            current_profile.subscriptions.add(subcribe_to)
+        # profiles of both users and their counters in one query
+        profiles = {
+            user_id: (profile_id, subscriptions_count, subscribers_count)
+            for profile_id, user_id, subscriptions_count, subscribers_count in Profile.objects.filter(
+                Q(user_id=request.user.id) | Q(user__username=username)
+            ).values_list('id', 'user_id', 'subscriptions_count', 'subscribers_count')
+        }
+        author_id = next((user_id for user_id in profiles if user_id != request.user.id), None)
+        if author_id is None:
+            raise Http404("User does not exist")
+        profile_id, subscriptions_count, _ = profiles[request.user.id]
+        _, _, subscribers_count = profiles[author_id]
+
+        with transaction.atomic():
+            if subscribe is None:
+                subscribed, changed = False, Profile.objects.unfollow(profile_id, author_id)
+                if not changed:
+                    subscribed, changed = True, Profile.objects.follow(profile_id, author_id)
+            elif subscribe:
+                subscribed, changed = True, Profile.objects.follow(profile_id, author_id)
+            else:
+                subscribed, changed = False, Profile.objects.unfollow(profile_id, author_id)
+
+            delta = (1 if subscribed else -1) if changed else 0
+            if delta:
+                change_subscription_counts(request.user.id, [author_id], delta)
+
+        if changed:
+            if settings.FEED_FANOUT_ON_WRITE:
+                if subscribed:
+                    backfill_subscription(request.user.id, author_id)
+                else:
+                    evict_subscription(request.user.id, author_id)
+            invalidate_subscription_ids(request.user.id)
+            bump_user_version(request.user.id)
+
         result = {
-            "profile": ProfileSerializer(current_profile).data,
+            "username": username,
+            "subscribed": subscribed,
+            "subscriptions_count": max(subscriptions_count + delta, 0),
+            "subscribers_count": max(subscribers_count + delta, 0),
         }
+        return Response(result)
+
+
+class BulkSubscribeView(BaseJWTAuthenticationView):
+    """
+        Subscribes you on many users at once. Require authentication.
+        Body: list of usernames. Returns which were added, already subscribed or unknown. \n
+        Example: \n
+            http://127.0.0.1:8000/api/subscribe/  {"usernames": ["admin", "writer"]}
+    """
+
+    def post(self, request):
+        serializer = BulkSubscribeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        usernames = list(dict.fromkeys(serializer.validated_data['usernames']))
+        if request.user.username in usernames:
+            raise ValidationError({"message": f"You can't subcsribe at yourself"})
 
+        profile_id = Profile.objects.filter(user_id=request.user.id).values_list('id', flat=True).get()
+        author_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+        with transaction.atomic():
+            added_ids = Profile.objects.follow_many(profile_id, list(author_ids.values()))
+            change_subscription_counts(request.user.id, list(added_ids), 1)
+
+        if added_ids:
+            if settings.FEED_FANOUT_ON_WRITE:
+                for author_id in added_ids:
+                    backfill_subscription(request.user.id, author_id)
+            invalidate_subscription_ids(request.user.id)
+            bump_user_version(request.user.id)
+
+        result = {"added": [], "already_subscribed": [], "unknown": []}
+        for username in usernames:
+            if username not in author_ids:
+                result["unknown"].append(username)
+            elif author_ids[username] in added_ids:
+                result["added"].append(username)
+            else:
+                result["already_subscribed"].append(username)
         return Response(result)
 
 
-class FeedView(ListAPIView, BaseJWTAuthenticationView):
+class FeedView(ConditionalGetMixin, PostLinksMixin, FastPostListMixin, ListAPIView, TokenUserAuthenticationView):
     """
         Feed endpoint provides you posts of users you subcribed on.
 
@@ -109,35 +348,60 @@ class FeedView(ListAPIView, BaseJWTAuthenticationView):
         Ordered by post creation time. Starting with the newest ones. \n
         For the purpose of optimize sql queries, pagination doesn't know exactly count of pages.\n
         In case where parameter page num > real pages num, so: it always returns last page. \n
+        With FEED_FANOUT_ON_WRITE setting posts are read from precomputed inbox
+        filled on post creation and subscription, posts of celebrity authors
+        (see classify_celebrities command) are pulled at read time and merged in. \n
+        With FEED_CACHE_ENABLED setting serialized pages are cached until the user
+        or one of followed authors changes something (X-Feed-Cache header shows hit/miss). \n
+        Keyset pagination (pagination=cursor) follows next/previous links with signed cursors,
+        page cost doesn't depend on its depth. \n
+        Responses carry ETag, repeated request with If-None-Match gets 304 until followed authors
+        publish or delete posts, subscriptions or seen marks change. \n
         Usage examples: \n
             without filtering:    http://127.0.0.1:8000/api/feed/
             paginataion: http://127.0.0.1:8000/api/feed/?page=2
             pagination with seen filter: http://127.0.0.1:8000/api/feed/?page=2&seen=false
             show only seen posts: http://127.0.0.1:8000/api/feed/?seen=true
+            cursor pagination: http://127.0.0.1:8000/api/feed/?pagination=cursor&seen=false
+            without mark seen links: http://127.0.0.1:8000/api/feed/?links=none
     """
     queryset = Post.objects.none()
     serializer_class = PostDetailSerializer
-    pagination_class = CustomPageNumberPagination
+    pagination_class = SwitchablePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = PostSeenFilter
     filterset_fields = ['seen']
     ordering = 'created'
 
+    def get_etag(self, request):
+        return feed_etag(request)
+
     def get_queryset(self):
-        subcribed_at_users_list = Profile.objects.filter(user__id=self.request.user.id). \
-            select_related('user')[0].subscriptions.all()
+        return get_feed_queryset(self.request.user.id)
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FEED_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
 
-        posts = Post.objects.select_related('owner'). \
-            filter(owner__in=subcribed_at_users_list). \
-            prefetch_related('user_relation'). \
-            annotate(seen=Case(
-                When(user_relation__user_id=self.request.user.id, then=True),
-                default=False, )
-            )
-        return posts
+        key = feed_page_key(request)
+        data = get_feed_page(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Feed-Cache'] = 'hit'
+            return response
 
+        response = super().list(request, *args, **kwargs)
+        set_feed_page(key, response.data)
+        response['X-Feed-Cache'] = 'miss'
+        return response
 
-class PostMarkAsSeenView(BaseJWTAuthenticationView):
+    def filter_queryset(self, queryset):
+        if isinstance(queryset, MergedFeed):
+            return queryset.map(super().filter_queryset)
+        return super().filter_queryset(queryset)
+
+
+class PostMarkAsSeenView(TokenUserAuthenticationView):
     """
         Endpoint allows to mark or unmark post as seen.
         Example: \n
@@ -147,16 +411,36 @@ class PostMarkAsSeenView(BaseJWTAuthenticationView):
     def post(self, request, post_id=None):
         if not(Post.objects.filter(id=post_id).exists()):
             raise Http404("Post does not exist")
-        needed_relation = UserPostRelation.objects.filter(user_id=request.user.id, post_id=post_id)
-
-        if needed_relation.exists():
-            needed_relation.delete()
-            flag = False
-        else:
-            needed_relation.create(user_id=request.user.id, post_id=post_id, seen=True)
-            flag = True
+        flag = toggle_seen(request.user.id, post_id)
+        bump_user_version(request.user.id)
         result = {
             "post": post_id,
             "seen": flag
         }
         return Response(result)
+
+
+class PostBatchMarkAsSeenView(TokenUserAuthenticationView):
+    """
+        Endpoint allows to mark or unmark many posts as seen at once.
+        Body: list of post ids and target state. Returns result for every id. \n
+        Example: \n
+            http://127.0.0.1:8000/api/post/seen/  {"posts": [14, 15, 16], "seen": true}
+    """
+
+    def post(self, request):
+        serializer = PostSeenBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        post_ids = list(dict.fromkeys(serializer.validated_data['posts']))
+        seen = serializer.validated_data['seen']
+
+        existing_ids = set(Post.objects.filter(id__in=post_ids).values_list('id', flat=True))
+        set_seen(request.user.id, [post_id for post_id in post_ids if post_id in existing_ids], seen)
+        bump_user_version(request.user.id)
+
+        results = [
+            {"post": post_id, "seen": seen} if post_id in existing_ids
+            else {"post": post_id, "error": "Post does not exist"}
+            for post_id in post_ids
+        ]
+        return Response({"results": results})
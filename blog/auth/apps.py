@@ -5,3 +5,9 @@ class AuthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'auth'
     label = "my_auth"
+
+    def ready(self):
+        from django.contrib.auth.password_validation import get_default_password_validators
+
+        # validators (and common passwords list) are built once per process, do it before first request
+        get_default_password_validators()
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from api.local_cache import TTLCache
+
+from .denylist import is_token_revoked
+
+_active_cache = None
+
+
+def get_active_cache():
+    """
+        Process wide {user id: is active} cache
+    """
+    global _active_cache
+    if _active_cache is None:
+        _active_cache = TTLCache(settings.TOKEN_USER_CACHE_SIZE, settings.TOKEN_USER_ACTIVE_TTL)
+    return _active_cache
+
+
+def is_user_active(user_id):
+    """
+        Whether the user still exists and is active. Answer is cached for TOKEN_USER_ACTIVE_TTL
+        seconds, so deactivated user keeps access for at most that long.
+    """
+    active_cache = get_active_cache()
+    active = active_cache.get(user_id)
+    if active is None:
+        active = User.objects.filter(id=user_id, is_active=True).exists()
+        active_cache.set(user_id, active)
+    return active
+
+
+class DenylistMixin:
+    """
+        Rejects revoked (logged out) tokens, see auth.denylist
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_token_revoked(validated_token):
+            raise InvalidToken(_("Token is revoked"))
+        return validated_token
+
+
+class DenylistJWTAuthentication(DenylistMixin, JWTAuthentication):
+    pass
+
+
+class TokenUserAuthentication(DenylistMixin, JWTStatelessUserAuthentication):
+    """
+        JWT authentication without loading the User row: request.user is a token-backed
+        TokenUser with id and username from claims (see MyTokenObtainPairSerializer).
+        For views which need only the current user's id and username.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not is_user_active(user.id):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class TokenUserScheme(SimpleJWTScheme):
+    """
+        Same bearer JWT security scheme in OpenAPI schema
+    """
+    target_class = TokenUserAuthentication
+
+
+class DenylistJWTScheme(SimpleJWTScheme):
+    target_class = DenylistJWTAuthentication
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.benchmarking import register
+from api.benchmarks import request_factory
+
+from . import denylist, hashers
+from .models import RevokedToken
+from .views import MyObtainTokenPairView, RegisterView
+
+PASSWORD = 'bench123!Password'
+
+
+@register('auth_latency')
+def auth_latency(bench):
+    """
+        Register and login latency for every password hasher profile,
+        plus password checks from concurrent request threads with and without hashing pool
+    """
+    register_view, login_view = RegisterView.as_view(), MyObtainTokenPairView.as_view()
+    numbers = count()
+
+    def register_user():
+        number = next(numbers)
+        request = request_factory.post('/auth/register/', {
+            'username': f'bench_user_{number}', 'email': f'bench_{number}@mail.ru',
+            'password': PASSWORD, 'password2': PASSWORD,
+        }, format='json')
+        response = register_view(request)
+        assert response.status_code == 201, response.data
+
+    def login():
+        request = request_factory.post('/auth/login/', {'username': 'bench_login', 'password': PASSWORD},
+                                       format='json')
+        response = login_view(request)
+        assert response.status_code == 200, response.data
+
+    for profile, profile_hashers in settings.PASSWORD_HASHER_PROFILES.items():
+        with override_settings(PASSWORD_HASHERS=profile_hashers):
+            bench.stdout.write(f' {profile} ({profile_hashers[0].rsplit(".", 1)[-1]}):')
+            User.objects.filter(username='bench_login').delete()
+            User.objects.create_user(username='bench_login', password=PASSWORD)
+            bench.timeit('register', register_user)
+            bench.timeit('login', login)
+
+    encoded = make_password(PASSWORD)
+    threads = 8
+    for workers in (0, settings.PASSWORD_HASHING_WORKERS or threads // 2):
+        hashers._executor = None
+        with override_settings(PASSWORD_HASHING_WORKERS=workers), ThreadPoolExecutor(threads) as requests:
+            bench.timeit(
+                f'{threads * 4} password checks from {threads} threads, {workers or "no"} hashing pool',
+                lambda: list(requests.map(lambda _: check_password(PASSWORD, encoded), range(threads * 4))),
+            )
+    hashers._executor = None
+
+
+@register('token_denylist')
+def token_denylist(bench):
+    """
+        Revocation check of not revoked token: bloom filter vs database lookup per request
+    """
+    user, _ = User.objects.get_or_create(username='bench_denylist')
+    RevokedToken.objects.all().delete()
+    revoked = [AccessToken.for_user(user) for _ in range(bench.size)]
+    token_denylist = denylist.TokenDenylist(start_worker=False, refresh_interval=3600)
+    token_denylist.revoke(revoked)
+    token_denylist.load()
+    bench.report('revoked tokens', len(revoked))
+
+    jti = AccessToken.for_user(user)['jti']
+    bench.timeit('database lookup', lambda: RevokedToken.objects.filter(jti=jti).exists())
+    bench.timeit('bloom filter', lambda: token_denylist.is_revoked(jti))
+    RevokedToken.objects.all().delete()
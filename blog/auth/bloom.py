@@ -0,0 +1,53 @@
+import math
+from hashlib import blake2b
+
+
+def next_prime(number):
+    while number < 2 or any(number % divisor == 0 for divisor in range(2, math.isqrt(number) + 1)):
+        number += 1
+    return number
+
+
+class BloomFilter:
+    """
+        Set membership with false positives and no false negatives:
+        `key in bloom` is False only if the key was never added.
+        `capacity` keys fit with at most `error_rate` false positives.
+        `len()` is the number of insertions, repeated keys included.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        # prime size: every double hashing step is coprime with it, k positions never collapse
+        self.size = next_prime(max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, key):
+        # double hashing: k positions from two 64-bit halves of one digest
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') % (self.size - 1) + 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """
+            Returns False if the key was (probably) already there
+        """
+        added = False
+        for position in self._positions(key):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        # counted even when all bits were set: a false positive is a new key too
+        self.count += 1
+        return added
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def __len__(self):
+        return self.count
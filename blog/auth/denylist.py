@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from api import stats
+
+from .bloom import BloomFilter
+from .models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+_denylist = None
+_denylist_lock = threading.Lock()
+
+
+def get_token_denylist():
+    """
+        Process wide revoked tokens mirror
+    """
+    global _denylist
+    if _denylist is None:
+        with _denylist_lock:
+            # concurrent first requests must share one mirror: every extra one loads the table
+            # and starts a refresh worker nobody stops
+            if _denylist is None:
+                _denylist = TokenDenylist(
+                    capacity=settings.TOKEN_DENYLIST_CAPACITY,
+                    error_rate=settings.TOKEN_DENYLIST_ERROR_RATE,
+                    refresh_interval=settings.TOKEN_DENYLIST_REFRESH_INTERVAL,
+                    refresh_overlap=settings.TOKEN_DENYLIST_REFRESH_OVERLAP,
+                    start_worker=settings.TOKEN_DENYLIST_REFRESH_WORKER,
+                )
+    return _denylist
+
+
+class TokenDenylist:
+    """
+        RevokedToken table mirrored into in-process bloom filter. Not revoked token,
+        the common case, is answered from memory; only filter hits are confirmed by the database.
+        Filter is loaded on first use and refreshed every `refresh_interval` seconds
+        (by worker thread, or inline by the first check after the interval) with rows revoked
+        since previous refresh minus `refresh_overlap` seconds, which covers late commits
+        and clock skew between servers. Tokens revoked by this process are added at once,
+        by other processes - after at most `refresh_interval` seconds.
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.001, refresh_interval=5.0, refresh_overlap=60.0,
+                 start_worker=True):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.refresh_overlap = refresh_overlap
+        self.start_worker = start_worker
+
+        self._lock = threading.Lock()
+        self._worker = None
+        # jti -> revoked_at of rows already added which the next refresh reads again (overlap window),
+        # so the filter counts every token once and is rebuilt on time
+        self._recent = {}
+        self._bloom = None
+        # application clock time the last load or refresh started at; revoked_at is stamped by the
+        # revoking server's clock (auto_now_add), refresh_overlap covers the skew and late commits
+        self._refreshed_at = None
+        self._next_refresh = 0.0
+
+    def load(self):
+        """
+            Builds the filter from scratch out of not expired rows
+        """
+        started = timezone.now()
+        rows = list(RevokedToken.objects.filter(expires_at__gt=started).values_list('jti', 'revoked_at'))
+        bloom = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+        for jti, _ in rows:
+            bloom.add(jti)
+        since = started - timedelta(seconds=self.refresh_overlap)
+        self._recent = {jti: revoked_at for jti, revoked_at in rows if revoked_at >= since}
+        self._bloom, self._refreshed_at = bloom, started
+        self._next_refresh = time.monotonic() + self.refresh_interval
+
+    def refresh(self):
+        """
+            Adds rows revoked since previous refresh. Filter which outgrew its capacity
+            (false positive rate would go up) is rebuilt, expired tokens are dropped then.
+        """
+        if self._bloom is None:
+            return self.load()
+
+        started = timezone.now()
+        since = self._refreshed_at - timedelta(seconds=self.refresh_overlap)
+        rows = RevokedToken.objects.filter(revoked_at__gte=since).values_list('jti', 'revoked_at')
+        for jti, revoked_at in rows.iterator():
+            self._add(jti, revoked_at)
+        # rows older than that are not read again
+        since = started - timedelta(seconds=self.refresh_overlap)
+        self._recent = {jti: revoked_at for jti, revoked_at in self._recent.items() if revoked_at >= since}
+        self._refreshed_at = started
+        self._next_refresh = time.monotonic() + self.refresh_interval
+
+        if len(self._bloom) > self._bloom.capacity:
+            self.load()
+
+    def _maintain(self):
+        if self._bloom is None:
+            with self._lock:
+                if self._bloom is None:
+                    self.load()
+
+        if self.start_worker:
+            self._ensure_worker()
+        elif time.monotonic() >= self._next_refresh and self._lock.acquire(blocking=False):
+            # one thread refreshes, the others go on with current filter
+            try:
+                self.refresh()
+            finally:
+                self._lock.release()
+
+    def is_revoked(self, jti):
+        if not jti:
+            return False
+        self._maintain()
+        if jti not in self._bloom:
+            return False
+
+        stats.incr('token_denylist.bloom_hit')
+        revoked = RevokedToken.objects.filter(jti=jti).exists()
+        if not revoked:
+            stats.incr('token_denylist.false_positive')
+        return revoked
+
+    def revoke(self, tokens):
+        """
+            Persists jti of the given validated tokens (access or refresh) till their expiration
+        """
+        revoked = RevokedToken.objects.bulk_create([
+            RevokedToken(jti=token[api_settings.JTI_CLAIM], expires_at=datetime_from_epoch(token['exp']))
+            for token in tokens
+        ], ignore_conflicts=True)
+        with self._lock:
+            if self._bloom is not None:
+                for revoked_token in revoked:
+                    self._add(revoked_token.jti, revoked_token.revoked_at)
+
+    def _add(self, jti, revoked_at):
+        if jti not in self._recent:
+            self._recent[jti] = revoked_at
+            self._bloom.add(jti)
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='token-denylist-refresh', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                with self._lock:
+                    self.refresh()
+            except Exception:
+                logger.exception('Token denylist refresh failed')
+            finally:
+                close_old_connections()
+
+
+def is_token_revoked(token):
+    return get_token_denylist().is_revoked(token.get(api_settings.JTI_CLAIM))
+
+
+def revoke_tokens(tokens):
+    get_token_denylist().revoke(tokens)
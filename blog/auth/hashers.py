@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_executor = None
+_pool_thread = threading.local()
+
+
+def get_hashing_executor():
+    """
+        Process wide pool for password hashing (PASSWORD_HASHING_WORKERS threads)
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix='password-hashing',
+            initializer=_mark_pool_thread,
+        )
+    return _executor
+
+
+def _mark_pool_thread():
+    _pool_thread.active = True
+
+
+def offload(func, *args, **kwargs):
+    # nested calls (PBKDF2 verify calls encode) run inline, waiting on own pool would deadlock it
+    if not settings.PASSWORD_HASHING_WORKERS or getattr(_pool_thread, 'active', False):
+        return func(*args, **kwargs)
+    return get_hashing_executor().submit(func, *args, **kwargs).result()
+
+
+class OffloadedHasherMixin:
+    """
+        Runs encode/verify in the hashing thread pool. Pool size bounds how many CPU and memory
+        hungry hashes run at once however many requests the ASGI server accepts; argon2 and
+        hashlib's pbkdf2 release the GIL, so pooled hashes run in parallel.
+    """
+
+    def encode(self, password, salt, *args, **kwargs):
+        return offload(super().encode, password, salt, *args, **kwargs)
+
+    def verify(self, password, encoded):
+        return offload(super().verify, password, encoded)
+
+
+class PBKDF2PasswordHasher(OffloadedHasherMixin, hashers.PBKDF2PasswordHasher):
+    pass
+
+
+class Argon2PasswordHasher(OffloadedHasherMixin, hashers.Argon2PasswordHasher):
+    """
+        Argon2id with parameters from settings (ARGON2_TIME_COST, ARGON2_MEMORY_COST,
+        ARGON2_PARALLELISM). Hashes made with other parameters are upgraded on next login.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.ARGON2_PARALLELISM
@@ -0,0 +1,178 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Profile
+
+
+def init_worker():
+    # spawned (not forked) workers start without configured Django
+    django.setup()
+
+
+def hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+def read_records(path, file_format):
+    """
+        Streams dicts with username, email and password (plain) or password_hash (already hashed)
+    """
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def validate_record(username, email, password):
+    """
+        Why the record can't be imported, None if it can. Values rejected by the database
+        (too long) would fail the whole chunk insert, so they are checked up front
+    """
+    username_field = User._meta.get_field('username')
+    if not username:
+        return 'no username'
+    if len(username) > username_field.max_length:
+        return f'username longer than {username_field.max_length} characters'
+    try:
+        User.username_validator(username)
+    except ValidationError as exc:
+        return ' '.join(exc.messages)
+    email_length = User._meta.get_field('email').max_length
+    if len(email) > email_length:
+        return f'email longer than {email_length} characters'
+    if not password:
+        return 'neither password nor password_hash'
+    return None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Imports users with profiles from CSV or JSONL file (username, email, password or password_hash). ' \
+           'Passwords are hashed in a process pool, rows are written by bulk INSERTs, ' \
+           'one transaction per chunk. Invalid records are skipped and reported to stderr. ' \
+           'Interrupted import continues from the checkpoint file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with header or JSONL file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format, by default from file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Users per transaction')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Password hashing processes, 0 hashes in this process')
+        parser.add_argument('--checkpoint', help='Progress file, default: <path>.checkpoint')
+
+    def handle(self, *args, path, format=None, chunk_size=1000, workers=None, checkpoint=None, **options):
+        file_format = format or ('csv' if path.endswith('.csv') else 'jsonl')
+        checkpoint = checkpoint or f'{path}.checkpoint'
+        done = self.load_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Resuming after {done} records')
+
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker) if workers else None
+        stats = {'imported': 0, 'existing': 0, 'invalid': 0}
+        started = time.monotonic()
+        try:
+            records = islice(read_records(path, file_format), done, None)
+            pending = None
+            try:
+                for chunk in chunked(records, chunk_size):
+                    # next chunk is hashed by workers while the current one is written
+                    hashing = self.hash_chunk(executor, chunk, workers)
+                    if pending is not None:
+                        current, pending = pending, None
+                        done = self.write_chunk(*current, stats, done, checkpoint, started)
+                    pending = chunk, hashing
+            finally:
+                # records read before broken input are still written
+                if pending is not None:
+                    done = self.write_chunk(*pending, stats, done, checkpoint, started)
+        except (OSError, ValueError, csv.Error) as exc:
+            raise CommandError(f'Import stopped after {done} records, run again to resume: {exc}')
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['imported']} users in {elapsed:.1f}s "
+            f"({stats['imported'] / (elapsed or 1):.0f} users/s), "
+            f"skipped {stats['existing']} existing and {stats['invalid']} invalid records"
+        ))
+
+    @staticmethod
+    def load_checkpoint(checkpoint):
+        if not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as file:
+            return json.load(file)['records']
+
+    @staticmethod
+    def save_checkpoint(checkpoint, records):
+        # replace is atomic, crash never leaves half written checkpoint
+        with open(f'{checkpoint}.tmp', 'w') as file:
+            json.dump({'records': records}, file)
+        os.replace(f'{checkpoint}.tmp', checkpoint)
+
+    @staticmethod
+    def hash_chunk(executor, chunk, workers):
+        """
+            Futures (or plain lists without pool) of hashes, None for rows with hash given
+        """
+        passwords = [record['password'] for record in chunk
+                     if not record.get('password_hash') and record.get('password')]
+        if executor is None:
+            return [hash_passwords(passwords)]
+        size = -(-len(passwords) // workers) or 1
+        return [executor.submit(hash_passwords, passwords[start:start + size])
+                for start in range(0, len(passwords), size)]
+
+    def write_chunk(self, chunk, hashing, stats, done, checkpoint, started):
+        hashes = iter([password for part in hashing
+                       for password in (part if isinstance(part, list) else part.result())])
+
+        users = {}
+        for number, record in enumerate(chunk, done + 1):
+            password = record.get('password_hash') or (next(hashes) if record.get('password') else None)
+            username = str(record.get('username') or '').strip()
+            email = str(record.get('email') or '')
+            error = validate_record(username, email, password)
+            if error is None and username in users:
+                error = 'duplicate username'
+            if error is not None:
+                stats['invalid'] += 1
+                self.stderr.write(f'Record {number} skipped: {error}')
+                continue
+            users[username] = User(username=username, email=email, password=password)
+
+        # rows committed before a crash but after the last checkpoint are skipped on resume
+        existing = set(User.objects.filter(username__in=users).values_list('username', flat=True))
+        stats['existing'] += len(existing)
+        new_users = [user for username, user in users.items() if username not in existing]
+        Profile.objects.create_users(new_users)
+
+        stats['imported'] += len(new_users)
+        done += len(chunk)
+        self.save_checkpoint(checkpoint, done)
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"{done} records, imported {stats['imported']} users "
+                          f"({stats['imported'] / (elapsed or 1):.0f} users/s)")
+        return done
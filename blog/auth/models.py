@@ -1,3 +1,15 @@
 from django.db import models
 
-# Create your models here.
+
+class RevokedToken(models.Model):
+    """
+        Revoked (logged out) JWT, identified by its `jti` claim.
+        Rows are mirrored into per-process bloom filter, see auth.denylist.TokenDenylist.
+        Expired rows are useless, token is rejected by its `exp` anyway (prune_revoked_tokens command).
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.jti
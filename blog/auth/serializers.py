@@ -2,7 +2,14 @@ from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from rest_framework.validators import UniqueValidator
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Profile
+
+from .denylist import is_token_revoked
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -16,6 +23,33 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         return token
 
 
+class DenylistTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+        No new access tokens for revoked (logged out) refresh token
+    """
+
+    def validate(self, attrs):
+        if is_token_revoked(self.token_class(attrs['refresh'])):
+            raise InvalidToken("Token is revoked")
+        return super().validate(attrs)
+
+
+class LogoutSerializer(serializers.Serializer):
+    """
+        Refresh token to revoke along with the access token of the request
+    """
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        try:
+            refresh = RefreshToken(value)
+        except TokenError as e:
+            raise serializers.ValidationError(e.args[0])
+        if str(refresh.get(api_settings.USER_ID_CLAIM)) != str(self.context['request'].user.id):
+            raise serializers.ValidationError("Token belongs to another user.")
+        return refresh
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     """
         User registration credentials serializer
@@ -39,12 +73,12 @@ class RegisterSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user = User.objects.create(
+        user = User(
             username=validated_data['username'],
             email=validated_data['email']
         )
-
         user.set_password(validated_data['password'])
-        user.save()
 
+        # user and profile rows in one transaction, no follow-up UPDATEs
+        user, = Profile.objects.create_users([user])
         return user
@@ -1,8 +1,13 @@
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
+from api.models import Post, Profile
+from auth import authentication
+
 
 class AuthEndpointsTestCase(APITestCase):
     def test_user_register_ok(self):
@@ -19,6 +24,56 @@ class AuthEndpointsTestCase(APITestCase):
 
         created_user_object = User.objects.get(username=user_1['username'])
         self.assertTrue(created_user_object)
+        self.assertTrue(created_user_object.check_password(user_1['password']))
+        self.assertTrue(Profile.objects.filter(user=created_user_object).exists())
+
+    def test_user_register_query_count(self):
+        user_1 = {
+            'email': 'test@mail.ru',
+            'password': '123qwer123!',
+            'password2': '123qwer123!',
+            'username': 'test_user',
+        }
+        url = reverse('auth_register')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, user_1)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+
+        statements = [query['sql'] for query in context.captured_queries if 'SAVEPOINT' not in query['sql']]
+        # username and email uniqueness checks, user INSERT, profile INSERT
+        self.assertEqual(len(statements), 4)
+        self.assertFalse([sql for sql in statements if sql.startswith('UPDATE')])
+
+    def test_user_login_query_count(self):
+        user_1 = {
+            'username': 'test_user',
+            'password': '123qwer123!',
+        }
+        url = reverse('token_obtain_pair')
+        User.objects.create_user(**user_1)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, user_1)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_create_users_with_profiles(self):
+        users = [User(username=f'imported_{i}') for i in range(3)]
+
+        with CaptureQueriesContext(connection) as context:
+            users = Profile.objects.create_users(users)
+        self.assertEqual(len([query for query in context.captured_queries if 'INSERT' in query['sql']]), 2)
+        self.assertTrue(all(user.pk for user in users))
+        self.assertEqual(Profile.objects.filter(user__in=users).count(), 3)
+
+    def test_user_update_does_not_touch_profile(self):
+        user = User.objects.create_user(username='test_user', password='123qwer123!')
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+
+        with CaptureQueriesContext(connection) as context:
+            user.save()
+        self.assertEqual(len(context.captured_queries), 1)
 
     def test_user_login_ok(self):
         user_1 = {
@@ -57,3 +112,43 @@ class AuthEndpointsTestCase(APITestCase):
 
         response = self.client.post(url, user_1)
         self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+
+class TokenUserAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        authentication._active_cache = None
+        self.user = User.objects.create_user(username='test_user', password='123qwer123!')
+        author = User.objects.create_user(username='author', password='123qwer123!')
+        self.post = Post.objects.create(title='post', body='body', owner=author)
+        self.user.profile.subscriptions.add(author)
+
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'test_user', 'password': '123qwer123!'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def test_feed_without_user_query(self):
+        self.client.get(reverse('feed'))
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('feed'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertFalse([query for query in context.captured_queries if 'FROM "auth_user"' in query['sql']])
+
+        response = self.client.post(reverse('mark_seen', args=[self.post.id]))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.data['seen'])
+
+    def test_inactive_user_rejected(self):
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+    def test_active_flag_is_cached(self):
+        self.client.get(reverse('feed'))
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        authentication.get_active_cache().clear()
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from api.models import Profile
+
+
+class ImportUsersCommandTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def import_users(self, path, **options):
+        out = StringIO()
+        call_command('import_users', path, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_import_jsonl(self):
+        User.objects.create_user(username='existing', password='123qwer123!')
+        records = [
+            {'username': 'user1', 'email': 'user1@mail.ru', 'password': '123qwer123!'},
+            {'username': 'user2', 'password_hash': make_password('hashed123!')},
+            {'username': 'existing', 'password': '123qwer123!'},
+            {'email': 'nobody@mail.ru', 'password': '123qwer123!'},
+            {'username': 'user3', 'password': 'other123!'},
+        ]
+        path = self.write('users.jsonl', '\n'.join(json.dumps(record) for record in records))
+
+        out = self.import_users(path, chunk_size=2, workers=0)
+        self.assertIn('Imported 3 users', out)
+        self.assertIn('skipped 1 existing and 1 invalid records', out)
+
+        self.assertTrue(User.objects.get(username='user1').check_password('123qwer123!'))
+        self.assertTrue(User.objects.get(username='user2').check_password('hashed123!'))
+        self.assertTrue(User.objects.get(username='user3').check_password('other123!'))
+        self.assertEqual(User.objects.get(username='user1').email, 'user1@mail.ru')
+        self.assertEqual(Profile.objects.count(), User.objects.count())
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_invalid_records_reported(self):
+        records = [
+            {'username': 'user1', 'password': '123qwer123!'},
+            {'username': 'x' * 151, 'password': '123qwer123!'},
+            {'username': 'bad name', 'password': '123qwer123!'},
+            {'username': 'nopassword', 'email': 'nopassword@mail.ru'},
+            {'username': 'user2', 'password_hash': make_password('hashed123!')},
+        ]
+        path = self.write('users.jsonl', '\n'.join(json.dumps(record) for record in records))
+
+        out, err = StringIO(), StringIO()
+        call_command('import_users', path, chunk_size=10, workers=0, stdout=out, stderr=err)
+        self.assertIn('Imported 2 users', out.getvalue())
+        self.assertIn('0 existing and 3 invalid records', out.getvalue())
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['user1', 'user2'])
+        self.assertTrue(User.objects.get(username='user1').check_password('123qwer123!'))
+
+        errors = err.getvalue().splitlines()
+        self.assertEqual([line.split(':')[0] for line in errors],
+                         ['Record 2 skipped', 'Record 3 skipped', 'Record 4 skipped'])
+        self.assertIn('longer than 150', errors[0])
+        self.assertIn('neither password nor password_hash', errors[2])
+
+    def test_import_csv_in_process_pool(self):
+        path = self.write('users.csv', 'username,email,password\nuser1,user1@mail.ru,123qwer123!\nuser2,,pass123!\n')
+
+        out = self.import_users(path, workers=2)
+        self.assertIn('Imported 2 users', out)
+        self.assertTrue(User.objects.get(username='user2').check_password('pass123!'))
+        self.assertEqual(Profile.objects.filter(user__username__in=['user1', 'user2']).count(), 2)
+
+    def test_resume_from_checkpoint(self):
+        lines = [json.dumps({'username': f'user{i}', 'password': '123qwer123!'}) for i in range(4)]
+        path = self.write('users.jsonl', '\n'.join(lines[:3]) + '\n{broken')
+
+        with self.assertRaises(CommandError):
+            self.import_users(path, chunk_size=2, workers=0)
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['user0', 'user1'])
+
+        self.write('users.jsonl', '\n'.join(lines))
+        out = self.import_users(path, chunk_size=2, workers=0)
+        self.assertIn('Resuming after 2 records', out)
+        self.assertIn('Imported 2 users', out)
+        self.assertEqual(User.objects.count(), 4)
@@ -0,0 +1,144 @@
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from auth import authentication, denylist
+from auth.bloom import BloomFilter
+from auth.models import RevokedToken
+
+
+class BloomFilterTestCase(SimpleTestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [f'key-{i}' for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertFalse(bloom.add(keys[0]))
+        self.assertEqual(len(bloom), 1001)
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_positions_never_collapse(self):
+        # small filters used to get steps sharing factors with the size
+        for capacity in range(1, 50):
+            bloom = BloomFilter(capacity, 0.001)
+            for i in range(200):
+                self.assertEqual(len(set(bloom._positions(f'key-{i}'))), bloom.hashes)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'key-{i}')
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+
+@override_settings(TOKEN_DENYLIST_REFRESH_WORKER=False, TOKEN_DENYLIST_REFRESH_INTERVAL=3600)
+class TokenDenylistTestCase(APITestCase):
+    def setUp(self):
+        denylist._denylist = None
+        authentication._active_cache = None
+        self.user = User.objects.create_user(username='test_user', password='123qwer123!')
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'test_user', 'password': '123qwer123!'})
+        self.access, self.refresh = response.data['access'], response.data['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+
+    def tearDown(self):
+        denylist._denylist = None
+
+    def test_one_denylist_per_process(self):
+        class SlowTokenDenylist(denylist.TokenDenylist):
+            def __init__(self, *args, **kwargs):
+                # widens the window between the None check and assignment
+                time.sleep(0.05)
+                super().__init__(*args, **kwargs)
+
+        instances = []
+        with mock.patch.object(denylist, 'TokenDenylist', SlowTokenDenylist):
+            threads = [threading.Thread(target=lambda: instances.append(denylist.get_token_denylist()))
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(4, len(instances))
+        self.assertEqual(1, len({id(instance) for instance in instances}))
+
+    def test_not_revoked_token_without_denylist_query(self):
+        self.client.get(reverse('feed'))
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('feed'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertFalse([query for query in context.captured_queries if 'my_auth_revokedtoken' in query['sql']])
+
+    def test_logout(self):
+        response = self.client.post(reverse('token_logout'), {'refresh': self.refresh})
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+        # both the stateless (feed) and the User loading (subscribe) authentication reject it
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, self.client.get(reverse('feed')).status_code)
+        response = self.client.post(reverse('subscribe_bulk'), {'usernames': []}, format='json')
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+        response = self.client.post(reverse('token_refresh'), {'refresh': self.refresh})
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+    def test_logout_keeps_refresh_token_when_not_given(self):
+        response = self.client.post(reverse('token_logout'))
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, self.client.get(reverse('feed')).status_code)
+
+        response = self.client.post(reverse('token_refresh'), {'refresh': self.refresh})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(status.HTTP_200_OK, self.client.get(reverse('feed')).status_code)
+
+    def test_logout_with_foreign_refresh_token(self):
+        other = User.objects.create_user(username='other_user', password='123qwer123!')
+        response = self.client.post(reverse('token_logout'), {'refresh': str(RefreshToken.for_user(other))})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertFalse(RevokedToken.objects.exists())
+
+    def test_revoked_by_another_process(self):
+        self.assertEqual(status.HTTP_200_OK, self.client.get(reverse('feed')).status_code)
+        token = AccessToken(self.access)
+        RevokedToken.objects.create(jti=token['jti'], expires_at=token.current_time)
+
+        # not in the filter until refresh
+        self.assertEqual(status.HTTP_200_OK, self.client.get(reverse('feed')).status_code)
+        denylist.get_token_denylist().refresh()
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, self.client.get(reverse('feed')).status_code)
+
+    def test_filter_rebuilt_when_over_capacity(self):
+        token_denylist = denylist.get_token_denylist()
+        token_denylist.capacity = 4
+        token_denylist.load()
+        tokens = [AccessToken.for_user(self.user) for _ in range(6)]
+        token_denylist.revoke(tokens)
+        self.assertEqual(len(token_denylist._bloom), 6)
+
+        token_denylist.refresh()
+        self.assertEqual(token_denylist._bloom.capacity, 12)
+        self.assertTrue(all(token_denylist.is_revoked(token['jti']) for token in tokens))
+
+    def test_overlapping_refresh_counts_tokens_once(self):
+        token_denylist = denylist.get_token_denylist()
+        token_denylist.load()
+        token_denylist.revoke([AccessToken.for_user(self.user) for _ in range(2)])
+        # another process revoked one more
+        RevokedToken.objects.create(jti='other', expires_at=timezone.now() + timedelta(minutes=5))
+        for _ in range(3):
+            token_denylist.refresh()
+        self.assertEqual(len(token_denylist._bloom), 3)
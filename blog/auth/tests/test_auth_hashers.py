@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, override_settings
+
+from auth import hashers
+from auth.validators import PreloadedCommonPasswordValidator
+
+
+@override_settings(ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=1024, ARGON2_PARALLELISM=1)
+class HashersTestCase(SimpleTestCase):
+    def test_argon2_profile(self):
+        with self.settings(PASSWORD_HASHERS=self.profile('argon2')):
+            encoded = make_password('123qwer123!')
+            self.assertTrue(encoded.startswith('argon2$argon2id$v=19$m=1024,t=1,p=1$'))
+            self.assertTrue(check_password('123qwer123!', encoded))
+            self.assertFalse(get_hasher().must_update(encoded))
+
+            with self.settings(ARGON2_TIME_COST=2):
+                self.assertTrue(get_hasher().must_update(encoded))
+
+    def test_existing_hashes_verify_in_every_profile(self):
+        with self.settings(PASSWORD_HASHERS=self.profile('default')):
+            encoded = make_password('123qwer123!')
+
+        for profile in ('argon2', 'fast'):
+            with self.settings(PASSWORD_HASHERS=self.profile(profile)):
+                self.assertTrue(check_password('123qwer123!', encoded))
+                self.assertEqual(identify_hasher(encoded).algorithm, 'pbkdf2_sha256')
+
+    @override_settings(PASSWORD_HASHING_WORKERS=2)
+    def test_hashing_in_thread_pool(self):
+        hashers._executor = None
+        self.addCleanup(setattr, hashers, '_executor', None)
+
+        for profile in ('argon2', 'default'):
+            with self.settings(PASSWORD_HASHERS=self.profile(profile)):
+                encoded = make_password('123qwer123!')
+                self.assertTrue(check_password('123qwer123!', encoded))
+        self.assertIsNotNone(hashers._executor)
+
+    @staticmethod
+    def profile(name):
+        return settings.PASSWORD_HASHER_PROFILES[name]
+
+
+class PreloadedCommonPasswordValidatorTestCase(SimpleTestCase):
+    def test_list_is_loaded_once(self):
+        first, second = PreloadedCommonPasswordValidator(), PreloadedCommonPasswordValidator()
+        self.assertIs(first.passwords, second.passwords)
+        self.assertIsInstance(first.passwords, frozenset)
+
+    def test_common_password_rejected(self):
+        with self.assertRaises(ValidationError):
+            validate_password('password123')
+        validate_password('123qwer123!unique')
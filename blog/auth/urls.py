@@ -1,12 +1,9 @@
 from django.urls import path
-from rest_framework_simplejwt.views import (
-    TokenRefreshView,
-)
-
-from .views import MyObtainTokenPairView, RegisterView
+from .views import DenylistTokenRefreshView, LogoutView, MyObtainTokenPairView, RegisterView
 
 urlpatterns = [
     path('login/', MyObtainTokenPairView.as_view(), name='token_obtain_pair'),
-    path('refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('refresh/', DenylistTokenRefreshView.as_view(), name='token_refresh'),
+    path('logout/', LogoutView.as_view(), name='token_logout'),
     path('register/', RegisterView.as_view(), name='auth_register'),
 ]
\ No newline at end of file
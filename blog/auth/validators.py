@@ -0,0 +1,24 @@
+import gzip
+from functools import lru_cache
+
+from django.contrib.auth.password_validation import CommonPasswordValidator
+
+
+@lru_cache(maxsize=None)
+def load_password_list(path):
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            return frozenset(line.strip() for line in file)
+    except OSError:
+        with open(path) as file:
+            return frozenset(line.strip() for line in file)
+
+
+class PreloadedCommonPasswordValidator(CommonPasswordValidator):
+    """
+        CommonPasswordValidator with the list read once per process into a frozenset
+        shared by all instances. Loaded at startup (AuthConfig.ready), not by the first registration.
+    """
+
+    def __init__(self, password_list_path=None):
+        self.passwords = load_password_list(str(password_list_path or self.DEFAULT_PASSWORD_LIST_PATH))
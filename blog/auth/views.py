@@ -1,11 +1,17 @@
 from django.contrib.auth.models import User
 from django.shortcuts import render
-from rest_framework import generics
+from rest_framework import generics, status
 from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
 
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .serializers import MyTokenObtainPairSerializer, RegisterSerializer
+from api.views import BaseJWTAuthenticationView
+
+from .denylist import revoke_tokens
+from .serializers import (
+    DenylistTokenRefreshSerializer, LogoutSerializer, MyTokenObtainPairSerializer, RegisterSerializer
+)
 
 
 class MyObtainTokenPairView(TokenObtainPairView):
@@ -13,6 +19,29 @@ class MyObtainTokenPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
 
+class DenylistTokenRefreshView(TokenRefreshView):
+    serializer_class = DenylistTokenRefreshSerializer
+
+
+class LogoutView(BaseJWTAuthenticationView):
+    """
+        Logs you out: access token of the request and given refresh token stop working.
+        Require authentication. \n
+        Example: \n
+            http://127.0.0.1:8000/auth/logout/  {"refresh": "<refresh token>"}
+    """
+    serializer_class = LogoutSerializer
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        tokens = [request.auth]
+        if 'refresh' in serializer.validated_data:
+            tokens.append(serializer.validated_data['refresh'])
+        revoke_tokens(tokens)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class RegisterView(generics.CreateAPIView):
     """
         Takes a set of user credentials and register him
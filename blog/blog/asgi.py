@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog.settings')
+# ASGI server runs many sync views at once, password hashes go through a bounded thread pool
+os.environ.setdefault('PASSWORD_HASHING_WORKERS', str(os.cpu_count() or 1))
+# read endpoints run on the event loop instead of a thread per request
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+# Django handler which can stream async iterators (api.streaming)
+from api.streaming import get_asgi_application  # noqa: E402
+
+django_application = get_asgi_application()
+
+# imported after setup: the events app uses models and settings
+from api.sse import EventsRouter, FeedEventsApp  # noqa: E402
 
-application = get_asgi_application()
+# long-lived feed event streams are served next to Django, outside its request cycle
+application = EventsRouter(django_application, FeedEventsApp())
@@ -69,6 +69,10 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+# toolbar middleware is sync only, under ASGI it pushes every request (async views too) to a thread
+DEBUG_TOOLBAR = env.bool('DEBUG_TOOLBAR', default=True)
+if not DEBUG_TOOLBAR:
+    MIDDLEWARE.remove('debug_toolbar.middleware.DebugToolbarMiddleware')
 
 INTERNAL_IPS = ['127.0.0.1', ]
 
@@ -102,15 +106,39 @@ DEBUG_TOOLBAR_PANELS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'auth.authentication.DenylistJWTAuthentication',
     ),
 
+    # orjson based JSON, falls back to stdlib json when orjson is not installed
+    'DEFAULT_RENDERER_CLASSES': env.list('REST_RENDERER_CLASSES', default=[
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ]),
+    'DEFAULT_PARSER_CLASSES': env.list('REST_PARSER_CLASSES', default=[
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ]),
+
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=20),
 }
+# auth.authentication.TokenUserAuthentication: seconds the user's active flag is cached in process
+TOKEN_USER_ACTIVE_TTL = env.float('TOKEN_USER_ACTIVE_TTL', default=30.0)
+TOKEN_USER_CACHE_SIZE = env.int('TOKEN_USER_CACHE_SIZE', default=100000)
+# auth.denylist: revoked (logged out) token ids are mirrored into per-process bloom filter,
+# only filter hits are checked in the database
+TOKEN_DENYLIST_CAPACITY = env.int('TOKEN_DENYLIST_CAPACITY', default=100000)
+TOKEN_DENYLIST_ERROR_RATE = env.float('TOKEN_DENYLIST_ERROR_RATE', default=0.001)
+# token revoked by another process is rejected after at most this many seconds
+TOKEN_DENYLIST_REFRESH_INTERVAL = env.float('TOKEN_DENYLIST_REFRESH_INTERVAL', default=5.0)
+# refresh re-reads rows revoked this many seconds before the previous one: late commits, clock skew
+TOKEN_DENYLIST_REFRESH_OVERLAP = env.float('TOKEN_DENYLIST_REFRESH_OVERLAP', default=60.0)
+# without worker thread filter is refreshed inline by the first check after the interval
+TOKEN_DENYLIST_REFRESH_WORKER = env.bool('TOKEN_DENYLIST_REFRESH_WORKER', default=True)
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Blog Project Api',
@@ -120,6 +148,81 @@ SPECTACULAR_SETTINGS = {
     # OTHER SETTINGS
 }
 
+# Feed
+# fan-out-on-write: new posts are pushed into subscribers' inbox table (api.FeedEntry),
+# feed is read from the inbox instead of joining posts with subscriptions
+FEED_FANOUT_ON_WRITE = env.bool('FEED_FANOUT_ON_WRITE', default=False)
+FEED_FANOUT_BATCH_SIZE = env.int('FEED_FANOUT_BATCH_SIZE', default=1000)
+# how many recent posts of the author are copied into inbox on subscription
+FEED_BACKFILL_SIZE = env.int('FEED_BACKFILL_SIZE', default=100)
+# authors with at least this number of subscribers are not fanned out (classify_celebrities command)
+FEED_CELEBRITY_THRESHOLD = env.int('FEED_CELEBRITY_THRESHOLD', default=10000)
+
+# serialized feed pages cache, invalidated by per-user and per-author version counters.
+# Pages and counters live in the default cache: with more than one process it needs a shared
+# CACHE_URL, otherwise a bump in one process leaves pages of the others stale for FEED_CACHE_TIMEOUT
+FEED_CACHE_ENABLED = env.bool('FEED_CACHE_ENABLED', default=False)
+FEED_CACHE_TIMEOUT = env.int('FEED_CACHE_TIMEOUT', default=300)
+
+# subscription id sets: process-local LRU (entries live SUBSCRIPTIONS_LOCAL_CACHE_TTL seconds)
+# in front of the shared cache, feed queries get ids as a literal list.
+# Subscribe/unsubscribe drops the set from the default cache: with more than one process it needs
+# a shared CACHE_URL, otherwise other processes keep the old set for SUBSCRIPTIONS_CACHE_TIMEOUT
+SUBSCRIPTIONS_CACHE_ENABLED = env.bool('SUBSCRIPTIONS_CACHE_ENABLED', default=False)
+SUBSCRIPTIONS_CACHE_TIMEOUT = env.int('SUBSCRIPTIONS_CACHE_TIMEOUT', default=300)
+SUBSCRIPTIONS_LOCAL_CACHE_SIZE = env.int('SUBSCRIPTIONS_LOCAL_CACHE_SIZE', default=10000)
+SUBSCRIPTIONS_LOCAL_CACHE_TTL = env.float('SUBSCRIPTIONS_LOCAL_CACHE_TTL', default=5.0)
+# share of local hits compared with the shared copy to count stale reads
+SUBSCRIPTIONS_STALE_CHECK_RATE = env.float('SUBSCRIPTIONS_STALE_CHECK_RATE', default=0.01)
+
+# max number of usernames in one bulk subscribe request
+SUBSCRIBE_BATCH_MAX_SIZE = env.int('SUBSCRIBE_BATCH_MAX_SIZE', default=100)
+
+# feed and user posts pages are serialized from .values() rows by api.fast_serializers
+FAST_POST_SERIALIZER = env.bool('FAST_POST_SERIALIZER', default=True)
+# ETag on feed and user posts lists, If-None-Match requests get 304 without running the queryset.
+# Feed ETag includes user's version counter from the default cache: with more than one process
+# it needs a shared CACHE_URL, otherwise changes made through another process give stale 304s
+CONDITIONAL_GET = env.bool('CONDITIONAL_GET', default=False)
+# rows fetched from database per chunk by streaming (ndjson) responses
+STREAM_CHUNK_SIZE = env.int('STREAM_CHUNK_SIZE', default=500)
+# feed, user list and user posts served by async views (api.async_views), on by default in blog.asgi
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+# Feed events: server-sent events stream of new posts (api.sse, served under ASGI only)
+FEED_EVENTS_PATH = env.str('FEED_EVENTS_PATH', default='/api/feed/events/')
+# pub/sub between publishers and streams, api.events.LocalEventBackend delivers inside one process
+FEED_EVENTS_BACKEND = env.str('FEED_EVENTS_BACKEND', default='api.events.LocalEventBackend')
+# events buffered per stream, a client behind by more gets `reset` and reloads the feed
+FEED_EVENTS_QUEUE_SIZE = env.int('FEED_EVENTS_QUEUE_SIZE', default=100)
+# open streams per process, more are refused with 503
+FEED_EVENTS_MAX_CONNECTIONS = env.int('FEED_EVENTS_MAX_CONNECTIONS', default=10000)
+# seconds between keep-alive comments, subscriptions are re-read and the token is re-checked then
+FEED_EVENTS_HEARTBEAT = env.float('FEED_EVENTS_HEARTBEAT', default=15.0)
+# posts replayed after reconnect with Last-Event-ID, `reset` is sent when more were missed
+FEED_EVENTS_REPLAY_LIMIT = env.int('FEED_EVENTS_REPLAY_LIMIT', default=100)
+
+# Seen marks
+# max number of post ids in one batch mark as seen request
+SEEN_BATCH_MAX_SIZE = env.int('SEEN_BATCH_MAX_SIZE', default=100)
+# 'rows' - UserPostRelation row per seen post, 'compact' - one SeenSet row per user
+SEEN_STORAGE = env.str('SEEN_STORAGE', default='rows')
+# compact storage moves watermark up when explicit seen ids list grows over this size
+SEEN_COMPACT_THRESHOLD = env.int('SEEN_COMPACT_THRESHOLD', default=500)
+# compaction is skipped when it would list more not seen posts below the watermark
+SEEN_COMPACT_MAX_UNSEEN = env.int('SEEN_COMPACT_MAX_UNSEEN', default=500)
+# after skipped compaction the next one is tried only when this many more seen ids are listed
+SEEN_COMPACT_RETRY = env.int('SEEN_COMPACT_RETRY', default=100)
+# explicit seen ids over this size move to UserPostRelation rows for good
+SEEN_COMPACT_MAX_SEEN = env.int('SEEN_COMPACT_MAX_SEEN', default=2000)
+# write-behind: marks are buffered in process and written in bulk by background worker
+SEEN_WRITE_BEHIND = env.bool('SEEN_WRITE_BEHIND', default=False)
+SEEN_BUFFER_CLASS = 'api.seen_buffer.SeenWriteBuffer'
+SEEN_FLUSH_SIZE = env.int('SEEN_FLUSH_SIZE', default=1000)
+SEEN_FLUSH_INTERVAL = env.float('SEEN_FLUSH_INTERVAL', default=1.0)
+# without worker buffer is flushed inline when it reaches SEEN_FLUSH_SIZE
+SEEN_FLUSH_WORKER = env.bool('SEEN_FLUSH_WORKER', default=True)
+
 ROOT_URLCONF = 'blog.urls'
 
 TEMPLATES = [
@@ -161,6 +264,13 @@ DATABASES = {
                 },
     }
 }
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -172,13 +282,35 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
     },
     {
-        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+        'NAME': 'auth.validators.PreloadedCommonPasswordValidator',
     },
     {
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
 ]
 
+# Password hashing profile: first hasher makes new hashes, the rest only verify existing ones.
+# default - PBKDF2 (Django default), argon2 - argon2id with ARGON2_* parameters,
+# fast - MD5, only for tests and local development
+_VERIFY_ONLY_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASHER_PROFILES = {
+    'default': ['auth.hashers.PBKDF2PasswordHasher', 'auth.hashers.Argon2PasswordHasher', *_VERIFY_ONLY_HASHERS],
+    'argon2': ['auth.hashers.Argon2PasswordHasher', 'auth.hashers.PBKDF2PasswordHasher', *_VERIFY_ONLY_HASHERS],
+    'fast': ['django.contrib.auth.hashers.MD5PasswordHasher', 'auth.hashers.PBKDF2PasswordHasher',
+             'auth.hashers.Argon2PasswordHasher', *_VERIFY_ONLY_HASHERS],
+}
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[env.str('PASSWORD_HASHER_PROFILE', default='default')]
+# OWASP minimum for argon2id: 19 MiB memory, 2 iterations, 1 lane
+ARGON2_TIME_COST = env.int('ARGON2_TIME_COST', default=2)
+ARGON2_MEMORY_COST = env.int('ARGON2_MEMORY_COST', default=19456)
+ARGON2_PARALLELISM = env.int('ARGON2_PARALLELISM', default=1)
+# threads hashing passwords, 0 - hash in request thread (blog/asgi.py enables the pool)
+PASSWORD_HASHING_WORKERS = env.int('PASSWORD_HASHING_WORKERS', default=0)
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
 